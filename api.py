@@ -1,11 +1,49 @@
 # import json
-from fastapi import FastAPI, HTTPException
+import os
+import time
+import logging
+import threading
+import configparser
+from fastapi import FastAPI, HTTPException, Query
 from pydantic import BaseModel
 # import paho.mqtt.client as mqtt
 from renogybt.DeviceEntry import DeviceInstance
+from renogybt.Supervisor import Supervisor
+from renogybt import History
 
 app = FastAPI()
 
+## RENOGY_CONFIG=config.ini uvicorn api:app => also run the configured device(s) in this
+## process, so /devices/{mac}/history can serve their readings from memory ([history])
+## and the local store ([local_store]) for older ranges
+RENOGY_CONFIG = os.getenv('RENOGY_CONFIG', '')
+MAX_POINTS = 20000
+DEFAULT_RANGE = 3600 # (seconds) when `from` is not given
+_runners = [] # DeviceInstance / Supervisor started with RENOGY_CONFIG
+
+@app.on_event("startup")
+def start_devices():
+    if not RENOGY_CONFIG:
+        return
+    config = configparser.ConfigParser(inline_comment_prefixes=('#'))
+    if not config.read(RENOGY_CONFIG):
+        logging.error(f"Config file not found: {RENOGY_CONFIG}")
+        return
+    if any(section.startswith('device:') for section in config.sections()):
+        runner = Supervisor(config)
+    else:
+        runner = DeviceInstance(config)
+    _runners.append(runner)
+    threading.Thread(name="devices", target=runner.run, daemon=True).start()
+
+def find_device(mac):
+    for runner in _runners:
+        instances = runner.instances.values() if isinstance(runner, Supervisor) else [runner]
+        for instance in instances:
+            if instance.config['device']['mac_addr'].upper() == mac.upper():
+                return instance
+    return None
+
 @app.get("/hello-world")
 async def hello_world():
     print("HELLO WORLD")
@@ -26,6 +64,44 @@ async def test_ble_device():
     return response
 
 
+@app.get("/devices/{mac}/history")
+def device_history(mac: str, fields: str = '', since: float = Query(None, alias='from'), until: float = Query(None, alias='to'),
+                   points: int = 1000, method: str = History.METHOD_MINMAX):
+    # fields: comma separated (all numeric fields when empty), from/to: unix time,
+    # points: most points per field, method: minmax or lttb
+    if History.find_history(mac) is None and History.find_store(mac) is None:
+        raise HTTPException(status_code=404, detail=f"No history for device {mac}")
+    if method not in History.METHODS:
+        raise HTTPException(status_code=400, detail=f"method must be one of {', '.join(History.METHODS)}")
+    if not 2 <= points <= MAX_POINTS:
+        raise HTTPException(status_code=400, detail=f"points must be between 2 and {MAX_POINTS}")
+    until = until or time.time()
+    since = since if since is not None else until - DEFAULT_RANGE
+    if since >= until:
+        raise HTTPException(status_code=400, detail="from must be before to")
+    names = [name.strip() for name in fields.split(',') if name.strip()]
+    started = time.perf_counter()
+    series, source = History.query(mac, names, since, until, points, method)
+    return {
+        "mac": mac.upper(),
+        "from": since,
+        "to": until,
+        "method": method,
+        "source": source,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+        "fields": {name: [[t, v] for t, v in samples] for name, samples in series.items()},
+    }
+
+
+@app.get("/devices/{mac}/stats")
+def device_stats(mac: str):
+    # frame counters (frames, duplicates, skip_ratio, last_frame_age) and sink queue counters
+    instance = find_device(mac)
+    if instance is None:
+        raise HTTPException(status_code=404, detail=f"Device {mac} is not running in this process")
+    return dict(instance.stats(), mac=mac.upper())
+
+
 # Define the request model
 class HexData(BaseModel):
     hex_array: str  # Hexadecimal byte array as a string
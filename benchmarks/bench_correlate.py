@@ -0,0 +1,78 @@
+import sys
+import os
+import time
+import tempfile
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+import numpy as np
+from renogybt.ShuntClient import SHUNT_INFO
+from renogybt.FrameRecorder import FILE_HEADER, ENTRY_HEADER, MAGIC, VERSION, padded_length, mac_to_bytes
+from renogybt.FrameCorrelator import load_corpus, load_references, correlate, rank
+
+# FrameCorrelator on a synthetic recording of shunt frames with two planted
+# "undecoded" fields: a temperature (3 bytes at 66, scale 0.001, the commented
+# out temperature_sensor_1) and a consumed Ah counter (4 bytes at 40, scale 0.001).
+# A sparse reference CSV (one row per minute) is correlated against every
+# candidate; both planted fields must rank first (up to leading zero bytes).
+# usage: python3 benchmarks/bench_correlate.py [frames]
+
+MAC = '4C:E1:74:58:CE:5D'
+FRAME_SIZE = 110
+
+def write_recording(path, count, rate = 10.0, seed = 1):
+    # a FrameRecorder file written in one go, frames at `rate` Hz
+    rng = np.random.default_rng(seed)
+    t = np.arange(count) / rate
+    amps = -5 + 3 * np.sin(t / 600) + rng.normal(0, 0.3, count)
+    temperature = 21 + 6 * np.sin(t / 3600) + rng.normal(0, 0.05, count)
+    consumed = np.cumsum(np.clip(-amps, 0, None)) / rate / 3600
+    frames = np.zeros((count, FRAME_SIZE), dtype=np.uint8)
+    frames[:, 1] = 87
+    frames[:, 2:20] = rng.integers(0, 256, (count, 18), dtype=np.uint8) # noise
+    for offset, width, values in ((21, 3, np.round(amps * 1000).astype(np.int64) & 0xFFFFFF),
+                                  (25, 3, np.round((13.2 + amps * 0.01) * 1000).astype(np.int64)),
+                                  (34, 2, np.round(np.clip(80 - consumed, 0, 100) * 10).astype(np.int64)),
+                                  (40, 4, np.round(consumed * 1000).astype(np.int64)),
+                                  (66, 3, np.round(temperature * 1000).astype(np.int64))):
+        for i in range(width):
+            frames[:, offset + i] = (values >> (8 * (width - 1 - i))) & 0xFF
+    entry_size = ENTRY_HEADER.size + padded_length(FRAME_SIZE)
+    entries = np.zeros((count, entry_size), dtype=np.uint8)
+    header = np.zeros(count, dtype=[('ts', '<u8'), ('length', '<u2'), ('mac', 'u1', 6), ('uuid', 'u1', 16)])
+    monotonic_start = 10**12
+    header['ts'] = monotonic_start + np.round(t * 1e9).astype(np.uint64)
+    header['length'] = FRAME_SIZE
+    header['mac'] = np.frombuffer(mac_to_bytes(MAC), dtype=np.uint8)
+    entries[:, :ENTRY_HEADER.size] = header.view(np.uint8).reshape(count, ENTRY_HEADER.size)
+    entries[:, ENTRY_HEADER.size:ENTRY_HEADER.size + FRAME_SIZE] = frames
+    wall_start = 1_760_000_000
+    with open(path, 'wb') as f:
+        f.write(FILE_HEADER.pack(MAGIC, VERSION, wall_start * 10**9, monotonic_start))
+        f.write(entries.tobytes())
+    minutes = np.arange(0, count, int(rate * 60))
+    return wall_start + t[minutes], temperature[minutes], consumed[minutes]
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    assert SHUNT_INFO.size <= FRAME_SIZE
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'frames.bin')
+        reference_times, temperature, consumed = write_recording(path, count)
+        references_path = os.path.join(directory, 'references.csv')
+        with open(references_path, 'w') as f:
+            f.write('time,temperature,consumed_ah\n')
+            for row in zip(reference_times, temperature, consumed):
+                f.write(','.join(f'{value:.6f}' for value in row) + '\n')
+        start = time.perf_counter()
+        times, frames = load_corpus(path, FRAME_SIZE, MAC)
+        references = load_references(references_path, times)
+        loaded = time.perf_counter()
+        candidates = correlate(frames, references)
+        done = time.perf_counter()
+    print(f"{len(frames)} frames, {len(candidates)} candidates: load {loaded - start:.2f}s, correlate {done - loaded:.2f}s "
+          f"({len(frames) / (done - start):.0f} frames/s)")
+    for name, offset, width in (('temperature', 66, 3), ('consumed_ah', 40, 4)):
+        best = rank(candidates, name, 1)[0]
+        # leading bytes that stay zero make a narrower field at the same end equivalent
+        found = offset <= best['offset'] and best['offset'] + best['width'] == offset + width
+        print(f"{name:>12}: offset {best['offset']} width {best['width']} r={best[f'r_{name}']:.4f} "
+              f"scale={best[f'slope_{name}']:.5f} {'(planted field found)' if found else f'(expected offset {offset} width {width})'}")
@@ -0,0 +1,42 @@
+import sys
+import os
+import timeit
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from renogybt.Utils import bytes_to_int
+from renogybt.ShuntClient import SHUNT_INFO
+
+# Per-frame decode cost of the 110-byte RMTShunt300 frame: field by field
+# bytes_to_int() (the previous parse_shunt_info) vs the compiled register map.
+# usage: python3 benchmarks/bench_decode.py [iterations]
+
+def make_frame(amps = -4.21, voltage = 13.31, starter_voltage = 12.72, soc = 87.4):
+    frame = bytearray(110)
+    frame[1] = 87 # notify operation
+    frame[21:24] = round(amps * 1000).to_bytes(3, 'big', signed=True)
+    frame[25:28] = round(voltage * 1000).to_bytes(3, 'big')
+    frame[30:32] = round(starter_voltage * 1000).to_bytes(2, 'big')
+    frame[34:36] = round(soc * 10).to_bytes(2, 'big')
+    return bytes(frame)
+
+SHUNT_FRAME = make_frame()
+
+def parse_field_by_field(bs):
+    data = {}
+    data['charge_battery_voltage'] = bytes_to_int(bs, 25, 3, scale = 0.001)
+    data['starter_battery_voltage'] = bytes_to_int(bs, 30, 2, scale = 0.001)
+    data['discharge_amps'] = bytes_to_int(bs, 21, 3, scale = 0.001, signed=True)
+    data['discharge_watts'] = round((data['charge_battery_voltage'] * data['discharge_amps']), 2)
+    data['state_of_charge'] = bytes_to_int(bs, 34, 2, scale=0.1)
+    return data
+
+def parse_compiled(bs):
+    data = SHUNT_INFO.decode(bs)
+    data['discharge_watts'] = round((data['charge_battery_voltage'] * data['discharge_amps']), 2)
+    return data
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    assert len(SHUNT_FRAME) == 110 and parse_field_by_field(SHUNT_FRAME) == parse_compiled(SHUNT_FRAME)
+    for name, parser in (('bytes_to_int', parse_field_by_field), ('register map', parse_compiled)):
+        best = min(timeit.repeat(lambda: parser(SHUNT_FRAME), number=iterations, repeat=5))
+        print(f"{name:>14}: {best / iterations * 1e9:8.0f} ns/frame  {iterations / best:10.0f} frames/s")
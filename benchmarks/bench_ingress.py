@@ -0,0 +1,72 @@
+import sys
+import os
+import time
+import logging
+import tracemalloc
+import configparser
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from bench_decode import make_frame
+from renogybt.DeviceEntry import DeviceInstance
+from renogybt.Replay import ReplayDevice
+
+# Memory traffic of the notification path, BLE callback to the end of
+# DeviceInstance.on_data_received, for RMTShunt300 frames at 10 Hz with the rate
+# limiter on (one reading per 10 s reaches the sinks, sinks disabled here) and the
+# energy / runtime estimators enabled. Every frame differs, so all are decoded.
+# Measured with tracemalloc per frame:
+#   transient: peak bytes allocated while handling the frame (freed right after)
+#   retained:  bytes still allocated after the frame (should stay ~0)
+# usage: python3 benchmarks/bench_ingress.py [frames]
+
+def make_config():
+    config = configparser.ConfigParser(inline_comment_prefixes=('#',))
+    config.read(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'config.ini'))
+    config['device']['type'] = 'RNG_SHNT'
+    for section in ('remote_logging', 'mqtt', 'pvoutput', 'local_store', 'history', 'recorder'):
+        config[section]['enabled'] = 'false'
+    config['data']['enable_rate_limiter'] = 'true'
+    config['data']['rate_interval'] = '10'
+    config['data']['enable_deadband'] = 'false'
+    config['data']['fields'] = ''
+    config['energy']['enabled'] = 'true'
+    config['energy']['state_path'] = ''
+    config['runtime']['enabled'] = 'true'
+    return config
+
+def create_pipeline(config, clock):
+    instance = DeviceInstance(config, clock=clock)
+    client = instance.create_client()
+    client.device = ReplayDevice(config['device']['mac_addr'], config['device']['alias'])
+    instance.device_inst = client
+    return instance, client
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    logging.disable(logging.ERROR)
+    now = [1_760_000_000.0]
+    instance, client = create_pipeline(make_config(), lambda: now[0])
+    frames = [make_frame(amps=-4 - i % 500 / 100, voltage=13.2 + i % 7 / 100) for i in range(count)] # gatt hands over bytes
+
+    def handle(frame):
+        client.on_data_received(frame) # what BLE.Device.characteristic_value_updated passes on
+        now[0] += 0.1
+
+    for frame in frames[:1000]: # warm up caches, first readings and dict sizes
+        handle(frame)
+    started = time.perf_counter()
+    for frame in frames:
+        handle(frame)
+    seconds = time.perf_counter() - started
+
+    tracemalloc.start()
+    transient = retained = 0
+    for frame in frames:
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        handle(frame)
+        current, peak = tracemalloc.get_traced_memory()
+        transient += peak - before
+        retained += current - before
+    tracemalloc.stop()
+    print(f"{count} frames: {seconds / count * 1e6:.1f} us/frame, transient {transient / count:.0f} B/frame, "
+          f"retained {retained / count:.1f} B/frame")
@@ -0,0 +1,47 @@
+import sys
+import os
+import time
+import sqlite3
+import tempfile
+import configparser
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from renogybt.LocalStore import LocalStore
+
+# Rows/s LocalStore sustains for shunt readings: a commit (and fsync) per row in
+# the default rollback journal mode versus WAL with group commits of batch_size
+# rows. The shunt notifies a few times per second, a Pi SD card manages tens
+# of fsyncs per second at best.
+# usage: python3 benchmarks/bench_local_store.py [rows] [batch_size]
+
+SHUNT_DATA = {'charge_battery_voltage': 13.31, 'starter_battery_voltage': 12.72, 'discharge_amps': -4.21, 'state_of_charge': 87.4,
+              'discharge_watts': -56.04, '__device': 'RTMShunt30032000454', '__client': 'ShuntClient'}
+
+def make_config(path, batch_size):
+    config = configparser.ConfigParser()
+    config['device'] = {'type': 'RNG_SHNT'}
+    config['local_store'] = {'enabled': 'true', 'path': path, 'batch_size': str(batch_size), 'commit_interval': '0'}
+    return config
+
+def bench_row_commit(path, rows, batch_size):
+    db = sqlite3.connect(path, isolation_level=None)
+    db.execute('PRAGMA synchronous=FULL')
+    db.execute('CREATE TABLE readings (ts REAL, charge_battery_voltage REAL, starter_battery_voltage REAL, discharge_amps REAL, state_of_charge REAL, discharge_watts REAL)')
+    for _ in range(rows):
+        db.execute('INSERT INTO readings VALUES (?, ?, ?, ?, ?, ?)', (time.time(), 13.31, 12.72, -4.21, 87.4, -56.04))
+    db.close()
+
+def bench_local_store(path, rows, batch_size):
+    store = LocalStore(make_config(path, batch_size))
+    for _ in range(rows):
+        store.add(dict(SHUNT_DATA))
+    store.close()
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    for name, bench in (('commit per row', bench_row_commit), (f'WAL batch {batch_size}', bench_local_store)):
+        with tempfile.TemporaryDirectory() as directory:
+            start = time.perf_counter()
+            bench(os.path.join(directory, 'readings.db'), rows, batch_size)
+            elapsed = time.perf_counter() - start
+        print(f"{name:>16}: {rows / elapsed:10.1f} rows/s")
@@ -0,0 +1,57 @@
+import sys
+import os
+import time
+import configparser
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+import paho.mqtt.publish as publish
+from renogybt import DataLogger
+from renogybt.MQTTPublisher import MQTTPublisher
+from stand_ins import MQTTStandIn
+
+# Compares the old publish.single() per field path with the shared, persistent
+# MQTTPublisher used by DataLogger.log_mqtt, against a local broker stand-in.
+# usage: python3 benchmarks/bench_mqtt.py [frames]
+
+SHUNT_FRAME = {'charge_battery_voltage': 13.31, 'starter_battery_voltage': 12.72, 'discharge_amps': -4.21, 'discharge_watts': -56.04, 'state_of_charge': 87.4}
+
+def make_config(port):
+    config = configparser.ConfigParser()
+    config['mqtt'] = {'enabled': 'true', 'client_id': 'bench', 'server': '127.0.0.1', 'port': str(port), 'topic': 'bench/state', 'user': '', 'password': ''}
+    return config
+
+def wait_for(broker, expected, timeout = 30):
+    deadline = time.time() + timeout
+    while broker.messages < expected and time.time() < deadline:
+        time.sleep(0.001)
+
+def bench_publish_single(config, broker, frames):
+    start = time.perf_counter()
+    for _ in range(frames):
+        for key, value in SHUNT_FRAME.items():
+            publish.single(topic=f"{config['mqtt']['topic']}/{key}/state", payload=str(value), hostname='127.0.0.1', port=broker.port, retain=True)
+    wait_for(broker, frames * len(SHUNT_FRAME))
+    return time.perf_counter() - start
+
+def bench_persistent(config, broker, frames):
+    data_logger = DataLogger(config)
+    publisher = MQTTPublisher.get_instance(config)
+    while not publisher.is_connected():
+        time.sleep(0.01)
+    start = time.perf_counter()
+    for _ in range(frames):
+        data_logger.log_mqtt(SHUNT_FRAME)
+    wait_for(broker, frames * len(SHUNT_FRAME))
+    elapsed = time.perf_counter() - start
+    MQTTPublisher.reset()
+    return elapsed
+
+def report(name, elapsed, frames, broker):
+    print(f"{name:>16}: {frames / elapsed:10.1f} frames/s  {frames * len(SHUNT_FRAME) / elapsed:10.1f} msgs/s  connections={broker.connections}")
+
+if __name__ == "__main__":
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    for name, bench in (('publish.single', bench_publish_single), ('MQTTPublisher', bench_persistent)):
+        broker = MQTTStandIn().start()
+        elapsed = bench(make_config(broker.port), broker, frames)
+        report(name, elapsed, frames, broker)
+        broker.stop()
@@ -0,0 +1,55 @@
+import sys
+import os
+import time
+import logging
+import configparser
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from renogybt import RoverClient, BatteryClient, InverterClient, RoverHistoryClient
+
+# One full read cycle (all sections, connect excluded) of every Modbus client
+# against the simulated backend ([device] backend = simulator), per read_gap /
+# max_read_words setting: requests sent and seconds from the first request to
+# on_read_operation_complete. The simulator answers after `latency` seconds.
+# usage: python3 benchmarks/bench_poll.py [latency]
+
+CLIENTS = {'RNG_CTRL': RoverClient, 'RNG_BATT': BatteryClient, 'RNG_INVT': InverterClient, 'RNG_CTRL_HIST': RoverHistoryClient}
+PLANS = [(0, 34), (10, 34), (128, 128)] # (read_gap, max_read_words)
+
+def make_config(device_type, mac_address, read_gap, max_read_words, latency):
+    config = configparser.ConfigParser(inline_comment_prefixes=('#',))
+    config.read(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'config.ini'))
+    config['device']['type'] = device_type
+    config['device']['backend'] = 'simulator'
+    config['device']['mac_addr'] = mac_address
+    config['data']['enable_polling'] = 'false'
+    config['data']['read_gap'] = str(read_gap)
+    config['data']['max_read_words'] = str(max_read_words)
+    config['simulator'].update({'latency': str(latency), 'jitter': '0', 'loss': '0', 'discovery_time': '0', 'seed': '1'})
+    return config
+
+def read_cycle(config, client_class):
+    # returns (requests, seconds) of one read of all sections
+    started = []
+    finished = []
+    def on_data(client, data):
+        finished.append(time.monotonic())
+        client.disconnect()
+    client = client_class(config, on_data, lambda client, error: None)
+    read_section = client.read_section
+    def timed_read_section():
+        if not started: started.append(time.monotonic())
+        read_section()
+    client.read_section = timed_read_section
+    client.connect()
+    return len(client.reads), finished[0] - started[0]
+
+if __name__ == "__main__":
+    latency = float(sys.argv[1]) if len(sys.argv) > 1 else 0.05
+    logging.disable(logging.WARNING)
+    print(f"{'device':<14}" + ''.join(f"{f'gap {gap}, max {words}':>22}" for gap, words in PLANS))
+    for index, (device_type, client_class) in enumerate(CLIENTS.items()):
+        cells = []
+        for plan, (gap, words) in enumerate(PLANS):
+            requests, seconds = read_cycle(make_config(device_type, f'80:6A:10:00:{index:02d}:{plan:02d}', gap, words, latency), client_class)
+            cells.append(f"{requests} reads {seconds:6.2f}s")
+        print(f"{device_type:<14}" + ''.join(f"{cell:>22}" for cell in cells))
@@ -0,0 +1,64 @@
+import sys
+import os
+import time
+import configparser
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+import requests
+from renogybt import DataLogger
+from renogybt.RemoteBatcher import RemoteBatcher
+from stand_ins import HTTPStandIn
+
+# Compares the old requests.post() per frame remote logging with the keep-alive
+# DataLogger.log_remote and the batching RemoteBatcher (JSON array / NDJSON,
+# plain / gzip), against a local HTTP stand-in. Reports samples/s, requests and
+# bytes on the wire (request line + headers + body).
+# usage: python3 benchmarks/bench_remote.py [samples] [batch_size]
+
+SHUNT_FRAME = {'charge_battery_voltage': 13.31, 'starter_battery_voltage': 12.72, 'discharge_amps': -4.21, 'discharge_watts': -56.04, 'state_of_charge': 87.4,
+               '__device': 'RTMShunt30032000454', '__client': 'ShuntClient'}
+
+def make_config(url, batch_size = 1, batch_format = 'json', compress = False):
+    config = configparser.ConfigParser()
+    config['remote_logging'] = {'enabled': 'true', 'url': url, 'auth_header': 'bench', 'batch_size': str(batch_size),
+                                'batch_age': '0', 'batch_format': batch_format, 'compress': str(compress).lower()}
+    config['mqtt'] = {'topic': 'bench/state'}
+    return config
+
+def bench_requests_post(server, samples, batch_size):
+    headers = {"Authorization": "Bearer bench"}
+    for _ in range(samples):
+        requests.post(server.url, json=SHUNT_FRAME, timeout=15, headers=headers)
+
+def bench_session(server, samples, batch_size):
+    data_logger = DataLogger(make_config(server.url))
+    for _ in range(samples):
+        data_logger.log_remote(SHUNT_FRAME)
+
+def batched(batch_format, compress):
+    def bench(server, samples, batch_size):
+        batcher = RemoteBatcher(make_config(server.url, batch_size, batch_format, compress))
+        for _ in range(samples):
+            batcher.add(SHUNT_FRAME)
+        batcher.close()
+    return bench
+
+BENCHES = (
+    ('requests.post', bench_requests_post),
+    ('session', bench_session),
+    ('batch json', batched('json', False)),
+    ('batch json+gzip', batched('json', True)),
+    ('batch ndjson', batched('ndjson', False)),
+    ('batch ndjson+gzip', batched('ndjson', True)),
+)
+
+if __name__ == "__main__":
+    samples = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    for name, bench in BENCHES:
+        server = HTTPStandIn().start()
+        start = time.perf_counter()
+        bench(server, samples, batch_size)
+        elapsed = time.perf_counter() - start
+        assert server.samples == samples, f"{name}: server received {server.samples}/{samples} samples"
+        print(f"{name:>18}: {samples / elapsed:10.1f} samples/s  requests={server.requests:5d}  wire={server.wire_bytes:8d} B  ({server.wire_bytes / samples:6.1f} B/sample)")
+        server.stop()
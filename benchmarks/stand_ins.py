@@ -0,0 +1,133 @@
+import gzip
+import json
+import socket
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Minimal local stand-ins for the services DataLogger talks to, so the sink
+# paths can be benchmarked without a real broker or HTTP endpoint.
+
+class _MQTTHandler(socketserver.BaseRequestHandler):
+    # Speaks just enough MQTT 3.1.1 for paho: CONNECT, PUBLISH (QoS 0/1), PINGREQ, SUBSCRIBE, DISCONNECT
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        sock = self.request
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        stream = sock.makefile('rb')
+        while True:
+            header = stream.read(1)
+            if not header:
+                return
+            length, multiplier = 0, 1
+            while True:
+                byte = stream.read(1)[0]
+                length += (byte & 0x7F) * multiplier
+                multiplier *= 128
+                if byte & 0x80 == 0:
+                    break
+            body = stream.read(length)
+            packet_type = header[0] >> 4
+            if packet_type == 1: # CONNECT
+                sock.sendall(b'\x20\x02\x00\x00')
+            elif packet_type == 3: # PUBLISH
+                with server.lock:
+                    server.messages += 1
+                    server.payload_bytes += length
+                if (header[0] >> 1) & 0x03 == 1:
+                    topic_length = int.from_bytes(body[0:2], 'big')
+                    sock.sendall(b'\x40\x02' + body[2 + topic_length:4 + topic_length])
+            elif packet_type == 8: # SUBSCRIBE
+                sock.sendall(b'\x90\x03' + body[0:2] + b'\x00')
+            elif packet_type == 12: # PINGREQ
+                sock.sendall(b'\xd0\x00')
+            elif packet_type == 14: # DISCONNECT
+                return
+
+
+class MQTTStandIn(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host = '127.0.0.1', port = 0):
+        super().__init__((host, port), _MQTTHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = 0
+        self.payload_bytes = 0
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="mqtt_stand_in", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _HTTPHandler(BaseHTTPRequestHandler):
+    # Accepts any POST with 200 and an empty body, like the remote_logging endpoint.
+    # Counts samples in a JSON object, JSON array or NDJSON body, gzip or not.
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            server.payload_bytes += len(body)
+            server.wire_bytes += len(self.requestline) + 2 + len(str(self.headers)) + len(body)
+            failed = server.fail_next > 0
+            if failed:
+                server.fail_next -= 1
+            else:
+                server.samples += self.count_samples(body)
+        self.send_response(503 if failed else 200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def count_samples(self, body):
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        if self.headers.get('Content-Type') == 'application/x-ndjson':
+            return len(body.splitlines())
+        document = json.loads(body)
+        return len(document) if isinstance(document, list) else 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+class HTTPStandIn(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host = '127.0.0.1', port = 0):
+        super().__init__((host, port), _HTTPHandler)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.payload_bytes = 0
+        self.wire_bytes = 0 # request line + headers + body
+        self.samples = 0
+        self.fail_next = 0 # reply 503 to the next N requests
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}/post"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="http_stand_in", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
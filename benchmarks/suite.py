@@ -0,0 +1,165 @@
+import sys
+import os
+import json
+import time
+import timeit
+import argparse
+import platform
+import statistics
+import tracemalloc
+import configparser
+from datetime import date
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from renogybt import Utils, DataLogger, ShuntClient
+from renogybt.BaseClient import BaseClient
+from renogybt.MQTTPublisher import MQTTPublisher
+from stand_ins import MQTTStandIn, HTTPStandIn
+from bench_decode import make_frame
+
+# Benchmark suite for the per-frame hot paths, with stored baselines.
+# Reports ns/op, peak bytes allocated per op (tracemalloc) and frames/s for the
+# frame level cases. Sink cases run against the local MQTT / HTTP stand-ins.
+# Exits 1 when a case got slower (or allocates more) than the baseline recorded
+# for this machine by more than the threshold plus a small absolute slack, so a
+# ~150 ns case does not fail on timing noise alone. Baselines are kept per
+# machine/python (e.g. armv6l/py3.11 on a Pi Zero), record one with --save.
+# usage:
+#   python3 benchmarks/suite.py                   # compare with benchmarks/baseline.json
+#   python3 benchmarks/suite.py --save            # record the baseline for this machine
+#   python3 benchmarks/suite.py --only crc16      # cases whose name contains "crc16"
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'baseline.json')
+THRESHOLD = 0.25 # 25% slower than the baseline fails
+IO_THRESHOLD = 1.0 # loopback socket timings are noisy, sink cases only fail when 2x slower
+ALLOC_SLACK = 64 # bytes, allocator noise ignored when comparing allocations
+NS_SLACK = 250 # ns, timer and interpreter noise ignored when comparing sub-microsecond cases
+
+SHUNT_FRAME = make_frame()
+SHUNT_DATA = {'charge_battery_voltage': 13.31, 'starter_battery_voltage': 12.72, 'discharge_amps': -4.21, 'state_of_charge': 87.4, 'discharge_watts': -56.04}
+FIELDS = 'charge_battery_voltage, discharge_amps, state_of_charge'
+READ_REQUEST = bytes([255, 3, 1, 0, 0, 34])
+CHARGING_RESPONSE = bytes([255, 3, 68]) + bytes(range(68)) # CHARGING_INFO sized frame without the crc
+
+def make_config(mqtt_port, remote_url, payload_mode = 'fields'):
+    config = configparser.ConfigParser()
+    config['device'] = {'adapter': 'hci0', 'mac_addr': 'AA:BB:CC:DD:EE:FF', 'alias': 'bench', 'type': 'RNG_SHNT', 'device_id': '255'}
+    config['data'] = {'temperature_unit': 'F', 'fields': '', 'skip_duplicates': 'false'} # the same frame every call, parsed each time
+    config['mqtt'] = {'enabled': 'true', 'client_id': 'bench', 'server': '127.0.0.1', 'port': str(mqtt_port), 'topic': 'bench/state',
+                      'payload_mode': payload_mode, 'user': '', 'password': ''}
+    config['remote_logging'] = {'enabled': 'true', 'url': remote_url, 'auth_header': 'bench'}
+    return config
+
+def build_cases(config, document_config):
+    # name => (callable, frames per call, io); frames is 0 below frame level
+    shunt = ShuntClient(config)
+    skipping_shunt = ShuntClient(config)
+    skipping_shunt.skip_duplicates = True # every call after the first takes the duplicate skip path
+    client = BaseClient(config)
+    data_logger = DataLogger(config)
+    document_logger = DataLogger(document_config)
+    return {
+        'bytes_to_int': (lambda: Utils.bytes_to_int(SHUNT_FRAME, 25, 3, scale=0.001), 0, False),
+        'bytes_to_int_signed': (lambda: Utils.bytes_to_int(SHUNT_FRAME, 21, 3, signed=True, scale=0.001), 0, False),
+        'int_to_bytes': (lambda: Utils.int_to_bytes(57348, 1), 0, False),
+        'crc16_modbus_request': (lambda: Utils.crc16_modbus(READ_REQUEST), 0, False),
+        'crc16_modbus_response': (lambda: Utils.crc16_modbus(CHARGING_RESPONSE), 0, False),
+        'filter_fields': (lambda: Utils.filter_fields(SHUNT_DATA, FIELDS), 0, False),
+        'filter_fields_all': (lambda: Utils.filter_fields(SHUNT_DATA, ''), 0, False),
+        'create_generic_read_request': (lambda: client.create_generic_read_request(255, 3, 256, 34), 0, False),
+        'parse_shunt_info': (lambda: shunt.parse_shunt_info(SHUNT_FRAME), 1, False),
+        'shunt_on_data_received': (lambda: shunt.on_data_received(SHUNT_FRAME), 1, False),
+        'shunt_on_data_received_duplicate': (lambda: skipping_shunt.on_data_received(SHUNT_FRAME), 1, False),
+        'log_mqtt_fields': (lambda: data_logger.log_mqtt(SHUNT_DATA), 1, True),
+        'log_mqtt_document': (lambda: document_logger.log_mqtt(SHUNT_DATA), 1, True),
+        'log_remote': (lambda: data_logger.log_remote(SHUNT_DATA), 1, True),
+    }
+
+def measure(func, repeat):
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    ns_per_op = min(timer.repeat(repeat=repeat, number=number)) / number * 1e9
+    peaks = []
+    tracemalloc.start()
+    for _ in range(20):
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        func()
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+    return {'ns_per_op': round(ns_per_op, 1), 'alloc_bytes': int(statistics.median(peaks))}
+
+def baseline_key():
+    return f"{platform.machine()}/py{sys.version_info[0]}.{sys.version_info[1]}"
+
+def load_baselines(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def regressions(name, result, baseline, threshold, ns_slack = NS_SLACK):
+    failed = []
+    if result['ns_per_op'] > baseline['ns_per_op'] * (1 + threshold) + ns_slack:
+        failed.append(f"{name}: {result['ns_per_op']:.0f} ns/op vs baseline {baseline['ns_per_op']:.0f}")
+    if result['alloc_bytes'] > baseline['alloc_bytes'] * (1 + threshold) + ALLOC_SLACK:
+        failed.append(f"{name}: {result['alloc_bytes']} B/op allocated vs baseline {baseline['alloc_bytes']}")
+    return failed
+
+def main():
+    parser = argparse.ArgumentParser(description="renogy-bt hot path benchmarks")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="baseline file (default: benchmarks/baseline.json)")
+    parser.add_argument('--save', action='store_true', help="record the results as the baseline for this machine")
+    parser.add_argument('--threshold', type=float, default=THRESHOLD, help="allowed slowdown, 0.25 = 25%% (default)")
+    parser.add_argument('--io-threshold', type=float, default=IO_THRESHOLD, help="allowed slowdown of the sink cases (default 1.0)")
+    parser.add_argument('--ns-slack', type=float, default=NS_SLACK, help="slowdown in ns/op always allowed on top of the threshold (default 250)")
+    parser.add_argument('--repeat', type=int, default=7, help="timing repeats, best is kept (default 7)")
+    parser.add_argument('--only', default='', help="run only cases whose name contains this text")
+    args = parser.parse_args()
+
+    broker = MQTTStandIn().start()
+    http = HTTPStandIn().start()
+    config = make_config(broker.port, http.url)
+    cases = build_cases(config, make_config(broker.port, http.url, payload_mode='document'))
+    publisher = MQTTPublisher.get_instance(config)
+    deadline = time.time() + 10
+    while not publisher.is_connected() and time.time() < deadline:
+        time.sleep(0.01)
+
+    key = baseline_key()
+    baselines = load_baselines(args.baseline)
+    baseline = baselines.get(key, {}).get('cases', {})
+    results = {}
+    failed = []
+    print(f"{'case':<34}{'ns/op':>12}{'B/op':>8}{'frames/s':>12}{'baseline':>12}{'change':>9}")
+    try:
+        for name, (func, frames, io) in cases.items():
+            if args.only not in name:
+                continue
+            result = results[name] = measure(func, args.repeat)
+            frames_per_second = f"{frames * 1e9 / result['ns_per_op']:.0f}" if frames else '-'
+            base = baseline.get(name)
+            change = f"{(result['ns_per_op'] / base['ns_per_op'] - 1) * 100:+.1f}%" if base else '-'
+            print(f"{name:<34}{result['ns_per_op']:>12.1f}{result['alloc_bytes']:>8}{frames_per_second:>12}{base['ns_per_op'] if base else '-':>12}{change:>9}")
+            if base and not args.save:
+                failed += regressions(name, result, base, args.io_threshold if io else args.threshold, args.ns_slack)
+    finally:
+        MQTTPublisher.reset()
+        broker.stop()
+        http.stop()
+
+    if args.save:
+        saved = baselines.setdefault(key, {'cases': {}})
+        saved['recorded'] = date.today().isoformat()
+        saved['cases'].update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"baseline saved for {key} => {args.baseline}")
+    elif not baseline:
+        print(f"no baseline for {key} in {args.baseline}, record one with --save")
+    if failed:
+        print("\nREGRESSIONS:\n  " + "\n  ".join(failed))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import sys
+import csv
+import time
+import logging
+import argparse
+from renogybt.ShuntClient import SHUNT_INFO
+from renogybt.FrameCorrelator import load_corpus, load_references, correlate, rank, value_range
+
+# Ranks candidate locations of undecoded fields in recorded frames ([recorder]
+# enabled = true) against reference measurements, see renogybt/FrameCorrelator.py
+#   python3 correlate.py frames.bin --references temps.csv          # temps.csv: time,temperature_sensor_1
+#   python3 correlate.py frames.bin --mac 4C:E1:74:58:CE:5D         # counter-like fields, no references
+#   python3 correlate.py frames.bin --references app.csv --csv all.csv
+# Fields the shunt layout already decodes are marked with their name.
+
+logging.basicConfig(level=logging.INFO)
+
+def known_field(candidate):
+    for field in SHUNT_INFO.fields:
+        if field.offset < candidate['offset'] + candidate['width'] and candidate['offset'] < field.offset + field.width:
+            return field.name
+    return ''
+
+def print_ranking(title, frames, candidates, reference = None):
+    print(f"\n{title}")
+    print(f"{'offset':>6} {'width':>5} {'signed':>6} {'r':>7} {'slope':>11} {'monotonic':>9} {'entropy':>7} {'changes':>7} {'min':>11} {'max':>11}  known")
+    for c in candidates:
+        r = f"{c[f'r_{reference}']:7.4f}" if reference else f"{'':>7}"
+        slope = f"{c[f'slope_{reference}']:11.5g}" if reference else f"{'':>11}"
+        low, high = value_range(frames, c)
+        print(f"{c['offset']:>6} {c['width']:>5} {'yes' if c['signed'] else 'no':>6} {r} {slope} {c['monotonic']:9.3f} "
+              f"{c['entropy']:7.2f} {c['changes']:7.3f} {low:>11} {high:>11}  {known_field(c)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Rank candidate field locations in recorded Renogy BLE frames")
+    parser.add_argument('frames', help="recording path ([recorder] path), rotated files are included")
+    parser.add_argument('--references', default=None, help="CSV with a 'time' column (unix seconds) and one column per measured quantity")
+    parser.add_argument('--mac', default=None, help="only use frames from this device")
+    parser.add_argument('--length', type=int, default=110, help="frame length in bytes (default: 110, RNG_SHNT)")
+    parser.add_argument('--widths', default='1,2,3,4', help="field widths to try (default: 1,2,3,4)")
+    parser.add_argument('--top', type=int, default=10, help="candidates shown per ranking (default: 10)")
+    parser.add_argument('--csv', default=None, help="write the scores of every candidate to this file")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    times, frames = load_corpus(args.frames, args.length, args.mac)
+    if not len(frames):
+        logging.error(f"No {args.length} byte frames in {args.frames}")
+        sys.exit(1)
+    references = load_references(args.references, times) if args.references else {}
+    loaded = time.perf_counter()
+    candidates = correlate(frames, references, widths=[int(width) for width in args.widths.split(',')])
+    done = time.perf_counter()
+    print(f"{len(frames)} frames, {len(candidates)} candidates: loaded in {loaded - start:.2f}s, scored in {done - loaded:.2f}s")
+
+    for name, values in references.items():
+        used = int((values == values).sum())
+        print_ranking(f"{name} ({used} frames with a reference value)", frames, rank(candidates, name, args.top), name)
+    print_ranking("counter-like fields (by |monotonic|)", frames, rank(candidates, top=args.top))
+
+    if args.csv:
+        with open(args.csv, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(candidates[0]))
+            writer.writeheader()
+            writer.writerows(candidates)
+        print(f"\nwrote {len(candidates)} candidates to {args.csv}")
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,12 @@
 
+import json
 import logging
 import configparser
 import os
 import sys
 import time
 from renogybt import ShuntClient, InverterClient, RoverClient, RoverHistoryClient, BatteryClient, DataLogger, Utils
+from renogybt.DataLogger import mqtt_payload_mode, PAYLOAD_MODE_DOCUMENT
 from mqtt_manager import MQTTManager
 
 # Logging setup
@@ -23,6 +25,8 @@ MQTT_PORT = config.getint('mqtt', 'port', fallback=1883)
 MQTT_USER = config['mqtt'].get('user')
 MQTT_PASS = config['mqtt'].get('password')
 MQTT_TOPIC_PREFIX = config['mqtt'].get('topic', fallback="solar/state")
+MQTT_DOCUMENT = mqtt_payload_mode(config) == PAYLOAD_MODE_DOCUMENT
+mqtt_field_topics = {} # field => state topic, built once per field
 
 mqttc = MQTTManager(
     broker=MQTT_BROKER,
@@ -51,14 +55,18 @@ def on_data_received(client, data):
 
     # Publish to MQTT
     if config['mqtt'].getboolean('enabled'):
-        for key, value in filtered_data.items():
-            sensor_id = f"{device_name}_{key}"
-
-            if sensor_id not in mqttc.published_devices:
-                mqttc.create_mqtt_device(device_name=device_name, field_name=key)
-
-            topic = f"{MQTT_TOPIC_PREFIX}/{key}/state"
-            mqttc.publish_message(topic=topic, payload=json.dumps({"value": value}), retain=True)
+        for key in filtered_data:
+            if f"{device_name}_{key}" not in mqttc.published_devices:
+                mqttc.create_mqtt_device(device_name=device_name, field_name=key, document_topic=MQTT_TOPIC_PREFIX if MQTT_DOCUMENT else None)
+
+        if MQTT_DOCUMENT:
+            mqttc.publish_message(topic=MQTT_TOPIC_PREFIX, payload=data_logger.encode_document(filtered_data), retain=True)
+        else:
+            for key, value in filtered_data.items():
+                topic = mqtt_field_topics.get(key)
+                if topic is None:
+                    topic = mqtt_field_topics[key] = f"{MQTT_TOPIC_PREFIX}/{key}/state"
+                mqttc.publish_message(topic=topic, payload=json.dumps({"value": value}), retain=True)
 
     # Optional: log to remote or pvoutput
     if config['remote_logging'].getboolean('enabled'):
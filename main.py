@@ -7,6 +7,7 @@ import configparser
 from dotenv import load_dotenv
 from mqtt_manager import MQTTManager
 from renogybt import DataLogger
+from renogybt.MQTTPublisher import MQTTPublisher
 from renogybt.DeviceEntry import DeviceInstance
 
 # logging.basicConfig(
@@ -46,7 +47,9 @@ def check_config_source():
             'mac_addr': os.getenv('DEVICE_MAC_ADDRESS', ''),
             'alias': os.getenv('DEVICE_ALIAS', ''),
             'type': os.getenv('DEVICE_TYPE', 'RNG_CTRL'),
-            'device_id': os.getenv('DEVICE_ID', '255')
+            'device_id': os.getenv('DEVICE_ID', '255'),
+            'backend': os.getenv('DEVICE_BACKEND', 'gatt'),
+            'fast_connect': os.getenv('DEVICE_FAST_CONNECT', 'true')
         }
         ## Data
         config['data'] = {
@@ -56,12 +59,30 @@ def check_config_source():
             'fields': os.getenv('DATA_FIELDS', ''),
             'enable_rate_limiter': os.getenv('DATA_RATE_LIMIT_ENABLED', 'false'),
             'rate_interval': os.getenv('DATA_RATE_INTERVAL', '10'),
+            'rate_mode': os.getenv('DATA_RATE_MODE', 'drop'),
+            'aggregate_fields': os.getenv('DATA_AGGREGATE_FIELDS', 'discharge_amps, discharge_watts'),
+            'enable_deadband': os.getenv('DATA_DEADBAND_ENABLED', 'false'),
+            'deadband_abs': os.getenv('DATA_DEADBAND_ABS', ''),
+            'deadband_rel': os.getenv('DATA_DEADBAND_REL', ''),
+            'deadband_max_silence': os.getenv('DATA_DEADBAND_MAX_SILENCE', '300'),
+            'skip_duplicates': os.getenv('DATA_SKIP_DUPLICATES', 'true'),
+            'duplicate_refresh': os.getenv('DATA_DUPLICATE_REFRESH', '60'),
+            'read_gap': os.getenv('DATA_READ_GAP', '0'),
+            'max_read_words': os.getenv('DATA_MAX_READ_WORDS', '34'),
+            'section_delay': os.getenv('DATA_SECTION_DELAY', '0'),
+            'read_retries': os.getenv('DATA_READ_RETRIES', '2'),
         }
         ## Remote logging
         config['remote_logging'] = {
             'enabled': os.getenv('REMOTE_LOG_ENABLED', 'false'),
             'url': os.getenv('REMOTE_URL', ''),
-            'auth_header': os.getenv('REMOTE_AUTH_HEADER', '')
+            'auth_header': os.getenv('REMOTE_AUTH_HEADER', ''),
+            'batch_size': os.getenv('REMOTE_BATCH_SIZE', '1'),
+            'batch_age': os.getenv('REMOTE_BATCH_AGE', '10'),
+            'batch_format': os.getenv('REMOTE_BATCH_FORMAT', 'json'),
+            'compress': os.getenv('REMOTE_COMPRESS', 'false'),
+            'retries': os.getenv('REMOTE_RETRIES', '3'),
+            'backoff': os.getenv('REMOTE_BACKOFF', '0.5')
         }
         ## MQTT
         config['mqtt'] = {
@@ -70,9 +91,71 @@ def check_config_source():
             'server': os.getenv('MQTT_SERVER', ''),
             'port': os.getenv('MQTT_PORT', '1883'),
             'topic': os.getenv('MQTT_PUBLISH_TOPIC', ''),
+            'payload_mode': os.getenv('MQTT_PAYLOAD_MODE', 'fields'),
             'user': os.getenv('MQTT_USER', ''),
             'password': os.getenv('MQTT_PASSWORD', '')
         }
+        ## Sink queues
+        config['sinks'] = {
+            'queue_size': os.getenv('SINK_QUEUE_SIZE', '100'),
+            'overflow': os.getenv('SINK_OVERFLOW', 'drop_oldest'),
+            'mqtt_overflow': os.getenv('SINK_MQTT_OVERFLOW', 'coalesce_latest')
+        }
+        ## Local time-series store
+        config['local_store'] = {
+            'enabled': os.getenv('LOCAL_STORE_ENABLED', 'false'),
+            'path': os.getenv('LOCAL_STORE_PATH', 'readings.db'),
+            'partition': os.getenv('LOCAL_STORE_PARTITION', 'day'),
+            'retention_days': os.getenv('LOCAL_STORE_RETENTION_DAYS', '30'),
+            'batch_size': os.getenv('LOCAL_STORE_BATCH_SIZE', '100'),
+            'commit_interval': os.getenv('LOCAL_STORE_COMMIT_INTERVAL', '5')
+        }
+        ## Shunt energy integration
+        config['energy'] = {
+            'enabled': os.getenv('ENERGY_ENABLED', 'false'),
+            'state_path': os.getenv('ENERGY_STATE_PATH', 'energy_state.json'),
+            'max_gap': os.getenv('ENERGY_MAX_GAP', '30'),
+            'save_interval': os.getenv('ENERGY_SAVE_INTERVAL', '60')
+        }
+        ## Shunt time-to-empty / time-to-full
+        config['runtime'] = {
+            'enabled': os.getenv('RUNTIME_ENABLED', 'false'),
+            'capacity_ah': os.getenv('RUNTIME_CAPACITY_AH', '100'),
+            'time_constant': os.getenv('RUNTIME_TIME_CONSTANT', '120'),
+            'min_current': os.getenv('RUNTIME_MIN_CURRENT', '0.1'),
+            'max_gap': os.getenv('RUNTIME_MAX_GAP', '30')
+        }
+        ## In-memory history for the api
+        config['history'] = {
+            'enabled': os.getenv('HISTORY_ENABLED', 'false'),
+            'capacity': os.getenv('HISTORY_CAPACITY', '86400')
+        }
+        ## Store-and-forward spool
+        config['spool'] = {
+            'enabled': os.getenv('SPOOL_ENABLED', 'false'),
+            'path': os.getenv('SPOOL_PATH', 'spool'),
+            'max_bytes': os.getenv('SPOOL_MAX_BYTES', '67108864'),
+            'drain_rate': os.getenv('SPOOL_DRAIN_RATE', '10'),
+            'retry_interval': os.getenv('SPOOL_RETRY_INTERVAL', '30'),
+            'fsync': os.getenv('SPOOL_FSYNC', 'false')
+        }
+        ## Simulated device (DEVICE_BACKEND=simulator)
+        config['simulator'] = {
+            'notify_rate': os.getenv('SIM_NOTIFY_RATE', '1'),
+            'latency': os.getenv('SIM_LATENCY', '0.02'),
+            'jitter': os.getenv('SIM_JITTER', '0.01'),
+            'loss': os.getenv('SIM_LOSS', '0'),
+            'disconnect_after': os.getenv('SIM_DISCONNECT_AFTER', '0'),
+            'discovery_time': os.getenv('SIM_DISCOVERY_TIME', '0.5'),
+            'seed': os.getenv('SIM_SEED', '')
+        }
+        ## Raw frame recorder
+        config['recorder'] = {
+            'enabled': os.getenv('RECORDER_ENABLED', 'false'),
+            'path': os.getenv('RECORDER_PATH', 'frames.bin'),
+            'max_bytes': os.getenv('RECORDER_MAX_BYTES', '67108864'),
+            'max_files': os.getenv('RECORDER_MAX_FILES', '5')
+        }
         ## PVOutput
         config['pvoutput'] = {
             'enabled': os.getenv('PVOUT_ENABLED', 'false'),
@@ -141,6 +224,8 @@ def main():
         
         ## Connect to the MQTT broker
         mqtt_manager_inst.connect_to_broker()
+        ## Share the connection with DataLogger instead of opening one per message
+        MQTTPublisher.attach(mqtt_manager_inst)
         
         ## Setup device interface topics
         # mqtt_manager_inst.subscribe_to_topic(topic="process/smartshunt/data", on_message_callback=handle_smart_shunt_msg)
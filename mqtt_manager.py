@@ -5,7 +5,7 @@ import paho.mqtt.client as mqtt
 
 class MQTTManager(mqtt.Client):
     def __init__(self, broker, port=1883, client_id="", username=None, password=None, keepalive=60, topic_prefix="solar/state"):
-        super().__init__(callback_api_version=mqtt.CallbackAPIVersion.VERSION2, client_id=client_id, reconnect_on_failure=False)
+        super().__init__(callback_api_version=mqtt.CallbackAPIVersion.VERSION2, client_id=client_id, reconnect_on_failure=True)
         self.broker = broker
         self.port = port
         self.keepalive = keepalive
@@ -32,6 +32,12 @@ class MQTTManager(mqtt.Client):
         if username and password:
             self.username_pw_set(username, password)
 
+        # The connection is shared with DataLogger (see renogybt.MQTTPublisher),
+        # let the network loop reconnect on its own and restore subscriptions.
+        self.reconnect_delay_set(min_delay=1, max_delay=60)
+        self.on_connect = self._on_connect
+        self.on_disconnect = self._on_disconnect
+
         # Set LWT message BEFORE connect
         self.will_set(
             topic=f"{self.topic_prefix}/availability",
@@ -63,11 +69,29 @@ class MQTTManager(mqtt.Client):
         self.loop_stop()
         self.disconnect()
 
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        logging.info(f"Connected to MQTT broker ({reason_code})")
+        for topic in self.subscriptions:
+            self.subscribe(topic)
+
+    def _on_disconnect(self, client, userdata, flags, reason_code, properties):
+        if reason_code.is_failure:
+            logging.warning(f"Disconnected from MQTT broker ({reason_code}), reconnecting...")
+
+    def subscribe_to_topic(self, topic, on_message_callback):
+        def _handler(client, userdata, message):
+            on_message_callback(message.topic, message.payload.decode())
+        self.subscriptions[topic] = on_message_callback
+        self.message_callback_add(topic, _handler)
+        self.subscribe(topic)
+
     def publish_message(self, topic, payload, retain=False):
         logging.debug(f"MQTT publish: {topic} => {payload}")
         self.publish(topic, payload, retain=retain)
 
-    def create_mqtt_device(self, device_name, field_name, unit=None, device_class=None, state_class="measurement"):
+    def create_mqtt_device(self, device_name, field_name, unit=None, device_class=None, state_class="measurement", document_topic=None):
+        # document_topic => the field is read from a single JSON document per frame
+        # (see DataLogger payload_mode = document) instead of its own state topic
         unique_id = f"{device_name}_{field_name}"
         if unique_id in self.published_devices:
             return
@@ -76,7 +100,8 @@ class MQTTManager(mqtt.Client):
         unit = unit if unit is not None else self.unit_map.get(field_name.lower(), "")
         device_class = device_class if device_class is not None else self.device_class_map.get(field_name.lower(), "")
     
-        state_topic = f"{self.topic_prefix}/{field_name}/state"
+        state_topic = document_topic if document_topic else f"{self.topic_prefix}/{field_name}/state"
+        value_template = f"{{{{ value_json.{field_name} }}}}" if document_topic else "{{ value_json.value }}"
         discovery_topic = f"homeassistant/sensor/{unique_id}/config"
     
         payload = {
@@ -91,7 +116,7 @@ class MQTTManager(mqtt.Client):
                 "name": device_name,
             },
             "unit_of_measurement": unit,
-            "value_template": "{{ value_json.value }}",
+            "value_template": value_template,
         }
     
         if device_class:
@@ -0,0 +1,170 @@
+import time
+import asyncio
+import logging
+from bleak import BleakClient, BleakScanner
+from bleak.exc import BleakError
+from .BaseClient import NOTIFY_CHAR_UUID, WRITE_CHAR_UUID, READ_TIMEOUT, RECONNECT_DELAY, EXCEPTION_OPERATION, valid_response
+from .Utils import bytes_to_int
+
+# asyncio counterpart of BaseClient built on bleak, selected with [device] backend = bleak.
+# It keeps the clients' sections, parsers and the on_data_callback(client, data)
+# contract, but reads with BleakClient.start_notify / write_gatt_char and asyncio
+# timeouts: no manager.run() per client and no threading.Timer per poll or read,
+# so any number of devices can be served from one event loop (see AsyncClients).
+# Combine with a client for its sections, e.g. class AsyncRoverClient(AsyncBaseClient, RoverClient).
+
+DISCOVERY_TIMEOUT = 5 # (seconds)
+
+class BleakDevice:
+    # what the callbacks see as client.device
+    def __init__(self, mac_address, alias, client = None):
+        self.mac_address = mac_address
+        self._alias = alias
+        self.client = client
+
+    def alias(self):
+        return self._alias
+
+class AsyncBaseClient:
+    notify_uuid = NOTIFY_CHAR_UUID
+    write_uuid = WRITE_CHAR_UUID
+
+    async def connect(self):
+        # runs until disconnect(); reconnects after link loss while polling
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._response = None
+        self._ble_device = None # found by the last scan, reconnects skip the scan while fast_connect
+        self.device = BleakDevice(self.config['device']['mac_addr'], self.config['device']['alias'])
+        while not self.stopped:
+            try:
+                await self.__run_session()
+            except (BleakError, asyncio.TimeoutError, OSError) as e:
+                logging.error(f"Connection failed: {e}")
+                self._ble_device = None
+                self._safe_callback(self.on_error_callback, e)
+            if self.stopped or not self.reconnects():
+                break
+            await self.wait(RECONNECT_DELAY)
+
+    def reconnects(self):
+        # Modbus devices are only kept connected while polling
+        return self.config['data'].getboolean('enable_polling')
+
+    def disconnect(self):
+        # safe to call from any thread, ends connect() after the current read
+        self.stopped = True
+        if getattr(self, '_loop', None) is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def wait(self, seconds):
+        # sleep that returns early on disconnect() or link loss
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def __run_session(self):
+        mac_address = self.config['device']['mac_addr']
+        self.first_frame.connecting()
+        ble_device = self._ble_device if self.fast_connect else None
+        if ble_device is None:
+            # returns as soon as the device advertises
+            started = time.monotonic()
+            ble_device = await BleakScanner.find_device_by_address(mac_address, timeout=DISCOVERY_TIMEOUT)
+            if ble_device is None:
+                raise BleakError(f"Device not found: {self.config['device']['alias']} => {mac_address}, please check the details provided.")
+            logging.info("Discovery: found %s in %.2fs", mac_address, time.monotonic() - started)
+            self._ble_device = ble_device
+        else:
+            logging.info("Known device %s, connecting without discovery", mac_address)
+        self._wakeup.clear()
+        async with BleakClient(ble_device, disconnected_callback=self.__on_disconnected) as client:
+            self.device.client = client
+            logging.info("[%s] Connected" % (mac_address))
+            await client.start_notify(self.notify_uuid, self.__on_notification)
+            logging.info("subscribed to notification {}".format(self.notify_uuid))
+            await self.session()
+            if client.is_connected:
+                logging.info("Exit: Disconnecting device: %s [%s]", self.device.alias(), mac_address)
+
+    def __on_disconnected(self, client):
+        logging.info("[%s] Disconnected" % (self.device.mac_address))
+        self._wakeup.set()
+
+    def __on_notification(self, characteristic, value):
+        self.on_notification(value) # a new bytearray per notification, parsed in place
+
+    async def session(self):
+        # Modbus: read all sections, then every poll_interval while polling
+        while not self.stopped and self.device.client.is_connected:
+            if not await self.read_sections():
+                return
+            if not self.config['data'].getboolean('enable_polling'):
+                return
+            await self.wait(self.config['data'].getint('poll_interval'))
+
+    async def read_sections(self):
+        # each read is sent as soon as the previous response is validated (see ReadPipeline)
+        reads = self.reads if self.reads is not None else self.plan_reads()
+        self.cycle_started = self._loop.time()
+        index = 0
+        while index < len(reads):
+            self.read_index = index
+            read = reads[index]
+            self._response = self._loop.create_future()
+            self.read_sent = time.monotonic()
+            await self.device.client.write_gatt_char(self.write_uuid, read['request'])
+            try:
+                response = await asyncio.wait_for(self._response, self.pacer.timeout(self.read_timeout or READ_TIMEOUT))
+            except asyncio.TimeoutError:
+                self.pacer.on_timeout()
+                if self.read_attempts < self.read_retries:
+                    self.read_attempts += 1
+                    self.pacer.retries += 1
+                    logging.warning(f"read of {read['words']} words at {read['register']} timed out, retry {self.read_attempts}/{self.read_retries}")
+                    await asyncio.sleep(self.pacer.gap(self.section_delay))
+                    continue
+                logging.error("on_read_timeout => please check your device_id!")
+                self.read_attempts = 0
+                self.read_sent = None
+                self.data = {}
+                return False
+            finally:
+                self._response = None
+            if response[1] == EXCEPTION_OPERATION:
+                if self.split_read(index):
+                    continue # the same registers again, one section per request
+                logging.warning(f"read of {read['words']} words at {read['register']} rejected")
+            else:
+                self.on_read_answered(read)
+                self.parse_read(read, response)
+            gap = self.pacer.gap(self.section_delay)
+            if gap and index < len(reads) - 1:
+                await asyncio.sleep(gap)
+            index += 1
+        self.read_index = 0
+        self.read_sent = None
+        self.cycles += 1
+        self.cycle_seconds = self._loop.time() - self.cycle_started
+        self.on_read_operation_complete()
+        self.data = {}
+        return True
+
+    def on_notification(self, response):
+        self.first_frame.frame()
+        operation = bytes_to_int(response, 1, 1)
+        if self._response is None or self._response.done():
+            logging.warning("on_data_received: unexpected operation={}".format(operation))
+        elif operation == EXCEPTION_OPERATION or (operation == 3 and valid_response(self.reads[self.read_index], response)):
+            logging.info("on_data_received: response for read operation")
+            self._response.set_result(response)
+        else: # late answer to a retried read or a corrupted one, the timeout retries
+            logging.warning(f"on_data_received: ignoring invalid {len(response)} byte response")
+
+    def _safe_callback(self, callback, param):
+        if callback is not None:
+            try:
+                callback(self, param)
+            except Exception as e:
+                logging.error(f"_safe_callback => exception in callback! {e}")
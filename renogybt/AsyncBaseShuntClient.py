@@ -0,0 +1,21 @@
+from .AsyncBaseClient import AsyncBaseClient
+from .BaseShuntClient import NOTIFY_CHAR_UUID
+
+# asyncio counterpart of BaseShuntClient: the RMTShunt pushes every frame over
+# notify, so a session only subscribes and hands frames to on_data_received
+# until disconnect() or link loss, after which it reconnects.
+# Combine with the client for its sections, e.g. class AsyncShuntClient(AsyncBaseShuntClient, ShuntClient).
+
+class AsyncBaseShuntClient(AsyncBaseClient):
+    notify_uuid = NOTIFY_CHAR_UUID
+    write_uuid = None
+
+    def reconnects(self):
+        return True
+
+    async def session(self):
+        while not self.stopped and self.device.client.is_connected:
+            await self.wait(60)
+
+    def on_notification(self, response):
+        self.on_data_received(response) # parsed and passed to on_data_callback by BaseShuntClient
@@ -0,0 +1,44 @@
+import asyncio
+from .AsyncBaseClient import AsyncBaseClient
+from .AsyncBaseShuntClient import AsyncBaseShuntClient
+from .RoverClient import RoverClient
+from .RoverHistoryClient import RoverHistoryClient
+from .BatteryClient import BatteryClient
+from .InverterClient import InverterClient
+from .ShuntClient import ShuntClient
+
+# bleak/asyncio versions of the clients, same constructor and callbacks:
+#   client = AsyncRoverClient(config, on_data_received, on_error)
+#   asyncio.run(client.connect())
+# run_clients() serves any number of them from one event loop.
+
+class AsyncRoverClient(AsyncBaseClient, RoverClient):
+    pass
+
+class AsyncRoverHistoryClient(AsyncBaseClient, RoverHistoryClient):
+    pass
+
+class AsyncBatteryClient(AsyncBaseClient, BatteryClient):
+    pass
+
+class AsyncInverterClient(AsyncBaseClient, InverterClient):
+    pass
+
+class AsyncShuntClient(AsyncBaseShuntClient, ShuntClient):
+    pass
+
+ASYNC_CLIENTS = {
+    'RNG_CTRL': AsyncRoverClient,
+    'RNG_CTRL_HIST': AsyncRoverHistoryClient,
+    'RNG_BATT': AsyncBatteryClient,
+    'RNG_INVT': AsyncInverterClient,
+    'RNG_SHNT': AsyncShuntClient,
+}
+
+def create_async_client(config, on_data_callback = None, on_error_callback = None):
+    client_class = ASYNC_CLIENTS.get(config['device']['type'])
+    return client_class(config, on_data_callback, on_error_callback) if client_class else None
+
+async def run_clients(clients):
+    # one task per device on the running loop, a failing device does not stop the others
+    return await asyncio.gather(*(client.connect() for client in clients), return_exceptions=True)
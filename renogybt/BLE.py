@@ -1,43 +1,76 @@
 import gatt
 import logging 
 import time
+from gi.repository import GLib
 
 DISCOVERY_TIMEOUT = 5 # max wait time to complete the bluetooth scanning (seconds)
 
+def matches(dev, mac_address, alias):
+    return dev.mac_address != None and (dev.mac_address.upper() == mac_address or (dev.alias() and dev.alias().strip() == alias))
+
 class DeviceManager(gatt.DeviceManager):
-    def __init__(self, adapter_name, mac_address, alias):
+    def __init__(self, adapter_name, mac_address = None, alias = None):
         super(). __init__(adapter_name)
         self.device_found = False
         self.mac_address = mac_address
         self.device_alias = alias
+        self.wanted = {} # mac_address => alias while discovering, matched in device_discovered
+        self.found = set()
 
         if not self.is_adapter_powered:
             self.is_adapter_powered = True
         logging.info("Adapter status - Powered: {}".format(self.is_adapter_powered))
 
-    def discover(self):
-        discovering = True; wait = DISCOVERY_TIMEOUT; self.device_found = False; mac_address = self.mac_address.upper();
+    def discover(self, fast = False):
+        self.device_found = bool(self.discover_all({self.mac_address: self.device_alias}, fast))
+
+    def known_devices(self, devices):
+        # MACs of devices BlueZ already has (bonded, or seen by a recent scan): they can be connected without scanning
+        return {mac_address.upper() for dev in self.devices() for mac_address, alias in devices.items() if matches(dev, mac_address.upper(), alias)}
 
+    def discover_all(self, devices, fast = False):
+        # one scan for several devices sharing this manager, devices: {mac_address: alias}; returns the MACs found.
+        # Runs the main loop until device_discovered has seen all of them advertise (DISCOVERY_TIMEOUT at most);
+        # fast: devices BlueZ already knows are connected without waiting for them, no scan at all when it knows every one
+        started = time.monotonic()
+        self.wanted = {mac_address.upper(): alias for mac_address, alias in devices.items()}
         self.update_devices()
+        self.found = self.known_devices(devices) if fast else set()
+        if fast and len(self.found) == len(self.wanted):
+            logging.info("Known device(s) %s, connecting without discovery", ", ".join(sorted(self.found)))
+            self.wanted = {}
+            return self.found
+
         logging.info("Starting discovery...")
         self.start_discovery()
-
-        while discovering:
-            time.sleep(1)
-            logging.info("Devices found: %s", len(self.devices()))
-            for dev in self.devices():
-                if dev.mac_address != None and (dev.mac_address.upper() == mac_address or (dev.alias() and dev.alias().strip() == self.device_alias)) and discovering:
-                    logging.info("Found matching device %s => [%s]", dev.alias(), dev.mac_address)
-                    discovering = False; self.device_found = True
-            wait = wait -1
-            if (wait <= 0):
-                discovering = False
+        if len(self.found) < len(self.wanted):
+            timeout = GLib.timeout_add(DISCOVERY_TIMEOUT * 1000, self.__discovery_timeout)
+            self.run() # until stop(): all found or timed out
+            if self.wanted: # found before the timeout
+                GLib.source_remove(timeout)
         self.stop_discovery()
+        found, self.wanted = self.found, {}
+        logging.info("Discovery: %s/%s device(s) found in %.2fs", len(found), len(devices), time.monotonic() - started)
+        return found
+
+    def device_discovered(self, device):
+        for mac_address, alias in self.wanted.items():
+            if mac_address not in self.found and matches(device, mac_address, alias):
+                logging.info("Found matching device %s => [%s]", device.alias(), device.mac_address)
+                self.found.add(mac_address)
+                if len(self.found) == len(self.wanted):
+                    self.stop()
+
+    def __discovery_timeout(self):
+        self.wanted = {}
+        self.stop()
+        return False # one shot
 
 
 class Device(gatt.Device):
-    def __init__(self, mac_address, manager, on_resolved, on_data, on_connect_fail, notify_uuid, write_uuid):
+    def __init__(self, mac_address, manager, on_resolved, on_data, on_connect_fail, notify_uuid, write_uuid, recorder=None):
         super(). __init__(mac_address=mac_address, manager=manager)
+        self.recorder = recorder # optional FrameRecorder for raw frames
         self.data_callback = on_data
         self.resolved_callback = on_resolved
         self.connect_fail_callback = on_connect_fail
@@ -86,7 +119,12 @@ class Device(gatt.Device):
     def characteristic_value_updated(self, characteristic, value):
         super().characteristic_value_updated(characteristic, value)
         # logging.info('characteristic_value_updated')
-        self.data_callback(value)
+        if self.recorder is not None:
+            self.recorder.record(self.mac_address, characteristic.uuid, value)
+        try:
+            self.data_callback(value)
+        except Exception as e: # keep the main loop (and other devices on it) running
+            logging.error(f"[{self.mac_address}] exception in data callback: {e}")
 
     def characteristic_write_value(self, value):
         logging.debug(msg="DEBUG characteristic_write_value")
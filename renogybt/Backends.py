@@ -0,0 +1,30 @@
+import functools
+
+# BLE backend selection, [device] backend in config.ini:
+#   gatt      => BlueZ over D-Bus (renogybt/BLE.py), the default
+#   simulator => in-process simulated devices (renogybt/SimulatedBLE.py), no adapter needed
+#   bleak     => asyncio clients on bleak (renogybt/AsyncClients.py), see DeviceInstance.run_async
+# Both provide the same DeviceManager(adapter_name, mac_address, alias) and
+# Device(mac_address, manager, on_resolved, on_data, on_connect_fail, notify_uuid, write_uuid, recorder)
+# interface; bleak has no such pair, its clients run on an asyncio loop instead.
+# Backends are imported on first use so `gatt` is only needed when it is selected.
+
+BACKEND_GATT = 'gatt'
+BACKEND_SIMULATOR = 'simulator'
+BACKEND_BLEAK = 'bleak'
+
+def backend_name(config):
+    return config['device'].get('backend', BACKEND_GATT).strip() or BACKEND_GATT
+
+def get_backend(config):
+    # returns (DeviceManager, Device) for the configured backend
+    name = backend_name(config)
+    if name == BACKEND_GATT:
+        from .BLE import DeviceManager, Device
+        return DeviceManager, Device
+    if name == BACKEND_SIMULATOR:
+        from .SimulatedBLE import DeviceManager, Device, get_simulation
+        return functools.partial(DeviceManager, simulation=get_simulation(config)), Device
+    if name == BACKEND_BLEAK:
+        raise ValueError(f"BLE backend '{name}' is asyncio based, use renogybt.AsyncClients instead of the callback clients")
+    raise ValueError(f"unknown BLE backend '{name}', expected '{BACKEND_GATT}', '{BACKEND_SIMULATOR}' or '{BACKEND_BLEAK}'")
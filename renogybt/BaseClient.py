@@ -4,17 +4,31 @@ import logging
 import configparser
 import time
 from .Utils import bytes_to_int, int_to_bytes, crc16_modbus
-from .BLE import DeviceManager, Device
+from .Backends import get_backend
+from .FrameRecorder import get_recorder
+from . import ReadPlanner
+from .ReadPipeline import ReadPacer, LatencyHistogram, get_scheduler
+from .ConnectTimer import FirstFrameTimer
 
 # Base class that works with all Renogy family devices
 # Should be extended by each client with its own parsers and section definitions
 # Section example: {'register': 5000, 'words': 8, 'parser': self.parser_func}
+# Consecutive sections may be read with one request, see ReadPlanner. Reads are
+# sent back to back, each as soon as the previous response is validated, with
+# timeouts and retries paced by the measured turnaround, see ReadPipeline
 
 ALIAS_PREFIX = 'BT-TH'
 ALIAS_PREFIX_PRO = 'RNGRBP'
 NOTIFY_CHAR_UUID = "0000fff1-0000-1000-8000-00805f9b34fb"
 WRITE_CHAR_UUID  = "0000ffd1-0000-1000-8000-00805f9b34fb"
 READ_TIMEOUT = 30 # (seconds)
+READ_RETRIES = 2 # requests sent again after a timeout before giving up
+EXCEPTION_OPERATION = 0x83 # read (3) rejected by the device, e.g. illegal data address
+RECONNECT_DELAY = 5 # (seconds) before a device on a shared manager is retried
+
+def valid_response(read, response):
+    # the whole answer to the read, CRC checked
+    return len(response) == read['words'] * 2 + 5 and crc16_modbus(response[:-2]) == response[-2:]
 
 class BaseClient:
     def __init__(self, config):
@@ -26,12 +40,34 @@ class BaseClient:
         self.data = {}
         self.device_id = self.config['device'].getint('device_id')
         self.sections = []
-        self.section_index = 0
+        self.reads = None # the sections coalesced into requests, planned on the first read (see ReadPlanner)
+        self.read_index = 0
+        self.section_delay = self.config['data'].getfloat('section_delay', fallback=0) # (seconds) smallest gap between a response and the next read
+        self.read_timeout = READ_TIMEOUT # (seconds) longest read timeout, 0 disables the read timer
+        self.read_retries = self.config['data'].getint('read_retries', fallback=READ_RETRIES)
+        self.scheduler = get_scheduler() # read timeouts, paced reads and polls of all clients on one thread
+        self.pacer = ReadPacer()
+        self.read_latency = {} # 'register+words' => LatencyHistogram
+        self.read_seq = 0 # the timer of an answered read is ignored
+        self.read_sent = None # monotonic time the read in flight was sent, None when idle
+        self.read_attempts = 0
+        self.cycle_started = None
+        self.cycle_seconds = None # duration of the last complete read of all sections
+        self.cycles = 0
+        self.shared_manager = False # True when the main loop belongs to a Supervisor
+        self.reconnect_timer = None
+        self.stopped = False
+        # connect without scanning when BlueZ already knows the device (see BLE.DeviceManager.discover_all),
+        # until a connect fails
+        self.fast_connect = self.config['device'].getboolean('fast_connect', fallback=True)
+        self.first_frame = FirstFrameTimer(self.config['device']['alias'])
         logging.info(f"Init {self.__class__.__name__}: {self.config['device']['alias']} => {self.config['device']['mac_addr']}")
 
     def connect(self):
+        DeviceManager, Device = get_backend(self.config)
         self.manager = DeviceManager(adapter_name=self.config['device']['adapter'], mac_address=self.config['device']['mac_addr'], alias=self.config['device']['alias'])
-        self.manager.discover()
+        self.first_frame.connecting()
+        self.manager.discover(fast=self.fast_connect)
 
         if not self.manager.device_found:
             logging.error(f"Device not found: {self.config['device']['alias']} => {self.config['device']['mac_addr']}, please check the details provided.")
@@ -40,7 +76,7 @@ class BaseClient:
                     logging.debug(f"Possible device found! ======> {dev.alias()} > [{dev.mac_address}]")
             self.__stop_service()
 
-        self.device = Device(mac_address=self.config['device']['mac_addr'], manager=self.manager, on_resolved=self.__on_resolved, on_data=self.on_data_received, on_connect_fail=self.__on_connect_fail, notify_uuid=NOTIFY_CHAR_UUID, write_uuid=WRITE_CHAR_UUID)
+        self.device = self.__create_device(Device)
 
         try:
             self.device.connect()
@@ -50,7 +86,21 @@ class BaseClient:
         except KeyboardInterrupt:
             self.__on_error(False, "KeyboardInterrupt")
 
+    def start(self, manager):
+        # join a DeviceManager shared with other devices (see Supervisor): the owner
+        # runs discovery and the main loop, failures here only affect this device
+        _, Device = get_backend(self.config)
+        self.manager = manager
+        self.shared_manager = True
+        self.device = self.__create_device(Device)
+        self.first_frame.connecting()
+        self.device.connect()
+
+    def __create_device(self, Device):
+        return Device(mac_address=self.config['device']['mac_addr'], manager=self.manager, on_resolved=self.__on_resolved, on_data=self.on_data_received, on_connect_fail=self.__on_connect_fail, notify_uuid=NOTIFY_CHAR_UUID, write_uuid=WRITE_CHAR_UUID, recorder=get_recorder(self.config))
+
     def disconnect(self):
+        self.stopped = True
         self.device.disconnect()
         self.__stop_service()
 
@@ -59,53 +109,139 @@ class BaseClient:
         self.poll_data() if self.config['data'].getboolean('enable_polling') == True else self.read_section()
 
     def on_data_received(self, response):
-        self.read_timer.cancel()
+        self.first_frame.frame()
         operation = bytes_to_int(response, 1, 1)
 
         if operation == 3: # read operation
+            reads = self.reads if self.reads is not None else self.plan_reads()
+            read = reads[self.read_index] if self.read_index < len(reads) else None
+            if read is None or not valid_response(read, response):
+                # late answer to a retried read or a corrupted one: the read timer retries
+                return logging.warning(f"on_data_received: ignoring invalid {len(response)} byte response")
             logging.info("on_data_received: response for read operation")
-            if (self.section_index < len(self.sections) and
-                self.sections[self.section_index]['parser'] != None and
-                self.sections[self.section_index]['words'] * 2 + 5 == len(response)):
-                # parse and update data
-                self.sections[self.section_index]['parser'](response)
-
-            if self.section_index >= len(self.sections) - 1: # last section, read complete
-                self.section_index = 0
+            self.scheduler.cancel(self.read_timer)
+            self.on_read_answered(read)
+            self.parse_read(read, response)
+
+            if self.read_index >= len(reads) - 1: # last read, read complete
+                self.read_index = 0
+                self.read_sent = None
+                self.cycles += 1
+                if self.cycle_started is not None:
+                    self.cycle_seconds = time.monotonic() - self.cycle_started
                 self.on_read_operation_complete()
                 self.data = {}
             else:
-                self.section_index += 1
-                time.sleep(0.5)
-                self.read_section()
+                self.read_index += 1
+                self.send_next_read()
+        elif operation == EXCEPTION_OPERATION and self.split_read(self.read_index):
+            self.scheduler.cancel(self.read_timer)
+            self.read_section() # the same registers again, one section per request
         else:
             logging.warn("on_data_received: unknown operation={}".format(operation))
 
+    def on_read_answered(self, read):
+        now = time.monotonic()
+        if self.read_sent is not None:
+            seconds = now - self.read_sent
+            self.pacer.sample(seconds)
+            key = f"{read['register']}+{read['words']}"
+            if key not in self.read_latency:
+                self.read_latency[key] = LatencyHistogram()
+            self.read_latency[key].add(seconds)
+        self.read_seq += 1
+        self.read_attempts = 0
+
+    def send_next_read(self):
+        # right away, unless read_delay or timeouts ask for a gap
+        gap = self.pacer.gap(self.section_delay)
+        if gap:
+            self.read_timer = self.scheduler.call_later(gap, self.read_section)
+        else:
+            self.read_section()
+
+    def plan_reads(self):
+        self.reads = ReadPlanner.plan_reads(self.device_id, self.sections,
+                                            max_gap=self.config['data'].getint('read_gap', fallback=ReadPlanner.DEFAULT_GAP),
+                                            max_words=self.config['data'].getint('max_read_words', fallback=ReadPlanner.DEFAULT_MAX_WORDS))
+        logging.info(f"{len(self.sections)} sections => {len(self.reads)} reads: {[(read['register'], read['words']) for read in self.reads]}")
+        return self.reads
+
+    def parse_read(self, read, response):
+        # hands every section of the read its part of the response
+        if read['words'] * 2 + 5 != len(response):
+            return
+        for section, offset in read['sections']:
+            if section['parser'] != None:
+                section['parser'](ReadPlanner.section_frame(response, read, section, offset))
+
+    def split_read(self, index):
+        # a merged read the device rejected is read one section at a time from now on
+        read = self.reads[index] if self.reads is not None and index < len(self.reads) else None
+        if read is None or len(read['sections']) < 2:
+            return False
+        logging.warning(f"read of {read['words']} words at {read['register']} rejected, reading its {len(read['sections'])} sections separately")
+        self.reads[index:index + 1] = ReadPlanner.split(self.device_id, read)
+        return True
+
     def on_read_operation_complete(self):
         logging.info("on_read_operation_complete")
         self.data['__device'] = self.config['device']['alias']
         self.data['__client'] = self.__class__.__name__
         self.__safe_callback(self.on_data_callback, self.data)
 
+    def on_read_timer(self, seq):
+        if seq != self.read_seq or self.stopped: # answered meanwhile
+            return
+        self.read_seq += 1
+        self.pacer.on_timeout()
+        if self.read_attempts < self.read_retries:
+            self.read_attempts += 1
+            self.pacer.retries += 1
+            read = self.reads[self.read_index]
+            logging.warning(f"read of {read['words']} words at {read['register']} timed out, retry {self.read_attempts}/{self.read_retries}")
+            return self.send_next_read()
+        self.read_attempts = 0
+        self.read_sent = None
+        self.on_read_timeout()
+
     def on_read_timeout(self):
         logging.error("on_read_timeout => please check your device_id!")
+        if self.shared_manager:
+            self.device.disconnect()
+            return self.__reconnect_later()
         self.disconnect()
 
     def poll_data(self):
-        self.read_section()
-        if self.poll_timer is not None and self.poll_timer.is_alive():
-            self.poll_timer.cancel()
-        self.poll_timer = Timer(self.config['data'].getint('poll_interval'), self.poll_data)
-        self.poll_timer.start()
+        if self.read_sent is None:
+            self.read_section()
+        else:
+            logging.warning("poll_data: previous read still in progress")
+        self.scheduler.cancel(self.poll_timer)
+        self.poll_timer = self.scheduler.call_later(self.config['data'].getint('poll_interval'), self.poll_data)
 
     def read_section(self):
-        index = self.section_index
         if self.device_id == None or len(self.sections) == 0:
             return logging.error("base client cannot be used directly")
-        request = self.create_generic_read_request(self.device_id, 3, self.sections[index]['register'], self.sections[index]['words']) 
-        self.device.characteristic_write_value(request)
-        self.read_timer = Timer(READ_TIMEOUT, self.on_read_timeout)
-        self.read_timer.start()
+        if self.reads is None:
+            self.plan_reads()
+        if self.read_index == 0 and self.read_attempts == 0:
+            self.cycle_started = time.monotonic()
+        self.read_seq += 1
+        self.read_sent = time.monotonic()
+        self.device.characteristic_write_value(self.reads[self.read_index]['request']) # prebuilt, CRC included
+        if self.read_timeout:
+            self.read_timer = self.scheduler.call_later(self.pacer.timeout(self.read_timeout), self.on_read_timer, self.read_seq)
+
+    def read_stats(self):
+        # pacing, cycle time and turnaround histograms per read, see ReadPipeline
+        return dict(self.pacer.stats(self.section_delay, self.read_timeout or READ_TIMEOUT), cycles=self.cycles,
+                    cycle_seconds=round(self.cycle_seconds, 3) if self.cycle_seconds is not None else None,
+                    latency={key: histogram.stats() for key, histogram in self.read_latency.items()})
+
+    def connect_stats(self):
+        # time to first frame at startup and after the last reconnect, see ConnectTimer
+        return self.first_frame.stats()
 
     def create_generic_read_request(self, device_id, function, regAddr, readWrd):                             
         data = None                                
@@ -131,9 +267,29 @@ class BaseClient:
 
     def __on_connect_fail(self, error):
         logging.error(f"Connection failed: {error}")
+        self.fast_connect = False # a stale BlueZ entry, scan on the next connect
         self.__safe_callback(self.on_error_callback, error)
+        if self.shared_manager and not self.stopped:
+            return self.__reconnect_later()
         self.__stop_service()
 
+    def __reconnect_later(self):
+        self.__cancel_timers()
+        if self.reconnect_timer is not None and self.reconnect_timer.is_alive():
+            return
+        logging.info(f"Reconnecting {self.config['device']['alias']} in {RECONNECT_DELAY}s")
+        self.read_index = 0
+        self.read_sent = None
+        self.read_attempts = 0
+        self.data = {}
+        self.reconnect_timer = Timer(RECONNECT_DELAY, self.__reconnect)
+        self.reconnect_timer.daemon = True
+        self.reconnect_timer.start()
+
+    def __reconnect(self):
+        self.first_frame.connecting()
+        self.device.connect()
+
     def __safe_callback(self, calback, param):
         if calback is not None:
             try:
@@ -141,9 +297,14 @@ class BaseClient:
             except Exception as e:
                 logging.error(f"__safe_callback => exception in callback! {e}")
 
+    def __cancel_timers(self):
+        self.scheduler.cancel(self.poll_timer)
+        self.scheduler.cancel(self.read_timer)
+        self.read_seq += 1
+
     def __stop_service(self):
-        if self.poll_timer is not None and self.poll_timer.is_alive():
-            self.poll_timer.cancel()
-        if self.poll_timer is not None: self.read_timer.cancel()
-        self.manager.stop()
+        self.__cancel_timers()
+        if self.reconnect_timer is not None: self.reconnect_timer.cancel()
+        if not self.shared_manager: # a shared main loop keeps serving the other devices
+            self.manager.stop()
         # os._exit(os.EX_OK) ## ONLY CALL IF YOU WANT TO STOP THE APP PROCESS
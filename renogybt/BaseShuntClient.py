@@ -3,8 +3,10 @@ from threading import Timer
 import logging
 import configparser
 import time
-from .Utils import bytes_to_int, int_to_bytes, crc16_modbus
-from .BLE import DeviceManager, Device
+from .Utils import int_to_bytes, crc16_modbus
+from .Backends import get_backend
+from .FrameRecorder import get_recorder
+from .ConnectTimer import FirstFrameTimer
 
 # Base class that works with all Renogy family devices
 # Should be extended by each client with its own parsers and section definitions
@@ -16,6 +18,8 @@ NOTIFY_CHAR_UUID = "0000c411-0000-1000-8000-00805f9b34fb"
 WRITE_CHAR_UUID  = "" # RMTShunt sends all data over notify to any connected device
 READ_TIMEOUT = 30 # (seconds)
 
+DUPLICATE_REFRESH = 60 # (seconds) a repeated frame is still parsed at least this often
+
 RECONNECT_DELAY = 5  # Time in seconds to wait before reconnecting
 MAX_RECONNECT_ATTEMPTS = 15  # Maximum number of reconnect attempts
 
@@ -29,11 +33,33 @@ class BaseClient:
         self.sections = []
         self.section_index = 0
         self.reconnect_attempts = 0
+        self.shared_manager = False # True when the main loop belongs to a Supervisor
+        self.reconnect_timer = None
+        self.stopped = False
+        # the shunt repeats byte-identical frames between changes: those are not decoded again,
+        # the record of the previous frame is passed on instead (see on_data_received),
+        # unless [data] skip_duplicates = false
+        self.skip_duplicates = self.config['data'].getboolean('skip_duplicates', fallback=True)
+        self.duplicate_refresh = self.config['data'].getfloat('duplicate_refresh', fallback=DUPLICATE_REFRESH)
+        self.clock = time.monotonic # replaceable, e.g. recorded frame time when replaying
+        self.duplicate_region = None # (start, end) of the bytes the parser reads, None = whole frame
+        self.last_frame = bytearray()
+        self.last_passed = False # self.data holds the decoded last frame and went to on_data_callback
+        self.last_length = 0
+        self.last_parsed = 0
+        self.last_frame_time = None # clock() of the last frame, duplicates included (liveness)
+        self.frame_counters = {'frames': 0, 'duplicates': 0}
+        # connect without scanning when BlueZ already knows the device (see BLE.DeviceManager.discover_all),
+        # until a connect fails
+        self.fast_connect = self.config['device'].getboolean('fast_connect', fallback=True)
+        self.first_frame = FirstFrameTimer(self.config['device']['alias'])
         logging.info(f"Init {self.__class__.__name__}: {self.config['device']['alias']} => {self.config['device']['mac_addr']}")
 
     def connect(self):
+        DeviceManager, Device = get_backend(self.config)
         self.manager = DeviceManager(adapter_name=self.config['device']['adapter'], mac_address=self.config['device']['mac_addr'], alias=self.config['device']['alias'])
-        self.manager.discover()
+        self.first_frame.connecting()
+        self.manager.discover(fast=self.fast_connect)
 
         if not self.manager.device_found:
             logging.error(f"Device not found: {self.config['device']['alias']} => {self.config['device']['mac_addr']}, please check the details provided.")
@@ -42,13 +68,7 @@ class BaseClient:
                     logging.debug(f"Possible device found! ======> {dev.alias()} > [{dev.mac_address}]")
             self.__stop_service()
 
-        self.device = Device(mac_address=self.config['device']['mac_addr'], 
-                             manager=self.manager, 
-                             on_resolved=self.__on_resolved, 
-                             on_data=self.on_data_received, 
-                             on_connect_fail=self.__on_connect_fail, 
-                             notify_uuid=NOTIFY_CHAR_UUID, 
-                             write_uuid=WRITE_CHAR_UUID)
+        self.device = self.__create_device(Device)
         
         while self.reconnect_attempts < MAX_RECONNECT_ATTEMPTS:
             try:
@@ -79,7 +99,28 @@ class BaseClient:
         # except KeyboardInterrupt:
         #     self.__on_error(False, "KeyboardInterrupt")
 
+    def start(self, manager):
+        # join a DeviceManager shared with other devices (see Supervisor): the owner
+        # runs discovery and the main loop, failures here only affect this device
+        _, Device = get_backend(self.config)
+        self.manager = manager
+        self.shared_manager = True
+        self.device = self.__create_device(Device)
+        self.first_frame.connecting()
+        self.device.connect()
+
+    def __create_device(self, Device):
+        return Device(mac_address=self.config['device']['mac_addr'], 
+                      manager=self.manager, 
+                      on_resolved=self.__on_resolved, 
+                      on_data=self.on_data_received, 
+                      on_connect_fail=self.__on_connect_fail, 
+                      notify_uuid=NOTIFY_CHAR_UUID, 
+                      write_uuid=WRITE_CHAR_UUID,
+                      recorder=get_recorder(self.config))
+
     def disconnect(self):
+        self.stopped = True
         self.device.disconnect()
         self.__stop_service()
 
@@ -99,7 +140,14 @@ class BaseClient:
     def on_data_received(self, response):
         # logging.debug(msg=f"DEBUG on_data_received")
         # self.read_timer.cancel()
-        operation = bytes_to_int(response, 1, 1)
+        # response: the buffer as received (bytes, bytearray or a memoryview when replaying),
+        # parsers read it in place with struct.unpack_from
+        self.first_frame.frame()
+        if self.skip_duplicate(response):
+            # same bytes as the last frame: its record goes on again, only the decode is skipped, so
+            # the rate limiter / aggregator and energy counters still see every frame
+            return self.__safe_callback(self.on_data_callback, self.data)
+        operation = response[1] if len(response) > 1 else 0
 
         if operation == 87: # notify operation
             # logging.info("on_data_received: response for notify operation")
@@ -108,10 +156,38 @@ class BaseClient:
                 self.sections[self.section_index]['words'] == len(response)):
                 # parse and update data
                 self.data = self.sections[self.section_index]['parser'](response)
+                self.last_passed = True
                 self.__safe_callback(self.on_data_callback, self.data)
         else:
             logging.warn("on_data_received: unknown operation={}".format(operation))
 
+    def skip_duplicate(self, response):
+        # True for a frame whose parsed region equals the previous frame's, when that one was decoded and passed on
+        now = self.clock()
+        self.last_frame_time = now
+        self.frame_counters['frames'] += 1
+        if not self.skip_duplicates:
+            return False
+        region = self.duplicate_region
+        frame = response[region[0]:region[1]] if region else response
+        if self.last_passed and frame == self.last_frame and len(response) == self.last_length and now - self.last_parsed < self.duplicate_refresh:
+            self.frame_counters['duplicates'] += 1
+            return True
+        self.last_passed = False # until this frame is decoded
+        self.last_frame[:] = frame # copied into the same buffer, the frame itself is not kept
+        self.last_length = len(response)
+        self.last_parsed = now
+        return False
+
+    def frame_stats(self):
+        frames = self.frame_counters['frames']
+        return dict(self.frame_counters, skip_ratio=round(self.frame_counters['duplicates'] / frames, 4) if frames else 0.0,
+                    last_frame_age=round(self.clock() - self.last_frame_time, 3) if self.last_frame_time else None)
+
+    def connect_stats(self):
+        # time to first frame at startup and after the last reconnect, see ConnectTimer
+        return self.first_frame.stats()
+
     def on_read_timeout(self):
         logging.error("on_read_timeout => please check your device_id!")
         self.disconnect()
@@ -123,6 +199,11 @@ class BaseClient:
 
     def __on_connect_fail(self, error):
         logging.error(f"Connection failed: {error}")
+        self.fast_connect = False # a stale BlueZ entry, scan on the next connect
+        if self.shared_manager: # only this device is down, the shared main loop keeps running
+            if not self.stopped:
+                self.__reconnect_later()
+            return
         ## try reconnect attempts then throw error if that fails
         if(self.reconnect_attempts == 0):
             ## device disconnected
@@ -133,6 +214,18 @@ class BaseClient:
         # self.__safe_callback(self.on_error_callback, error)
         # self.__stop_service()
 
+    def __reconnect_later(self):
+        if self.reconnect_timer is not None and self.reconnect_timer.is_alive():
+            return
+        logging.info(f"Reconnecting {self.config['device']['alias']} in {RECONNECT_DELAY}s")
+        self.reconnect_timer = Timer(RECONNECT_DELAY, self.__reconnect)
+        self.reconnect_timer.daemon = True
+        self.reconnect_timer.start()
+
+    def __reconnect(self):
+        self.first_frame.connecting()
+        self.device.connect()
+
     def __safe_callback(self, calback, param):
         if calback is not None:
             try:
@@ -145,6 +238,8 @@ class BaseClient:
         #     self.poll_timer.cancel()
         # if self.poll_timer is not None and self.read_timer is not None:
         #     self.read_timer.cancel()
-        if self.manager:
+        if self.reconnect_timer is not None:
+            self.reconnect_timer.cancel()
+        if self.manager and not self.shared_manager: # a shared main loop keeps serving the other devices
             self.manager.stop()
         # os._exit(os.EX_OK) ## ONLY CALL IF YOU WANT TO STOP THE APP PROCESS
@@ -0,0 +1,65 @@
+import logging
+from .ShuntClient import SHUNT_INFO
+
+# Batch decoding of recorded frames for offline analysis. Takes one contiguous
+# buffer of fixed-length frames (or a FrameReader.payload_matrix() view) and
+# returns a NumPy column array per field, decoded through strided views (no
+# per-frame Python work). Values are identical
+# to the scalar parsers: same 24-bit handling and same round(x, 2) results.
+# NumPy is only needed here, it is not a runtime dependency of the clients:
+#   python3 -m pip install numpy
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SHUNT_FRAME_SIZE = 110
+
+def frame_matrix(buffer, frame_size):
+    # zero-copy (frames x frame_size) uint8 view of the buffer
+    if np is None:
+        raise ImportError("BatchDecoder requires numpy: python3 -m pip install numpy")
+    if isinstance(buffer, np.ndarray) and buffer.ndim == 2: # e.g. FrameReader.payload_matrix()
+        return buffer
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    if len(data) % frame_size != 0:
+        raise ValueError(f"buffer length {len(data)} is not a multiple of the frame size {frame_size}")
+    return data.reshape(-1, frame_size)
+
+def read_column(frames, offset, width, signed = False):
+    # big-endian field of 1..4 bytes at `offset` in every frame, as int64
+    raw = frames[:, offset].astype(np.int64)
+    for i in range(1, width):
+        raw = (raw << 8) | frames[:, offset + i]
+    if signed:
+        raw -= (raw >> (8 * width - 1)) << (8 * width)
+    return raw
+
+def round2(values):
+    # element-wise equivalent of Python's round(value, 2): vectorized, with the
+    # few values sitting on a .xx5 boundary handed to round() itself
+    scaled = values * 100
+    result = np.rint(scaled) / 100
+    ties = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    if ties.any():
+        result[ties] = [round(value, 2) for value in values[ties].tolist()]
+    return result
+
+def decode_frames(layout, buffer, frame_size = None):
+    # numeric fields of a register map layout => {name: column array}
+    frames = frame_matrix(buffer, frame_size or layout.size)
+    columns = {}
+    for field in layout.fields:
+        if field.kind != 'int' or field.enum is not None or field.shift or field.mask is not None:
+            logging.debug(f"decode_frames: skipping non numeric field {field.name}")
+            continue
+        raw = read_column(frames, field.offset, field.width, field.signed)
+        columns[field.name] = raw if field.scale == 1 else round2(raw * field.scale)
+    return columns
+
+def decode_shunt_frames(buffer, frame_size = SHUNT_FRAME_SIZE):
+    # same fields as ShuntClient.parse_shunt_info, one array per field
+    columns = decode_frames(SHUNT_INFO, buffer, frame_size)
+    columns['discharge_watts'] = round2(columns['charge_battery_voltage'] * columns['discharge_amps'])
+    return columns
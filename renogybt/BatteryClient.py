@@ -1,5 +1,5 @@
 from .BaseClient import BaseClient
-from .Utils import bytes_to_int, format_temperature
+from .RegisterMap import Field, compile_layout
 
 # Client for Renogy LFP battery with built-in bluetooth / BT-2 module
 
@@ -8,6 +8,42 @@ FUNCTION = {
     6: "WRITE"
 }
 
+MAX_CELLS = 16 # 17 word sections: count + 16 values
+MAX_SENSORS = 16
+
+CELL_VOLT_INFO = compile_layout([
+    Field('function', 1, 1, enum=FUNCTION),
+    Field('cell_count', 3, 2),
+] + [Field(f'cell_voltage_{i}', 5 + i*2, 2, scale=0.1, unit='V', device_class='voltage') for i in range(MAX_CELLS)])
+
+CELL_TEMP_INFO = compile_layout([
+    Field('function', 1, 1, enum=FUNCTION),
+    Field('sensor_count', 3, 2),
+] + [Field(f'temperature_{i}', 5 + i*2, 2, signed=True, scale=0.1, kind='celsius', device_class='temperature') for i in range(MAX_SENSORS)])
+
+BATTERY_INFO = compile_layout([
+    Field('function', 1, 1, enum=FUNCTION),
+    Field('current', 3, 2, signed=True, scale=0.01, unit='A', device_class='current'),
+    Field('voltage', 5, 2, scale=0.1, unit='V', device_class='voltage'),
+    Field('remaining_charge', 7, 4, scale=0.001, unit='Ah'),
+    Field('capacity', 11, 4, scale=0.001, unit='Ah'),
+])
+
+DEVICE_INFO = compile_layout([
+    Field('function', 1, 1, enum=FUNCTION),
+    Field('model', 3, 14, kind='str'),
+])
+
+DEVICE_ADDRESS = compile_layout([
+    Field('device_id', 3, 2),
+])
+
+def drop_unused(data, prefix, count, maximum):
+    # layouts describe every possible slot, keep only the ones the battery reports
+    for i in range(max(count, 0), maximum):
+        del data[f'{prefix}{i}']
+    return data
+
 class BatteryClient(BaseClient):
     def __init__(self, config, on_data_callback=None, on_error_callback=None):
         super().__init__(config)
@@ -23,38 +59,18 @@ class BatteryClient(BaseClient):
         ]
 
     def parse_cell_volt_info(self, bs):
-        data = {}
-        data['function'] = FUNCTION.get(bytes_to_int(bs, 1, 1))
-        data['cell_count'] = bytes_to_int(bs, 3, 2)
-        for i in range(0, data['cell_count']):
-            data[f'cell_voltage_{i}'] = bytes_to_int(bs, 5 + i*2, 2, scale = 0.1)
-        self.data.update(data)
+        data = CELL_VOLT_INFO.decode(bs)
+        self.data.update(drop_unused(data, 'cell_voltage_', data['cell_count'], MAX_CELLS))
 
     def parse_cell_temp_info(self, bs):
-        data = {}
-        data['function'] = FUNCTION.get(bytes_to_int(bs, 1, 1))
-        data['sensor_count'] = bytes_to_int(bs, 3, 2)
-        for i in range(0, data['sensor_count']):
-            celcius = bytes_to_int(bs, 5 + i*2, 2, scale = 0.1, signed = True)
-            data[f'temperature_{i}'] = format_temperature(celcius, self.config['data']['temperature_unit'])
-        self.data.update(data)
+        data = CELL_TEMP_INFO.decode(bs, self.config['data']['temperature_unit'])
+        self.data.update(drop_unused(data, 'temperature_', data['sensor_count'], MAX_SENSORS))
 
     def parse_battery_info(self, bs):
-        data = {}
-        data['function'] = FUNCTION.get(bytes_to_int(bs, 1, 1))
-        data['current'] = bytes_to_int(bs, 3, 2, True, scale = 0.01)
-        data['voltage'] = bytes_to_int(bs, 5, 2, scale = 0.1)
-        data['remaining_charge'] = bytes_to_int(bs, 7, 4, scale = 0.001)
-        data['capacity'] = bytes_to_int(bs, 11, 4, scale = 0.001)
-        self.data.update(data)
+        BATTERY_INFO.decode_into(bs, self.data)
 
     def parse_device_info(self, bs):
-        data = {}
-        data['function'] = FUNCTION.get(bytes_to_int(bs, 1, 1))
-        data['model'] = (bs[3:17]).decode('utf-8')
-        self.data.update(data)
+        DEVICE_INFO.decode_into(bs, self.data)
 
     def parse_device_address(self, bs):
-        data = {}
-        data['device_id'] = bytes_to_int(bs, 3, 2)
-        self.data.update(data)
+        DEVICE_ADDRESS.decode_into(bs, self.data)
@@ -0,0 +1,38 @@
+import time
+import logging
+
+# Time to first frame: seconds from the start of a connect (discovery included)
+# to the first frame the device sends on that connection, kept separately for
+# the first connect ('startup') and every later one ('reconnect').
+# connecting() when a connect starts, frame() for every frame received;
+# see BaseClient.connect_stats() / BaseShuntClient.connect_stats().
+
+class FirstFrameTimer:
+    def __init__(self, name):
+        self.name = name
+        self.started = None # monotonic time of the connect waiting for its first frame
+        self.reason = 'startup'
+        self.connected_once = False
+        self.reconnects = 0
+        self.seconds = {'startup': None, 'reconnect': None} # last time to first frame (seconds)
+
+    def connecting(self):
+        if self.started is not None: # retry of a connect that never delivered a frame: timed from the first attempt
+            return
+        self.reason = 'reconnect' if self.connected_once else 'startup'
+        if self.connected_once:
+            self.reconnects += 1
+        self.started = time.monotonic()
+
+    def frame(self):
+        if self.started is None:
+            return
+        seconds = time.monotonic() - self.started
+        self.started = None
+        self.connected_once = True
+        self.seconds[self.reason] = seconds
+        logging.info(f"{self.name}: first frame {seconds:.2f}s after {self.reason}")
+
+    def stats(self):
+        return dict({f'first_frame_{reason}': round(seconds, 3) if seconds is not None else None for reason, seconds in self.seconds.items()},
+                    reconnects=self.reconnects)
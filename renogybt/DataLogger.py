@@ -1,47 +1,81 @@
 import json
 import logging
 import requests
-import paho.mqtt.publish as publish
 from configparser import ConfigParser
 from datetime import datetime
 import uuid
+from .MQTTPublisher import MQTTPublisher
+from .RemoteBatcher import create_session, response_ok, REQUEST_TIMEOUT
+from .SinkWorker import TIMESTAMP_KEY
 
 PVOUTPUT_URL = 'http://pvoutput.org/service/r2/addstatus.jsp'
 
+# MQTT payload modes
+#  fields   => one retained `{topic}/{key}/state` message per field (default)
+#  document => one compact JSON document per frame on `{topic}`
+PAYLOAD_MODE_FIELDS = 'fields'
+PAYLOAD_MODE_DOCUMENT = 'document'
+
+def mqtt_payload_mode(config: ConfigParser):
+    if not config.has_section('mqtt'):
+        return PAYLOAD_MODE_FIELDS
+    return config['mqtt'].get('payload_mode', PAYLOAD_MODE_FIELDS).strip() or PAYLOAD_MODE_FIELDS
+
 class DataLogger:
     def __init__(self, config: ConfigParser):
         self.config = config
+        # topic/serializer tables are built once per device, not per message
+        self.mqtt_document = mqtt_payload_mode(config) == PAYLOAD_MODE_DOCUMENT
+        self.mqtt_state_topic = config['mqtt']['topic'] if config.has_section('mqtt') else ''
+        self.mqtt_field_topics = {}
+        self.mqtt_document_state = {} # last value of every field, deadband filtered frames only carry changes
+        self.encode_document = json.JSONEncoder(separators=(',', ':')).encode
+        self.remote_session = None # keep-alive session, created on first use
 
     def log_remote(self, json_data):
+        if self.remote_session is None:
+            self.remote_session = create_session(self.config['remote_logging'].getint('retries', fallback=3), self.config['remote_logging'].getfloat('backoff', fallback=0.5))
         headers = { "Authorization" : f"Bearer {self.config['remote_logging']['auth_header']}" }
-        req = requests.post(self.config['remote_logging']['url'], json = json_data, timeout=15, headers=headers)
-        logging.info("Log remote 200") if req.status_code == 200 else logging.error(f"Log remote error {req.status_code}")
+        req = self.remote_session.post(self.config['remote_logging']['url'], json = json_data, timeout=REQUEST_TIMEOUT, headers=headers)
+        if response_ok(req, "Log remote"): # raises SinkRejected for a 4xx: the sample is dropped, not spooled
+            logging.info(f"Log remote {req.status_code}")
+            return True
+        return False
 
     def log_mqtt(self, json_data):
-        logging.info(f"mqtt logging {json.dumps(json_data)}")
-        user = self.config['mqtt']['user']
-        password = self.config['mqtt']['password']
-        auth = None if not user or not password else {"username": user, "password": password}
-        base_topic = self.config['mqtt']['topic']
+        publisher = MQTTPublisher.get_instance(self.config)
 
+        timestamp = json_data.get(TIMESTAMP_KEY) # set on samples drained from a spool, not a field
+        if self.mqtt_document:
+            state = self.mqtt_document_state
+            state.update(json_data)
+            if timestamp is not None: # only the drained document carries it
+                del state[TIMESTAMP_KEY]
+                state = dict(state, **{TIMESTAMP_KEY: timestamp})
+            payload = self.encode_document(state)
+            logging.info(f"mqtt logging {payload}")
+            return publisher.publish(topic=self.mqtt_state_topic, payload=payload, retain=True)
+
+        logging.info(f"mqtt logging {json.dumps(json_data)}")
+        topics = self.mqtt_field_topics
         for key, value in json_data.items():
-            topic = f"{base_topic}/{key}/state"
-            publish.single(
-                topic=topic,
-                payload=str(value),
-                hostname=self.config['mqtt']['server'],
-                port=self.config['mqtt'].getint('port'),
-                auth=auth,
-                client_id=None,
-                retain=True
-            )
+            if key == TIMESTAMP_KEY:
+                continue
+            topic = topics.get(key)
+            if topic is None:
+                topic = topics[key] = f"{self.mqtt_state_topic}/{key}/state"
+            if not publisher.publish(topic=topic, payload=str(value), retain=True):
+                return False # broker unreachable, the rest would fail too
+        return True
 
     def log_pvoutput(self, json_data):
-        date_time = datetime.now().strftime("d=%Y%m%d&t=%H:%M")
+        timestamp = json_data.get(TIMESTAMP_KEY) # set on samples drained from a spool
+        date_time = (datetime.fromtimestamp(timestamp) if timestamp else datetime.now()).strftime("d=%Y%m%d&t=%H:%M")
         data = f"{date_time}&v1={json_data['power_generation_today']}&v2={json_data['pv_power']}&v3={json_data['power_consumption_today']}&v4={json_data['load_power']}&v5={json_data['controller_temperature']}&v6={json_data['battery_voltage']}"
-        response = requests.post(PVOUTPUT_URL, data=data, headers={
+        response = requests.post(PVOUTPUT_URL, data=data, timeout=15, headers={
             "Content-Type": "application/x-www-form-urlencoded",
             "X-Pvoutput-Apikey": self.config['pvoutput']['api_key'],
             "X-Pvoutput-SystemId":  self.config['pvoutput']['system_id']
         })
         print(f"pvoutput {response}")
+        return response_ok(response, "pvoutput")
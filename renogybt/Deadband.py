@@ -0,0 +1,54 @@
+import time
+
+# Change-only publishing: a field is only passed on when it moved by more than
+# its deadband since the value last sent, or when it has been silent for longer
+# than max_silence (heartbeat). Thresholds come from the [data] section, e.g.
+#   deadband_abs = discharge_amps:0.05, charge_battery_voltage:0.01, *:0
+#   deadband_rel = discharge_watts:0.02
+#   deadband_max_silence = 300
+# `*` sets the default for fields that are not listed. Non numeric fields pass on any change.
+
+def parse_thresholds(thresholds_str):
+    thresholds = {}
+    for item in thresholds_str.split(','):
+        if ':' not in item:
+            continue
+        key, value = item.split(':', 1)
+        thresholds[key.strip()] = float(value)
+    return thresholds
+
+class DeadbandFilter:
+    def __init__(self, abs_thresholds = None, rel_thresholds = None, max_silence = 300, clock = time.monotonic):
+        self.abs_thresholds = abs_thresholds or {}
+        self.rel_thresholds = rel_thresholds or {}
+        self.max_silence = max_silence # seconds, 0 disables the heartbeat
+        self.default_abs = self.abs_thresholds.get('*', 0)
+        self.default_rel = self.rel_thresholds.get('*', 0)
+        self.last_sent = {} # key => [value, monotonic time sent]
+        self.clock = clock
+
+    @classmethod
+    def from_config(cls, config, clock = time.monotonic):
+        return cls(abs_thresholds=parse_thresholds(config['data'].get('deadband_abs', '')),
+                   rel_thresholds=parse_thresholds(config['data'].get('deadband_rel', '')),
+                   max_silence=config['data'].getfloat('deadband_max_silence', 300),
+                   clock=clock)
+
+    def apply(self, data):
+        # returns only the fields that should go out, empty when nothing changed
+        now = self.clock()
+        changed = {}
+        for key, value in data.items():
+            last = self.last_sent.get(key)
+            if last is None or self.__has_changed(key, last[0], value) or (self.max_silence and now - last[1] >= self.max_silence):
+                changed[key] = value
+                self.last_sent[key] = [value, now]
+        return changed
+
+    def __has_changed(self, key, last_value, value):
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not isinstance(last_value, (int, float)):
+            return value != last_value
+        threshold = max(self.abs_thresholds.get(key, self.default_abs),
+                        self.rel_thresholds.get(key, self.default_rel) * abs(last_value))
+        delta = abs(value - last_value)
+        return delta > threshold if threshold > 0 else delta != 0
@@ -1,20 +1,55 @@
+import time
+import asyncio
 import logging
 import configparser
 import threading
 from dotenv import load_dotenv
-from renogybt import ShuntClient, InverterClient, RoverClient, RoverHistoryClient, BatteryClient, DataLogger, Utils, RateLimiter
+from renogybt import ShuntClient, InverterClient, RoverClient, RoverHistoryClient, BatteryClient, DataLogger, Utils, RateLimiter, AggregatingRateLimiter, DeadbandFilter
+from renogybt.MQTTPublisher import MQTTPublisher
+from renogybt.DataLogger import mqtt_payload_mode, PAYLOAD_MODE_DOCUMENT
+from renogybt.Backends import backend_name, BACKEND_BLEAK
+from renogybt.SinkWorker import SinkWorker, sink_settings, spool_settings
+from renogybt.RemoteBatcher import RemoteBatcher
+from renogybt.LocalStore import LocalStore
+from renogybt import History
+from renogybt.EnergyIntegrator import EnergyIntegrator
+from renogybt.RuntimeEstimator import RuntimeEstimator
 
 # logging.basicConfig(level=logging.DEBUG)
 
 class DeviceInstance:
-    def __init__(self, config: configparser.ConfigParser):
+    def __init__(self, config: configparser.ConfigParser, clock = None):
+        # clock: optional time source for the pipeline, e.g. recorded frame time when replaying
         self.config = config
+        self.clock = clock or time.time
         self.data_logger: DataLogger = DataLogger(config)
         self.device_inst: ShuntClient | RoverClient | InverterClient = None
         self._stop_event = threading.Event()
         self._initialized_event = threading.Event()  # Event to signal device initialization
-        self.rate_limiter = RateLimiter(interval=config['data'].getint('rate_interval')) if config['data'].getboolean('enable_rate_limiter') == True else None # Process every X seconds
-
+        self.fields = Utils.parse_fields(config['data']['fields'])
+        self.rate_limiter = None
+        self.aggregator = None
+        if config['data'].getboolean('enable_rate_limiter') == True:
+            if config['data'].get('rate_mode', 'drop').strip() == 'aggregate':
+                self.aggregator = AggregatingRateLimiter(interval=config['data'].getint('rate_interval'), # Emit stats of all frames every X seconds
+                                                         fields=Utils.parse_fields(config['data'].get('aggregate_fields', '')), clock=clock or time.time)
+            else:
+                self.rate_limiter = RateLimiter(interval=config['data'].getint('rate_interval'), clock=clock or time.time) # Process every X seconds
+        self.deadband = DeadbandFilter.from_config(config, clock=clock or time.monotonic) if config['data'].getboolean('enable_deadband', False) == True else None # Only publish changed fields
+        self.remote_batcher = None
+        self.local_store = None
+        self.sinks = self.create_sinks() # name => SinkWorker, the BLE thread only enqueues
+        self.energy = None # Ah/Wh integration of every shunt frame
+        if config.has_section('energy') and config['energy'].getboolean('enabled') and config['device']['type'] == 'RNG_SHNT':
+            self.energy = EnergyIntegrator.from_config(config, clock=clock or time.monotonic, wall_clock=clock or time.time)
+        self.runtime = None # time_remaining / time_to_full from every shunt frame
+        if config.has_section('runtime') and config['runtime'].getboolean('enabled') and config['device']['type'] == 'RNG_SHNT':
+            self.runtime = RuntimeEstimator.from_config(config, clock=clock or time.monotonic)
+        self.history = None # recent readings kept in memory for api.py
+        if config.has_section('history') and config['history'].getboolean('enabled'):
+            self.history = History.get_history(config['device']['mac_addr'], config['history'].getint('capacity', fallback=History.DEFAULT_CAPACITY))
+        if self.local_store:
+            History.register_store(config['device']['mac_addr'], self.local_store)
         
     def stop(self):
         self._stop_event.set()
@@ -24,48 +59,115 @@ class DeviceInstance:
             self._initialized_event.wait()
             
         if self.device_inst:
-            logging.info(msg=f"Disconnecting from devive '{self.device_inst.manager.mac_address}' ...")
+            logging.info(msg=f"Disconnecting from devive '{self.config['device']['mac_addr']}' ...")
             self.device_inst.disconnect()
         else:
             logging.error(msg="Device instance does not exists. Try connecting the device.")
+        self.stop_sinks()
     
-    def run(self):        
-        # the callback func when you receive data
-        def on_data_received(client, data):
-            if self.rate_limiter:
-                if not self.rate_limiter.should_process(): return # skips message until interval has elapsed
-            
-            filtered_data = Utils.filter_fields(data, self.config['data']['fields'])
-            logging.debug("{} => {}".format(client.device.alias(), filtered_data))
-            if self.config['remote_logging'].getboolean('enabled'):
-                self.data_logger.log_remote(json_data=filtered_data)
-            if self.config['mqtt'].getboolean('enabled'):
-                self.data_logger.log_mqtt(json_data=filtered_data)
-            if self.config['pvoutput'].getboolean('enabled') and self.config['device']['type'] == 'RNG_CTRL':
-                self.data_logger.log_pvoutput(json_data=filtered_data)
-            if not self.config['data'].getboolean('enable_polling') and not self.config['data'].getboolean('enable_rate_limiter'):
-                logging.info(msg="Enable device polling or rate limiter to continue...")
-                # self.stop()
-
-        # error callback
-        def on_error(client, error):
-            logging.error(f"on_error: {error}")
+    # the callback func when you receive data
+    # data is the client's record, reused for its next frame: up to the rate limiter
+    # it is only updated in place, whatever is kept or queued past it is a copy
+    def on_data_received(self, client, data):
+        if self.energy:
+            self.energy.add(data) # every frame, before rate limiting
+        if self.runtime:
+            self.runtime.add(data)
+        if self.rate_limiter:
+            if not self.rate_limiter.should_process(): return # skips message until interval has elapsed
 
-        # start client
+        if self.aggregator: # every frame, duplicates the shunt client did not decode again included
+            filtered_data = self.aggregator.add(data if not self.fields else Utils.project_fields(data, self.fields)) # only reads it
+            if filtered_data is None: return # folded into the current window
+        else:
+            filtered_data = Utils.project_fields(data, self.fields)
+        if self.history:
+            self.history.add(self.clock(), filtered_data)
+        logging.debug("{} => {}".format(client.device.alias(), filtered_data))
+        for name, sink in self.sinks.items():
+            if name == 'mqtt' and self.deadband:
+                changed = self.deadband.apply(filtered_data) # MQTT only gets the fields that moved
+                if changed: sink.submit(changed)
+            else:
+                sink.submit(filtered_data) # the full record: pvoutput, remote and local need every field
+        if not self.config['data'].getboolean('enable_polling') and not self.config['data'].getboolean('enable_rate_limiter'):
+            logging.info(msg="Enable device polling or rate limiter to continue...")
+            # self.stop()
+
+    def create_sinks(self):
+        sinks = {}
+        closers = {}
+        if self.config['remote_logging'].getboolean('enabled'):
+            if self.config['remote_logging'].getint('batch_size', fallback=1) > 1:
+                self.remote_batcher = RemoteBatcher(self.config)
+                sinks['remote'] = self.remote_batcher.add
+                closers['remote'] = self.remote_batcher.close
+            else:
+                sinks['remote'] = self.data_logger.log_remote
+        if self.config['mqtt'].getboolean('enabled'):
+            sinks['mqtt'] = self.data_logger.log_mqtt
+        if self.config['pvoutput'].getboolean('enabled') and self.config['device']['type'] == 'RNG_CTRL':
+            sinks['pvoutput'] = self.data_logger.log_pvoutput
+        if self.config.has_section('local_store') and self.config['local_store'].getboolean('enabled'):
+            self.local_store = LocalStore(self.config)
+            sinks['local'] = self.local_store.add
+            closers['local'] = self.local_store.close
+        workers = {name: SinkWorker(name, sink, *sink_settings(self.config, name), close=closers.get(name),
+                                    batch=self.remote_batcher if name == 'remote' else None, **spool_settings(self.config, name))
+                   for name, sink in sinks.items()}
+        if self.remote_batcher:
+            self.remote_batcher.on_failed = workers['remote'].spool_samples
+        return workers
+
+    def stop_sinks(self, timeout = 5):
+        # drain and end the sink workers, returns their counters
+        if self.energy:
+            self.energy.close()
+        stats = {}
+        for name, sink in self.sinks.items():
+            sink.stop(timeout)
+            stats[name] = sink.stats()
+            if name == 'remote' and self.remote_batcher:
+                stats[name].update(self.remote_batcher.stats())
+            if name == 'local':
+                stats[name].update(self.local_store.stats())
+            logging.info(f"sink {name} => {stats[name]}")
+        return stats
+
+    def sink_stats(self):
+        return {name: sink.stats() for name, sink in self.sinks.items()}
+
+    def stats(self):
+        # frame counters (shunt: duplicate skip ratio) or read timing (Modbus devices) of the client, its time to
+        # first frame at startup / after reconnects, and the sinks
+        frames = self.device_inst.frame_stats() if self.device_inst and hasattr(self.device_inst, 'frame_stats') else None
+        reads = self.device_inst.read_stats() if self.device_inst and hasattr(self.device_inst, 'read_stats') else None
+        connect = self.device_inst.connect_stats() if self.device_inst and hasattr(self.device_inst, 'connect_stats') else None
+        return {'frames': frames, 'reads': reads, 'connect': connect, 'sinks': self.sink_stats()}
+
+    # error callback
+    def on_error(self, client, error):
+        logging.error(f"on_error: {error}")
+
+    def create_client(self):
         if self.config['device']['type'] == 'RNG_CTRL':
-            self.device_inst = RoverClient(self.config, on_data_received, on_error)
-            self._initialized_event.set()  # Signal that the device is ready
-            self.device_inst.connect()
+            return RoverClient(self.config, self.on_data_received, self.on_error)
         elif self.config['device']['type'] == 'RNG_SHNT':
-            self.device_inst = ShuntClient(self.config, on_data_received, on_error)
-            self._initialized_event.set()  # Signal that the device is ready
-            self.device_inst.connect()
+            return ShuntClient(self.config, self.on_data_received, self.on_error)
         # elif self.config['device']['type'] == 'RNG_CTRL_HIST':
-        #     self.device_inst = RoverHistoryClient(self.config, on_data_received, on_error).connect()
+        #     return RoverHistoryClient(self.config, self.on_data_received, self.on_error)
         # elif self.config['device']['type'] == 'RNG_BATT':
-        #     self.device_inst = BatteryClient(self.config, on_data_received, on_error).connect()
+        #     return BatteryClient(self.config, self.on_data_received, self.on_error)
         elif self.config['device']['type'] == 'RNG_INVT':
-            self.device_inst = InverterClient(self.config, on_data_received, on_error)
+            return InverterClient(self.config, self.on_data_received, self.on_error)
+        return None
+
+    def run(self):
+        if backend_name(self.config) == BACKEND_BLEAK:
+            return asyncio.run(self.run_async())
+        # start client
+        self.device_inst = self.create_client()
+        if self.device_inst:
             self._initialized_event.set()  # Signal that the device is ready
             self.device_inst.connect()
         else:
@@ -73,9 +175,31 @@ class DeviceInstance:
         if self.config['mqtt'].getboolean('enabled'):
             self.publish_discovery_messages()
 
+    def start(self, manager):
+        # run on a DeviceManager shared with other devices (see Supervisor), returns right away
+        self.device_inst = self.create_client()
+        if self.device_inst is None:
+            logging.error("unknown device type")
+            return False
+        self._initialized_event.set()
+        self.device_inst.start(manager)
+        if self.config['mqtt'].getboolean('enabled'):
+            self.publish_discovery_messages()
+        return True
+
+    async def run_async(self):
+        # bleak backend: same callbacks and pipeline, the client runs on the current event loop
+        from renogybt.AsyncClients import create_async_client
+        self.device_inst = create_async_client(self.config, self.on_data_received, self.on_error)
+        self._initialized_event.set()
+        if self.device_inst is None:
+            return logging.error("unknown device type")
+        if self.config['mqtt'].getboolean('enabled'):
+            self.publish_discovery_messages()
+        await self.device_inst.connect()
+
     def publish_discovery_messages(self):
         import json
-        import paho.mqtt.publish as publish
         discovery_base = "homeassistant/sensor"
         sensor_configs = {
             "charge_battery_voltage": {
@@ -114,30 +238,34 @@ class DeviceInstance:
                 "device_class": "percentage"
             },
         }
+        if self.runtime:
+            sensor_configs["time_remaining"] = {
+                "name": "Time Remaining",
+                "unit": "min",
+                "device_class": "duration"
+            }
+            sensor_configs["time_to_full"] = {
+                "name": "Time To Full",
+                "unit": "min",
+                "device_class": "duration"
+            }
 
-        def _get_auth():
-            user = self.config['mqtt']['user']
-            password = self.config['mqtt']['password']
-            return None if not user or not password else {"username": user, "password": password}
+        publisher = MQTTPublisher.get_instance(self.config)
+        document = mqtt_payload_mode(self.config) == PAYLOAD_MODE_DOCUMENT
+        base_topic = self.config['mqtt']['topic']
+        device_name = self.config['device'].get('name', '') # set per device by the Supervisor
+        id_prefix = f"renogy_{device_name}_" if device_name else "renogy_"
 
         for key, cfg in sensor_configs.items():
-            topic = f"{discovery_base}/renogy_{key}/config"
+            topic = f"{discovery_base}/{id_prefix}{key}/config"
             payload = {
-                "name": cfg["name"],
-                "state_topic": self.config['mqtt']['topic'],
-                "value_template": f"{{{{ value_json.{key} }}}}",
+                "name": f"{device_name} {cfg['name']}" if device_name else cfg["name"],
+                "state_topic": base_topic if document else f"{base_topic}/{key}/state",
+                "value_template": f"{{{{ value_json.{key} }}}}" if document else "{{ value }}",
                 "unit_of_measurement": cfg["unit"],
                 "device_class": cfg["device_class"],
-                "unique_id": f"renogy_{key}"
+                "unique_id": f"{id_prefix}{key}"
             }
 
-            publish.single(
-                topic,
-                payload=json.dumps(payload),
-                hostname=self.config['mqtt']['server'],
-                port=self.config['mqtt'].getint('port'),
-                auth=_get_auth(),
-                client_id=None,
-                retain=True
-            )
+            publisher.publish(topic, payload=json.dumps(payload), retain=True)
             logging.info(f"Published discovery config for {cfg['name']}")
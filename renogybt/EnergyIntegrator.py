@@ -0,0 +1,148 @@
+import os
+import json
+import time
+import logging
+from datetime import date, datetime, timedelta
+
+# Coulomb counting / energy integration for the shunt, fed with every frame
+# before rate limiting (DeviceInstance.on_data_received). discharge_amps and
+# discharge_watts are integrated with the trapezoidal rule over monotonic time;
+# positive values count as charge in, negative as discharge out, an interval
+# that crosses zero is split where it crosses. O(1) per frame.
+#
+# Fields added to every frame (totals since the state file was created, and
+# since local midnight):
+#   ah_in_total, ah_out_total, wh_in_total, wh_out_total, wh_net_total
+#   ah_in_today, ah_out_today, wh_in_today, wh_out_today, wh_net_today
+#
+# Gaps longer than max_gap (disconnects, restarts) are not integrated. The
+# totals are saved atomically to state_path every save_interval seconds and on
+# close(), and restored on start.
+
+AMPS_KEY = 'discharge_amps'
+WATTS_KEY = 'discharge_watts'
+COUNTERS = ('ah_in', 'ah_out', 'wh_in', 'wh_out')
+
+def split_trapezoid(a, b, dt):
+    # (positive, negative) area under a straight line from a to b over dt
+    if a >= 0 and b >= 0:
+        return (a + b) * dt / 2, 0.0
+    if a <= 0 and b <= 0:
+        return 0.0, -(a + b) * dt / 2
+    crossing = dt * a / (a - b) # time of the zero crossing
+    if a > 0:
+        return a * crossing / 2, -b * (dt - crossing) / 2
+    return b * (dt - crossing) / 2, -a * crossing / 2
+
+def day_bounds(timestamp):
+    # (iso date, start, end) of the local day containing timestamp
+    day = date.fromtimestamp(timestamp)
+    start = datetime.combine(day, datetime.min.time()).timestamp()
+    end = datetime.combine(day + timedelta(days=1), datetime.min.time()).timestamp()
+    return day.isoformat(), start, end
+
+class EnergyIntegrator:
+    def __init__(self, state_path = None, max_gap = 30, save_interval = 60, clock = time.monotonic, wall_clock = time.time):
+        self.state_path = state_path
+        self.max_gap = max_gap
+        self.save_interval = save_interval
+        self.clock = clock
+        self.wall_clock = wall_clock
+        self.total = dict.fromkeys(COUNTERS, 0.0)
+        self.today = dict.fromkeys(COUNTERS, 0.0)
+        self.day, self.day_start, self.day_end = day_bounds(wall_clock())
+        self.last = None # (t, amps, watts)
+        self.last_saved = clock()
+        self.load()
+
+    @classmethod
+    def from_config(cls, config, clock = time.monotonic, wall_clock = time.time):
+        section = config['energy']
+        return cls(state_path=section.get('state_path', 'energy_state.json').strip() or None,
+                   max_gap=section.getfloat('max_gap', fallback=30),
+                   save_interval=section.getfloat('save_interval', fallback=60),
+                   clock=clock, wall_clock=wall_clock)
+
+    def add(self, data):
+        # integrate one frame and write the energy fields into it (in place)
+        amps = data.get(AMPS_KEY)
+        watts = data.get(WATTS_KEY)
+        now = self.clock()
+        if amps is None or watts is None:
+            return data
+        self.integrate(now, amps, watts)
+        return self.write_fields(data)
+
+    def integrate(self, now, amps, watts):
+        wall = self.wall_clock()
+        if not self.day_start <= wall < self.day_end: # the date is only looked up again at midnight
+            day, self.day_start, self.day_end = day_bounds(wall)
+            if day != self.day:
+                logging.info(f"EnergyIntegrator: {self.day} => {self.fields_today()}")
+                self.day = day
+                self.today = dict.fromkeys(COUNTERS, 0.0)
+        last = self.last
+        if last is not None and 0 < now - last[0] <= self.max_gap:
+            hours = (now - last[0]) / 3600
+            ah_in, ah_out = split_trapezoid(last[1], amps, hours)
+            wh_in, wh_out = split_trapezoid(last[2], watts, hours)
+            for counters in (self.total, self.today):
+                counters['ah_in'] += ah_in
+                counters['ah_out'] += ah_out
+                counters['wh_in'] += wh_in
+                counters['wh_out'] += wh_out
+        self.last = (now, amps, watts)
+        if self.state_path and now - self.last_saved >= self.save_interval:
+            self.save()
+
+    def fields_today(self):
+        return self.write_today({})
+
+    def fields(self):
+        return self.write_fields({})
+
+    def write_fields(self, data):
+        total = self.total
+        data['ah_in_total'] = round(total['ah_in'], 4)
+        data['ah_out_total'] = round(total['ah_out'], 4)
+        data['wh_in_total'] = round(total['wh_in'], 3)
+        data['wh_out_total'] = round(total['wh_out'], 3)
+        data['wh_net_total'] = round(total['wh_in'] - total['wh_out'], 3)
+        return self.write_today(data)
+
+    def write_today(self, data):
+        today = self.today
+        data['ah_in_today'] = round(today['ah_in'], 4)
+        data['ah_out_today'] = round(today['ah_out'], 4)
+        data['wh_in_today'] = round(today['wh_in'], 3)
+        data['wh_out_today'] = round(today['wh_out'], 3)
+        data['wh_net_today'] = round(today['wh_in'] - today['wh_out'], 3)
+        return data
+
+    def load(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+            self.total.update({key: float(state['total'][key]) for key in COUNTERS})
+            if state.get('day') == self.day:
+                self.today.update({key: float(state['today'][key]) for key in COUNTERS})
+            logging.info(f"EnergyIntegrator: restored {self.fields()} from {self.state_path}")
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logging.error(f"EnergyIntegrator: could not read {self.state_path}: {e}")
+
+    def save(self):
+        self.last_saved = self.clock()
+        if not self.state_path:
+            return
+        state = {'day': self.day, 'total': self.total, 'today': self.today}
+        try:
+            with open(self.state_path + '.tmp', 'w') as f:
+                json.dump(state, f)
+            os.replace(self.state_path + '.tmp', self.state_path)
+        except OSError as e:
+            logging.error(f"EnergyIntegrator: could not write {self.state_path}: {e}")
+
+    def close(self):
+        self.save()
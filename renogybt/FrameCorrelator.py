@@ -0,0 +1,258 @@
+import csv
+import logging
+from .FrameRecorder import FrameReader, recording_files, mac_to_bytes
+
+# Locates undecoded fields in recorded frames. Every candidate field, i.e. every
+# byte offset, width 1..4 and signedness (big-endian, like the register maps),
+# is scored over the whole corpus:
+#   r         Pearson correlation with each reference measurement
+#   slope     least squares scale from the raw value to the reference (Field scale=)
+#   monotonic (rises - falls) / changes between consecutive frames, +-1 = counter
+#   entropy   sum of the Shannon entropies (bits) of the candidate's bytes, 0 = constant
+#   changes   fraction of consecutive frames where the value changed
+# Reference measurements come from a CSV file with a `time` column (unix seconds)
+# and one column per quantity (thermometer, consumed Ah from the app, ...); they
+# are interpolated linearly to the frame times and frames outside their span are
+# left out of the correlation.
+#
+# The corpus is reduced chunk by chunk to byte level sums (one matrix product
+# per chunk, see ByteStatistics), from which the scores of all candidates follow
+# without materializing any candidate column, so memory stays flat for any
+# corpus size and millions of frames take seconds.
+# NumPy is only needed here (see BatchDecoder):
+#   python3 -m pip install numpy
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+WIDTHS = (1, 2, 3, 4)
+CHUNK_FRAMES = 65536
+MIN_CHANGES = 1e-4 # candidates that (almost) never change are not ranked
+
+def load_corpus(path, length = 110, mac_address = None):
+    # (wall clock times, frames x length uint8 matrix) of every recorded frame of
+    # that length, rotated files included, optionally of one device only
+    if np is None:
+        raise ImportError("FrameCorrelator requires numpy: python3 -m pip install numpy")
+    mac = np.frombuffer(mac_to_bytes(mac_address), dtype=np.uint8) if mac_address else None
+    times, frames = [], []
+    for file in recording_files(path):
+        reader = FrameReader(file)
+        try:
+            file_times, file_frames, macs = reader.entry_times(length), reader.payload_matrix(length), reader.entry_macs(length)
+        except ValueError: # mixed frame lengths, walk the entries
+            selected = [(frame.timestamp_ns, bytes(frame.payload)) for frame in reader
+                        if len(frame.payload) == length and (mac_address is None or frame.mac == mac_address.upper())]
+            file_times = (reader.wall_ns + (np.array([t for t, _ in selected], dtype=np.int64) - reader.monotonic_ns)) / 1e9
+            file_frames = np.frombuffer(b''.join(payload for _, payload in selected), dtype=np.uint8).reshape(-1, length)
+            macs = None
+        if mac is not None and macs is not None:
+            keep = (macs == mac).all(axis=1)
+            file_times, file_frames = file_times[keep], file_frames[keep]
+        times.append(np.array(file_times))
+        frames.append(np.array(file_frames)) # copied out of the mmap
+        reader.close()
+    if not frames:
+        return np.empty(0), np.empty((0, length), dtype=np.uint8)
+    return np.concatenate(times), np.concatenate(frames)
+
+def load_references(path, times):
+    # {name: reference values at `times`, NaN outside the measured span}
+    with open(path, newline='') as f:
+        rows = list(csv.DictReader(f))
+    if not rows or 'time' not in rows[0]:
+        raise ValueError(f"{path}: expected a CSV file with a 'time' column")
+    references = {}
+    for name in rows[0]:
+        if name == 'time':
+            continue
+        points = sorted((float(row['time']), float(row[name])) for row in rows if row.get(name) not in (None, ''))
+        if len(points) < 2:
+            logging.warning(f"{path}: '{name}' has fewer than 2 values, skipped")
+            continue
+        ts, values = np.array(points).T
+        references[name] = np.interp(times, ts, values, left=np.nan, right=np.nan)
+    return references
+
+def candidate_values(frames, width, signed):
+    # (frames x offsets) int64 matrix of the field of `width` bytes at every offset
+    count = frames.shape[1] - width + 1
+    raw = frames[:, :count].astype(np.int64)
+    for i in range(1, width):
+        raw = (raw << 8) | frames[:, i:i + count]
+    if signed:
+        raw -= (raw >> (8 * width - 1)) << (8 * width)
+    return raw
+
+def value_range(frames, candidate):
+    # (min, max) of a candidate's raw value over the corpus
+    low, high = None, None
+    for start in range(0, len(frames), CHUNK_FRAMES):
+        chunk = frames[start:start + CHUNK_FRAMES, candidate['offset']:candidate['offset'] + candidate['width']]
+        values = candidate_values(chunk, candidate['width'], candidate['signed'])[:, 0]
+        low = values.min() if low is None else min(low, values.min())
+        high = values.max() if high is None else max(high, values.max())
+    return int(low), int(high)
+
+class ByteStatistics:
+    # Sums over the corpus from which every candidate's scores follow exactly.
+    # A candidate is a linear combination of byte columns b and top bit columns h:
+    #   unsigned: x = sum(256^(width-1-i) * b[offset + i])
+    #   signed:   x = unsigned - 2^(8 * width) * h[offset]
+    # so var(x) = k' C k and cov(x, y) = k' C_y with C the covariance of [b, h] and
+    # k the candidate's coefficients; one Gram matrix of [b, h, 1, y] per chunk
+    # holds all of it. The byte sums are integers and stay exact in float64.
+    #
+    # Monotonicity needs the sign of x[t] - x[t-1]: the sign of the first byte of
+    # the candidate that changed. Only bytes that did change are visited; a change
+    # at byte `col` with the previous change of that frame `gap` bytes before it
+    # is the first change of the candidates starting at col - k for k < gap.
+    def __init__(self, offsets, refs, widths = WIDTHS):
+        self.offsets = offsets
+        self.refs = refs
+        self.widths = widths
+        self.gram = np.zeros((2 * offsets + 1 + refs, 2 * offsets + 1 + refs))
+        self.frames = 0
+        self.high_bits = np.zeros(offsets, dtype=np.int64)
+        self.byte_counts = np.zeros((offsets, 256), dtype=np.int64)
+        self.ref_base = None # first reference values, keeps their sums well conditioned
+        self.previous = None
+        self.rises = np.zeros((max(widths), offsets), dtype=np.int64) # [k, col - k]: first change k bytes into the candidate
+        self.falls = np.zeros((max(widths), offsets), dtype=np.int64)
+        self.signed_rises = np.zeros(offsets, dtype=np.int64) # k = 0 with the top byte read as signed
+        self.signed_falls = np.zeros(offsets, dtype=np.int64)
+
+    def add(self, chunk, references, valid):
+        offsets = self.offsets
+        high = chunk >= 128
+        self.frames += len(chunk)
+        self.high_bits += high.sum(axis=0)
+        for offset in range(offsets):
+            self.byte_counts[offset] += np.bincount(chunk[:, offset], minlength=256)
+        if valid.any():
+            rows = len(chunk) if valid.all() else int(valid.sum())
+            columns = np.empty((rows, self.gram.shape[0]))
+            columns[:, :offsets] = chunk if rows == len(chunk) else chunk[valid]
+            columns[:, offsets:2 * offsets] = high if rows == len(chunk) else high[valid]
+            columns[:, 2 * offsets] = 1
+            columns[:, 2 * offsets + 1:] = references if rows == len(chunk) else references[valid]
+            if self.ref_base is None:
+                self.ref_base = columns[0, 2 * offsets + 1:].copy()
+            columns[:, 2 * offsets + 1:] -= self.ref_base
+            self.gram += columns.T @ columns
+        self.__add_steps(chunk)
+
+    def __add_steps(self, chunk):
+        offsets = self.offsets
+        rows = np.ascontiguousarray(chunk if self.previous is None else np.vstack([self.previous, chunk]))
+        self.previous = chunk[-1:]
+        if len(rows) < 2:
+            return
+        changed = np.flatnonzero(np.diff(rows.astype(np.int16), axis=0)) # flat index of the byte before the change
+        flat = rows.ravel()
+        before, after = flat[changed], flat[changed + offsets]
+        col = changed % offsets
+        rising = after > before
+        gap = np.minimum(np.diff(changed, prepend=-offsets), col + 1) # col + 1 when first in its frame
+        for k in range(len(self.rises)):
+            first = gap > k
+            starts = col[first] - k
+            counts = np.bincount(starts + offsets * rising[first], minlength=2 * offsets)
+            self.falls[k] += counts[:offsets]
+            self.rises[k] += counts[offsets:]
+        counts = np.bincount(col + offsets * (after.view(np.int8) > before.view(np.int8)), minlength=2 * offsets)
+        self.signed_falls += counts[:offsets]
+        self.signed_rises += counts[offsets:]
+
+    def steps(self, width, signed):
+        # (rises - falls, changes) of every candidate of that width
+        count = self.offsets - width + 1
+        rises = self.rises[1:width, :count].sum(axis=0) + (self.signed_rises if signed else self.rises[0])[:count]
+        falls = self.falls[1:width, :count].sum(axis=0) + (self.signed_falls if signed else self.falls[0])[:count]
+        return rises - falls, rises + falls
+
+    def entropy(self):
+        p = self.byte_counts / max(self.frames, 1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return -np.where(p > 0, p * np.log2(p), 0).sum(axis=1)
+
+    def coefficients(self, width, signed):
+        # (2 * offsets x candidates) coefficients of every candidate of that width
+        count = self.offsets - width + 1
+        k = np.zeros((2 * self.offsets, count))
+        candidates = np.arange(count)
+        for i in range(width):
+            k[candidates + i, candidates] = 256.0 ** (width - 1 - i)
+        if signed:
+            k[self.offsets + candidates, candidates] = -(2.0 ** (8 * width))
+        return k
+
+    def scores(self, width, signed):
+        # (r, slope) matrices, candidates x references
+        count = self.offsets - width + 1
+        bytes_end = 2 * self.offsets
+        n = self.gram[bytes_end, bytes_end]
+        if n < 2 or not self.refs:
+            return np.full((count, self.refs), np.nan), np.full((count, self.refs), np.nan)
+        sums = self.gram[bytes_end]
+        # covariance of the byte columns from exact integer sums (n * sum(ab) - sum(a) * sum(b))
+        g = self.gram[:bytes_end, :bytes_end].astype(np.int64).astype(object)
+        s = sums[:bytes_end].astype(np.int64).astype(object)
+        covariance = ((g * int(n) - np.outer(s, s)) / (n * n)).astype(np.float64)
+        covariance_y = (self.gram[:bytes_end, bytes_end + 1:] - np.outer(sums[:bytes_end], sums[bytes_end + 1:]) / n) / n
+        var_y = (np.diag(self.gram)[bytes_end + 1:] - sums[bytes_end + 1:] ** 2 / n) / n
+        k = self.coefficients(width, signed)
+        var_x = ((covariance @ k) * k).sum(axis=0)
+        cov = k.T @ covariance_y
+        with np.errstate(divide='ignore', invalid='ignore'):
+            r = cov / np.sqrt(np.outer(var_x, var_y))
+            slope = cov / var_x[:, None]
+        spread = np.abs(k).T @ np.sqrt(np.maximum(np.diag(covariance), 0))
+        constant = var_x <= 1e-12 * spread * spread # nothing but rounding left
+        r[constant] = np.nan
+        slope[constant] = np.nan
+        return np.clip(r, -1, 1), slope
+
+def correlate(frames, references = None, widths = WIDTHS):
+    # one dict per candidate (offset, width, signed) with the scores described above
+    references = references or {}
+    names = list(references)
+    reference_matrix = np.column_stack([references[name] for name in names]) if names else np.empty((len(frames), 0))
+    valid = ~np.isnan(reference_matrix).any(axis=1) if names else np.zeros(len(frames), dtype=bool)
+    offsets = frames.shape[1]
+    stats = ByteStatistics(offsets, len(names), widths)
+    for start in range(0, len(frames), CHUNK_FRAMES):
+        stats.add(frames[start:start + CHUNK_FRAMES], reference_matrix[start:start + CHUNK_FRAMES], valid[start:start + CHUNK_FRAMES])
+    entropy = stats.entropy()
+    transitions = max(stats.frames - 1, 1)
+    candidates = []
+    for width in widths:
+        for signed in (False, True):
+            r, slope = stats.scores(width, signed)
+            net, changes = stats.steps(width, signed)
+            for offset in range(offsets - width + 1):
+                if signed and not stats.high_bits[offset]:
+                    continue # high bit never set, same as unsigned
+                candidate = {'offset': offset, 'width': width, 'signed': signed,
+                             'changes': float(changes[offset] / transitions),
+                             'monotonic': float(net[offset] / changes[offset]) if changes[offset] else 0.0,
+                             'entropy': float(entropy[offset:offset + width].sum())}
+                for index, name in enumerate(names):
+                    candidate[f'r_{name}'] = float(r[offset, index])
+                    candidate[f'slope_{name}'] = float(slope[offset, index])
+                candidates.append(candidate)
+    return candidates
+
+def rank(candidates, reference = None, top = 10):
+    # best candidates for a reference by |r|, or counter-like ones (|monotonic|)
+    # without one; narrower and unsigned fields win ties
+    moving = [c for c in candidates if c['changes'] >= MIN_CHANGES]
+    if reference:
+        key = f'r_{reference}'
+        scored = [c for c in moving if c.get(key) == c.get(key)] # drop NaN
+        scored.sort(key=lambda c: (-abs(c[key]), c['width'], c['signed'], c['offset']))
+    else:
+        scored = sorted(moving, key=lambda c: (-round(abs(c['monotonic']), 4), -c['entropy'], c['width'], c['signed'], c['offset']))
+    return scored[:top]
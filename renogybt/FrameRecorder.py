@@ -0,0 +1,208 @@
+import os
+import mmap
+import time
+import uuid
+import atexit
+import struct
+import logging
+import threading
+from collections import deque, namedtuple
+
+# Records every raw notify/response frame handed to BLE.Device.characteristic_value_updated
+# into a rotating binary log, for later batch decoding (see BatchDecoder) and replay.
+#
+# File layout (little endian):
+#   header  32 bytes: magic 'RNGFRAME', version u16, 6 reserved bytes, wall clock ns u64, monotonic ns u64
+#   entry   32 byte header: monotonic ns u64, payload length u16, mac 6 bytes, characteristic uuid 16 bytes
+#           followed by the payload, padded to a multiple of 8 bytes
+# Every entry starts 8-byte aligned, so the file can be read zero-copy through mmap.
+#
+# Every recorder starts a new file, the one left by an earlier run becomes '<path>.1'.
+# The BLE callback only appends to an in-memory queue, a writer thread does all disk I/O.
+
+MAGIC = b'RNGFRAME'
+VERSION = 1
+FILE_HEADER = struct.Struct('<8sH6xQQ')
+ENTRY_HEADER = struct.Struct('<QH6s16s')
+ALIGNMENT = 8
+FLUSH_INTERVAL = 0.5 # (seconds)
+MAX_PENDING = 100000 # frames held in memory if the disk falls behind, oldest are dropped
+
+Frame = namedtuple('Frame', ['timestamp_ns', 'mac', 'uuid', 'payload'])
+
+def padded_length(length):
+    return (length + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+def mac_to_bytes(mac_address):
+    return bytes.fromhex(mac_address.replace(':', ''))
+
+def bytes_to_mac(bs):
+    return ':'.join(f'{b:02X}' for b in bs)
+
+class FrameRecorder:
+    def __init__(self, path, max_bytes = 64 * 1024 * 1024, max_files = 5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.pending = deque(maxlen=MAX_PENDING)
+        self.frames_recorded = 0
+        self.frames_dropped = 0
+        self.file = None
+        self.file_size = 0
+        self._uuid_cache = {}
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = threading.Thread(target=self.__run, name="frame_recorder", daemon=True)
+        self._thread.start()
+
+    def record(self, mac_address, characteristic_uuid, value):
+        # called on the BLE thread: never touches the disk
+        if len(self.pending) == self.pending.maxlen:
+            self.frames_dropped += 1
+        self.pending.append((time.monotonic_ns(), mac_address, characteristic_uuid, bytes(value)))
+
+    def flush(self):
+        self._wakeup.set()
+
+    def close(self):
+        self._stopped = True
+        self._wakeup.set()
+        self._thread.join()
+
+    def __run(self):
+        while True:
+            self._wakeup.wait(FLUSH_INTERVAL)
+            self._wakeup.clear()
+            try:
+                self.__write_pending()
+            except Exception as e:
+                logging.error(f"FrameRecorder: write failed {e}")
+            if self._stopped:
+                if self.file:
+                    self.file.close()
+                return
+
+    def __write_pending(self):
+        chunk = bytearray()
+        while self.pending:
+            timestamp_ns, mac_address, characteristic_uuid, payload = self.pending.popleft()
+            uuid_bytes = self._uuid_cache.get(characteristic_uuid)
+            if uuid_bytes is None:
+                uuid_bytes = self._uuid_cache[characteristic_uuid] = uuid.UUID(characteristic_uuid).bytes
+            entry_size = ENTRY_HEADER.size + padded_length(len(payload))
+            if self.file is None or self.file_size + len(chunk) + entry_size > self.max_bytes:
+                self.__write(chunk)
+                chunk = bytearray()
+                self.__rotate()
+            chunk += ENTRY_HEADER.pack(timestamp_ns, len(payload), mac_to_bytes(mac_address), uuid_bytes)
+            chunk += payload
+            chunk += bytes(entry_size - ENTRY_HEADER.size - len(payload))
+            self.frames_recorded += 1
+        self.__write(chunk)
+
+    def __write(self, chunk):
+        if chunk:
+            self.file.write(chunk)
+            self.file.flush()
+            self.file_size += len(chunk)
+
+    def __rotate(self):
+        # also on the first write of every run: entries are stored against the monotonic clock of the
+        # file header, so a file left by an earlier run (another boot or process) is rotated, never appended to
+        if self.file:
+            self.file.close()
+        if os.path.exists(self.path):
+            for i in range(self.max_files - 1, 0, -1):
+                source = self.path if i == 1 else f"{self.path}.{i - 1}"
+                if os.path.exists(source):
+                    os.replace(source, f"{self.path}.{i}")
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(self.path, 'wb')
+        self.file.write(FILE_HEADER.pack(MAGIC, VERSION, time.time_ns(), time.monotonic_ns()))
+        self.file_size = FILE_HEADER.size
+
+
+class FrameReader:
+    # zero-copy reader: payloads are memoryviews into the mmap
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.wall_ns, self.monotonic_ns = FILE_HEADER.unpack_from(self.mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a frame recording")
+        self.view = memoryview(self.mmap)
+
+    def __iter__(self):
+        offset = FILE_HEADER.size
+        end = len(self.view) - ENTRY_HEADER.size
+        while offset <= end:
+            timestamp_ns, length, mac, uuid_bytes = ENTRY_HEADER.unpack_from(self.view, offset)
+            start = offset + ENTRY_HEADER.size
+            if start + length > len(self.view):
+                break # partially written last entry
+            yield Frame(timestamp_ns, bytes_to_mac(mac), str(uuid.UUID(bytes=uuid_bytes)), self.view[start:start + length])
+            offset = start + padded_length(length)
+
+    def payload_matrix(self, length):
+        # (frames x length) strided NumPy view over the payloads, when every entry has that length
+        import numpy as np
+        entry_size, count = self.__uniform_entries(length)
+        return np.ndarray((count, length), dtype=np.uint8, buffer=self.mmap, offset=FILE_HEADER.size + ENTRY_HEADER.size, strides=(entry_size, 1))
+
+    def entry_times(self, length):
+        # wall clock seconds of every entry, same preconditions as payload_matrix()
+        import numpy as np
+        entry_size, count = self.__uniform_entries(length)
+        monotonic_ns = np.ndarray((count,), dtype='<u8', buffer=self.mmap, offset=FILE_HEADER.size, strides=(entry_size,))
+        return (self.wall_ns + (monotonic_ns.astype(np.int64) - self.monotonic_ns)) / 1e9
+
+    def entry_macs(self, length):
+        # (frames x 6) view of the device addresses, same preconditions as payload_matrix()
+        import numpy as np
+        entry_size, count = self.__uniform_entries(length)
+        return np.ndarray((count, 6), dtype=np.uint8, buffer=self.mmap, offset=FILE_HEADER.size + 10, strides=(entry_size, 1))
+
+    def __uniform_entries(self, length):
+        import numpy as np
+        entry_size = ENTRY_HEADER.size + padded_length(length)
+        count = (len(self.view) - FILE_HEADER.size) // entry_size
+        lengths = np.ndarray((count,), dtype='<u2', buffer=self.mmap, offset=FILE_HEADER.size + 8, strides=(entry_size,))
+        if count and not (lengths == length).all():
+            raise ValueError(f"{self.path} holds frames that are not {length} bytes long")
+        return entry_size, count
+
+    def close(self):
+        self.view.release()
+        self.mmap.close()
+
+def recording_files(path):
+    # rotated files oldest first, then the current one
+    files = [f"{path}.{i}" for i in range(99, 0, -1) if os.path.exists(f"{path}.{i}")]
+    return files + ([path] if os.path.exists(path) else [])
+
+def read_frames(path):
+    for file in recording_files(path):
+        reader = FrameReader(file)
+        yield from reader
+
+
+_recorders = {}
+_lock = threading.Lock()
+
+def get_recorder(config):
+    # one recorder per file in the process, None unless [recorder] enabled = true
+    if not config.has_section('recorder') or not config['recorder'].getboolean('enabled', False):
+        return None
+    path = config['recorder'].get('path', 'frames.bin')
+    with _lock:
+        if path not in _recorders:
+            recorder = FrameRecorder(path,
+                                     max_bytes=config['recorder'].getint('max_bytes', 64 * 1024 * 1024),
+                                     max_files=config['recorder'].getint('max_files', 5))
+            atexit.register(recorder.close)
+            _recorders[path] = recorder
+            logging.info(f"Recording raw frames to {path}")
+        return _recorders[path]
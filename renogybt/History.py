@@ -0,0 +1,181 @@
+import bisect
+import threading
+from array import array
+
+# In-memory history of numeric readings per device, for api.py's history endpoint.
+# Every field is a fixed size ring of (timestamp, value) doubles, appended from
+# DeviceInstance.on_data_received, so the last `capacity` samples of a field are
+# always available without touching the disk. Older ranges come from LocalStore.
+#
+# Downsampling, `points` is the most points returned per field:
+#   minmax => per bucket the min and the max sample, in time order (keeps spikes)
+#   lttb   => Largest-Triangle-Three-Buckets (keeps the visual shape); long ranges
+#             are reduced with minmax to LTTB_OVERSAMPLE * points samples first
+
+DEFAULT_CAPACITY = 86400 # samples per field, a day at 1 Hz
+LTTB_OVERSAMPLE = 8
+METHOD_MINMAX = 'minmax'
+METHOD_LTTB = 'lttb'
+METHODS = (METHOD_MINMAX, METHOD_LTTB)
+
+class Series:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.ts = array('d')
+        self.values = array('d')
+        self.head = 0 # oldest sample once the ring is full
+
+    def append(self, timestamp, value):
+        if len(self.ts) < self.capacity:
+            self.ts.append(timestamp)
+            self.values.append(value)
+            return
+        self.ts[self.head] = timestamp
+        self.values[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+
+    def oldest(self):
+        return self.ts[self.head] if self.ts else None
+
+    def window(self, since, until):
+        # (ts, values) arrays in time order for since <= ts <= until
+        ts, values = self.ts, self.values
+        if self.head:
+            ts = ts[self.head:] + ts[:self.head]
+            values = values[self.head:] + values[:self.head]
+        start = bisect.bisect_left(ts, since)
+        end = bisect.bisect_right(ts, until)
+        return ts[start:end], values[start:end]
+
+class DeviceHistory:
+    def __init__(self, capacity = DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.series = {} # field => Series
+        self.lock = threading.Lock()
+
+    def add(self, timestamp, data):
+        with self.lock:
+            for key, value in data.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                series = self.series.get(key)
+                if series is None:
+                    series = self.series[key] = Series(self.capacity)
+                series.append(timestamp, value)
+
+    def fields(self):
+        return sorted(self.series)
+
+    def oldest(self, fields):
+        # first timestamp held in memory for all of fields, None if any is empty
+        with self.lock:
+            oldest = [self.series[field].oldest() if field in self.series else None for field in fields]
+        return None if not oldest or None in oldest else max(oldest)
+
+    def window(self, field, since, until):
+        with self.lock:
+            series = self.series.get(field)
+            return series.window(since, until) if series else (array('d'), array('d'))
+
+def minmax(ts, values, points):
+    # min and max of each of points / 2 equal count buckets
+    count = len(values)
+    buckets = max(1, points // 2)
+    if count <= points:
+        return list(zip(ts, values))
+    result = []
+    step = count / buckets
+    for bucket in range(buckets):
+        start, end = int(bucket * step), int((bucket + 1) * step)
+        chunk = values[start:end]
+        low = chunk.index(min(chunk)) + start
+        high = chunk.index(max(chunk)) + start
+        for index in ((low, high) if low < high else (high, low) if high < low else (low,)):
+            result.append((ts[index], values[index]))
+    return result
+
+def lttb(ts, values, points):
+    # Largest-Triangle-Three-Buckets (Steinarsson 2013)
+    count = len(values)
+    if count <= points or points < 3:
+        return list(zip(ts, values))
+    result = [(ts[0], values[0])]
+    step = (count - 2) / (points - 2)
+    selected = 0
+    for bucket in range(points - 2):
+        start = int(bucket * step) + 1
+        end = int((bucket + 1) * step) + 1
+        next_end = min(int((bucket + 2) * step) + 1, count)
+        # average of the next bucket (the last point for the final bucket)
+        if end < next_end:
+            avg_t = sum(ts[end:next_end]) / (next_end - end)
+            avg_v = sum(values[end:next_end]) / (next_end - end)
+        else:
+            avg_t, avg_v = ts[count - 1], values[count - 1]
+        a_t, a_v = ts[selected], values[selected]
+        best, best_area = start, -1.0
+        for index in range(start, end):
+            area = abs((a_t - avg_t) * (values[index] - a_v) - (a_t - ts[index]) * (avg_v - a_v))
+            if area > best_area:
+                best, best_area = index, area
+        result.append((ts[best], values[best]))
+        selected = best
+    result.append((ts[count - 1], values[count - 1]))
+    return result
+
+def downsample(ts, values, points, method = METHOD_MINMAX):
+    if method not in METHODS:
+        raise ValueError(f"unknown downsampling method '{method}', expected one of {', '.join(METHODS)}")
+    if method == METHOD_LTTB:
+        if len(values) > points * LTTB_OVERSAMPLE:
+            reduced = minmax(ts, values, points * LTTB_OVERSAMPLE)
+            ts, values = [t for t, _ in reduced], [v for _, v in reduced]
+        return lttb(ts, values, points)
+    return minmax(ts, values, points)
+
+_histories = {} # MAC (upper case) => DeviceHistory
+_stores = {} # MAC (upper case) => LocalStore for ranges older than memory
+_lock = threading.Lock()
+
+def get_history(mac_address, capacity = DEFAULT_CAPACITY):
+    # the process wide history of a device, created on first use
+    with _lock:
+        history = _histories.get(mac_address.upper())
+        if history is None:
+            history = _histories[mac_address.upper()] = DeviceHistory(capacity)
+        return history
+
+def find_history(mac_address):
+    return _histories.get(mac_address.upper())
+
+def register_store(mac_address, store):
+    with _lock:
+        _stores[mac_address.upper()] = store
+
+def find_store(mac_address):
+    return _stores.get(mac_address.upper())
+
+def query(mac_address, fields, since, until, points, method = METHOD_MINMAX):
+    # {field: [(ts, value), ...]} downsampled to at most `points` per field, and
+    # where the samples came from ('memory', 'disk' or 'memory+disk')
+    history = find_history(mac_address)
+    store = find_store(mac_address)
+    if history is not None and not fields:
+        fields = history.fields()
+    oldest = history.oldest(fields) if history is not None and fields else None
+    disk_until = until if oldest is None else min(until, oldest)
+    use_disk = store is not None and since < disk_until
+    use_memory = oldest is not None and until >= oldest
+    result = {}
+    disk_points = points
+    if use_disk and use_memory: # split the point budget by time span
+        disk_points = max(2, int(points * (disk_until - since) / max(until - since, 1e-9)))
+    if use_disk:
+        result = store.downsample(fields, since, disk_until, disk_points, method)
+    if use_memory:
+        for field in fields:
+            ts, values = history.window(field, max(since, oldest), until)
+            samples = downsample(ts, values, max(2, points - len(result.get(field, ()))), method)
+            result[field] = result.get(field, []) + samples
+    source = '+'.join(name for name, used in (('memory', use_memory), ('disk', use_disk)) if used) or 'none'
+    return result, source
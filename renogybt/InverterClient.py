@@ -1,6 +1,6 @@
 import logging
 from .BaseClient import BaseClient
-from .Utils import bytes_to_int
+from .RegisterMap import Field, compile_layout
 
 FUNCTION = {
     3: "READ",
@@ -25,6 +25,38 @@ BATTERY_TYPE = {
     5: 'custom'
 }
 
+INVERTER_STATS = compile_layout([
+    Field('function', 1, 1, enum=FUNCTION),
+    Field('uei_voltage', 3, 2, scale=0.1, unit='V', device_class='voltage'),
+    Field('uei_current', 5, 2, scale=0.1, unit='A', device_class='current'),
+    Field('voltage', 7, 2, scale=0.1, unit='V', device_class='voltage'),
+    Field('load_current', 9, 2, unit='A', device_class='current'),
+    Field('frequency', 11, 2, scale=0.01, unit='Hz', device_class='frequency'),
+    Field('temperature', 13, 2, scale=0.1, unit='°C', device_class='temperature'),
+])
+
+INVERTER_MODEL = compile_layout([
+    Field('model', 3, 12, kind='str'),
+])
+
+SOLAR_CHARGING = compile_layout([
+    Field('solar_voltage', 3, 2, scale=0.1, unit='V', device_class='voltage'),
+    Field('solar_current', 5, 2, scale=0.1, unit='A', device_class='current'),
+    Field('solar_power', 7, 2, unit='W', device_class='power'),
+    Field('solar_charging_state', 9, 2, enum=CHARGING_STATE),
+    Field('solar_charging_power', 11, 2, unit='W', device_class='power'),
+])
+
+INVERTER_LOAD = compile_layout([
+    Field('load_power', 3, 2, unit='W', device_class='power'),
+    Field('charging_current', 5, 2, scale=0.1, unit='A', device_class='current'),
+])
+
+BATTERY_TYPE_INFO = compile_layout([
+    Field('function', 1, 1, enum=FUNCTION),
+    Field('battery_type', 3, 2, enum=BATTERY_TYPE),
+])
+
 class InverterClient(BaseClient):
     def __init__(self, config, on_data_callback=None, on_error_callback=None):
         super().__init__(config)
@@ -41,41 +73,19 @@ class InverterClient(BaseClient):
 
     def parse_inverter_stats(self, bs):
         logging.info(f"parse_inverter_stats {bs.hex()}")
-        data = {}
-        data['function'] = FUNCTION.get(bytes_to_int(bs, 1, 1))
-        data['uei_voltage'] = bytes_to_int(bs, 3, 2, scale=0.1)
-        data['uei_current'] = bytes_to_int(bs, 5, 2, scale=0.1)
-        data['voltage'] = bytes_to_int(bs, 7, 2, scale=0.1)
-        data['load_current'] = bytes_to_int(bs, 9, 2)
-        data['frequency'] = bytes_to_int(bs, 11, 2, scale=0.01)
-        data['temperature'] = bytes_to_int(bs, 13, 2, scale=0.1)
-        self.data.update(data)
+        INVERTER_STATS.decode_into(bs, self.data)
 
     def parse_inverter_model(self, bs):
         logging.info(f"parse_inverter_model {bs.hex()}")
-        data = {}
-        data['model'] = (bs[3:15]).decode('utf-8')
-        self.data.update(data)
+        INVERTER_MODEL.decode_into(bs, self.data)
 
     def parse_solar_charging(self, bs):
         logging.info(f"parse_solar_charging {bs.hex()}")
-        data = {}
-        data['solar_voltage'] = bytes_to_int(bs, 3, 2, scale=0.1)
-        data['solar_current'] = bytes_to_int(bs, 5, 2, scale=0.1)
-        data['solar_power'] = bytes_to_int(bs, 7, 2)
-        data['solar_charging_state'] = CHARGING_STATE.get(bytes_to_int(bs, 9, 2))
-        data['solar_charging_power'] = bytes_to_int(bs, 11, 2)
-        self.data.update(data)
+        SOLAR_CHARGING.decode_into(bs, self.data)
 
     def parse_inverter_load(self, bs):
         logging.info(f"parse_inverter_load {bs.hex()}")
-        data = {}
-        data['load_power'] = bytes_to_int(bs, 3, 2)
-        data['charging_current'] = bytes_to_int(bs, 5, 2, scale=0.1)
-        self.data.update(data)
+        INVERTER_LOAD.decode_into(bs, self.data)
 
     def parse_battery_type(self, bs):
-        data = {}
-        data['function'] = FUNCTION.get(bytes_to_int(bs, 1, 1))
-        data['battery_type'] = BATTERY_TYPE.get(bytes_to_int(bs, 3, 2))
-        self.data.update(data)
+        BATTERY_TYPE_INFO.decode_into(bs, self.data)
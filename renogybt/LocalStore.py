@@ -0,0 +1,309 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import importlib
+import threading
+from datetime import datetime
+from .RegisterMap import Layout
+from .History import lttb, LTTB_OVERSAMPLE, METHOD_LTTB
+
+# Embedded time-series store for decoded readings, a sink next to MQTT / remote
+# logging ([local_store] in config.ini). SQLite in WAL mode:
+#  - one table per device type and time partition, e.g. rng_shnt_20261018 for
+#    partition = day (week => rng_shnt_2026w42, month => rng_shnt_202610)
+#  - columns come from the client's register map fields (REAL for scaled values,
+#    INTEGER for raw counters, TEXT for strings/enums), keys a client adds on top
+#    (discharge_watts, aggregate _min/_max, ...) are added on first sight
+#  - rows are buffered and written with one executemany per batch_size rows or
+#    commit_interval seconds; synchronous = NORMAL so a commit does not fsync,
+#    only WAL checkpoints do
+#  - partitions older than retention_days are dropped whole (DROP TABLE)
+#  - every partition has a <table>__rollup table with the min and max sample
+#    (and when it happened) of each numeric field per ROLLUP_SECONDS, kept up to
+#    date on insert, so downsample() over days reads minutes, not rows
+
+PARTITIONS = {'day': '%Y%m%d', 'week': '%Yw%W', 'month': '%Y%m'} # table name suffix, sorts by time
+ROLLUP_SECONDS = 60
+ROLLUP_SUFFIX = '__rollup'
+META_COLUMNS = {'__timestamp': 'ts', '__device': 'device', '__client': 'client'}
+CLIENT_MODULES = {
+    'RNG_CTRL': 'RoverClient',
+    'RNG_CTRL_HIST': 'RoverHistoryClient',
+    'RNG_BATT': 'BatteryClient',
+    'RNG_INVT': 'InverterClient',
+    'RNG_SHNT': 'ShuntClient',
+}
+
+def device_layouts(device_type):
+    # every register map Layout of the client module for a device type
+    if device_type not in CLIENT_MODULES:
+        return []
+    module = importlib.import_module(f".{CLIENT_MODULES[device_type]}", __package__)
+    return [value for value in vars(module).values() if isinstance(value, Layout)]
+
+def column_type(field):
+    if field.kind == 'str' or field.enum is not None:
+        return 'TEXT'
+    if field.kind == 'int' and field.scale == 1:
+        return 'INTEGER'
+    return 'REAL'
+
+def value_type(value):
+    if isinstance(value, bool) or isinstance(value, int):
+        return 'INTEGER'
+    if isinstance(value, float) or value is None: # derived fields start out empty, e.g. time_to_full
+        return 'REAL'
+    return 'TEXT'
+
+def device_schema(device_type):
+    # column => SQL type derived from the client's fields
+    schema = {}
+    for layout in device_layouts(device_type):
+        for field in layout.fields:
+            schema.setdefault(field.name, column_type(field))
+    return schema
+
+class LocalStore:
+    def __init__(self, config, clock = time.time):
+        section = config['local_store']
+        self.path = section.get('path', 'readings.db')
+        self.device_type = config['device']['type']
+        self.alias = config['device'].get('alias')
+        self.prefix = self.device_type.lower()
+        self.partition = section.get('partition', 'day').strip() or 'day'
+        if self.partition not in PARTITIONS:
+            raise ValueError(f"unknown partition '{self.partition}', expected one of {', '.join(PARTITIONS)}")
+        self.partition_format = PARTITIONS[self.partition]
+        self.retention_days = section.getint('retention_days', fallback=30)
+        self.batch_size = max(1, section.getint('batch_size', fallback=100))
+        self.commit_interval = section.getfloat('commit_interval', fallback=5)
+        self.clock = clock
+        self.schema = device_schema(self.device_type)
+        self.columns = {} # table => set of columns present
+        self.rows = [] # [(timestamp, row), ...] timestamp taken when the row was added
+        self.lock = threading.Lock()
+        self.commit_timer = None
+        self.counters = {'rows': 0, 'commits': 0, 'expired': 0, 'dropped_partitions': 0}
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=10)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.current_table = None
+
+    def add(self, json_data):
+        # sink callable, commits on the caller's thread when the batch is full
+        with self.lock:
+            self.rows.append((self.clock(), json_data))
+            full = len(self.rows) >= self.batch_size
+            if not full and len(self.rows) == 1 and self.commit_interval > 0:
+                self.commit_timer = threading.Timer(self.commit_interval, self.flush)
+                self.commit_timer.daemon = True
+                self.commit_timer.start()
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            rows, self.rows = self.rows, []
+            if self.commit_timer is not None:
+                self.commit_timer.cancel()
+                self.commit_timer = None
+            if rows:
+                self.__write(rows)
+
+    def table_name(self, timestamp):
+        return f"{self.prefix}_{datetime.fromtimestamp(timestamp).strftime(self.partition_format)}"
+
+    def __write(self, rows):
+        now = self.clock()
+        expired = now - self.retention_days * 86400 if self.retention_days > 0 else 0
+        tables = {} # table => [(ts, row)], a batch can span a partition boundary
+        for added, row in rows:
+            timestamp = row.get('__timestamp') or added # spooled samples keep their original time
+            if timestamp < expired: # e.g. a late sample from the spool
+                self.counters['expired'] += 1
+                continue
+            tables.setdefault(self.table_name(timestamp), []).append((timestamp, row))
+        self.db.execute('BEGIN')
+        try:
+            for table, entries in tables.items():
+                self.__insert(table, entries)
+            self.db.execute('COMMIT')
+        except Exception:
+            self.db.execute('ROLLBACK')
+            self.columns.clear() # columns added in this transaction are gone
+            raise
+        self.counters['rows'] += sum(len(entries) for entries in tables.values())
+        self.counters['commits'] += 1
+        table = self.table_name(now)
+        if table != self.current_table:
+            self.current_table = table
+            self.__apply_retention(now)
+
+    def __insert(self, table, entries):
+        columns = self.columns.get(table)
+        if columns is None:
+            columns = self.__create_table(table)
+        names = ['ts', 'device', 'client']
+        seen = set(names)
+        for _, row in entries:
+            for key, value in row.items():
+                column = META_COLUMNS.get(key, key)
+                if column in seen:
+                    continue
+                seen.add(column)
+                names.append(column)
+                if column not in columns:
+                    self.db.execute(f'ALTER TABLE "{table}" ADD COLUMN "{column}" {self.schema.get(column) or value_type(value)}')
+                    columns.add(column)
+        placeholders = ','.join('?' * len(names))
+        quoted = ','.join(f'"{name}"' for name in names)
+        values = []
+        for timestamp, row in entries:
+            record = [timestamp, row.get('__device') or self.alias, row.get('__client')]
+            for name in names[3:]:
+                value = row.get(name)
+                record.append(json.dumps(value) if isinstance(value, (list, dict)) else value)
+            values.append(record)
+        self.db.executemany(f'INSERT INTO "{table}" ({quoted}) VALUES ({placeholders})', values)
+        self.__rollup(table, entries)
+
+    def __rollup(self, table, entries):
+        # (device, field, bucket) => [min, min_ts, max, max_ts] for this batch, merged into the table
+        buckets = {}
+        for timestamp, row in entries:
+            device = row.get('__device') or self.alias
+            bucket = int(timestamp // ROLLUP_SECONDS)
+            for key, value in row.items():
+                if value.__class__ is not float and (value.__class__ is not int):
+                    continue
+                entry = buckets.get((device, key, bucket))
+                if entry is None:
+                    buckets[(device, key, bucket)] = [value, timestamp, value, timestamp]
+                elif value < entry[0]:
+                    entry[0], entry[1] = value, timestamp
+                elif value > entry[2]:
+                    entry[2], entry[3] = value, timestamp
+        self.db.executemany(
+            f'INSERT INTO "{table}{ROLLUP_SUFFIX}" (device, field, bucket, min, min_ts, max, max_ts) VALUES (?, ?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (device, field, bucket) DO UPDATE SET '
+            'min_ts = CASE WHEN excluded.min < min THEN excluded.min_ts ELSE min_ts END, min = MIN(min, excluded.min), '
+            'max_ts = CASE WHEN excluded.max > max THEN excluded.max_ts ELSE max_ts END, max = MAX(max, excluded.max)',
+            [(device, key, bucket, *entry) for (device, key, bucket), entry in buckets.items()])
+
+    def __create_table(self, table):
+        columns = ', '.join(f'"{name}" {kind}' for name, kind in self.schema.items() if name not in ('ts', 'device', 'client'))
+        self.db.execute(f'CREATE TABLE IF NOT EXISTS "{table}" (ts REAL NOT NULL, device TEXT, client TEXT{", " + columns if columns else ""})')
+        self.db.execute(f'CREATE INDEX IF NOT EXISTS "{table}_ts" ON "{table}" (ts)')
+        self.db.execute(f'CREATE TABLE IF NOT EXISTS "{table}{ROLLUP_SUFFIX}" (device TEXT, field TEXT, bucket INTEGER, '
+                        'min REAL, min_ts REAL, max REAL, max_ts REAL, PRIMARY KEY (device, field, bucket)) WITHOUT ROWID')
+        self.columns[table] = {row[1] for row in self.db.execute(f'PRAGMA table_info("{table}")')}
+        return self.columns[table]
+
+    def partitions(self):
+        # this device type's partition tables, oldest first
+        rows = self.db.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ? ESCAPE '\\' ORDER BY name", (f"{self.prefix}\\_%",))
+        return [name for (name,) in rows if name[len(self.prefix) + 1:].replace('w', '').isdigit()]
+
+    def __apply_retention(self, now):
+        if self.retention_days <= 0:
+            return
+        # a partition is dropped once its newest possible row is past retention
+        oldest_kept = self.table_name(now - self.retention_days * 86400)
+        for table in self.partitions():
+            if table < oldest_kept:
+                self.db.execute(f'DROP TABLE "{table}"')
+                self.db.execute(f'DROP TABLE IF EXISTS "{table}{ROLLUP_SUFFIX}"')
+                self.columns.pop(table, None)
+                self.counters['dropped_partitions'] += 1
+                logging.info(f"LocalStore: dropped partition {table} (retention {self.retention_days} days)")
+
+    def query(self, fields = None, since = None, until = None, device = None):
+        # [(ts, {field: value}), ...] over all partitions in time order
+        self.flush()
+        since = since or 0
+        until = until or self.clock()
+        results = []
+        with self.lock:
+            for table in self.partitions():
+                columns = self.columns.get(table) or {row[1] for row in self.db.execute(f'PRAGMA table_info("{table}")')}
+                wanted = [name for name in (fields or sorted(columns - {'ts', 'device', 'client'})) if name in columns]
+                select = ','.join(['ts'] + [f'"{name}"' for name in wanted])
+                sql = f'SELECT {select} FROM "{table}" WHERE ts >= ? AND ts <= ?'
+                params = [since, until]
+                if device:
+                    sql += ' AND device = ?'
+                    params.append(device)
+                for row in self.db.execute(sql + ' ORDER BY ts', params):
+                    results.append((row[0], dict(zip(wanted, row[1:]))))
+        return results
+
+    def downsample(self, fields, since, until, points, method = 'minmax'):
+        # {field: [(ts, value), ...]} for since <= ts < until: the min and max sample
+        # of equal time buckets, from the rollup when buckets span several minutes
+        self.flush()
+        buckets = max(1, (points * LTTB_OVERSAMPLE if method == METHOD_LTTB else points) // 2)
+        width = max((until - since) / buckets, 1e-6)
+        first, last = self.table_name(since), self.table_name(until)
+        samples = {}
+        with self.lock:
+            for table in self.partitions():
+                if table < first or table > last:
+                    continue
+                if width >= ROLLUP_SECONDS:
+                    self.__rollup_samples(table, fields, since, until, width, samples)
+                else:
+                    self.__raw_samples(table, fields, since, until, width, samples)
+        result = {}
+        for field, points_set in samples.items():
+            ordered = sorted(points_set)
+            result[field] = lttb([t for t, _ in ordered], [v for _, v in ordered], points) if method == METHOD_LTTB else ordered
+        return result
+
+    def __raw_samples(self, table, fields, since, until, width, samples):
+        types = {row[1]: row[2] for row in self.db.execute(f'PRAGMA table_info("{table}")')}
+        numeric = [name for name, kind in types.items() if kind in ('REAL', 'INTEGER') and name != 'ts']
+        for field in (fields or numeric):
+            if field not in numeric:
+                continue
+            for aggregate in ('MIN', 'MAX'): # SQLite returns the ts of the min/max row
+                rows = self.db.execute(
+                    f'SELECT CAST((ts - ?) / ? AS INTEGER) AS bucket, ts, {aggregate}("{field}") FROM "{table}" '
+                    f'WHERE ts >= ? AND ts < ? AND device IS ? AND "{field}" IS NOT NULL GROUP BY bucket',
+                    (since, width, since, until, self.alias))
+                samples.setdefault(field, set()).update((ts, value) for _, ts, value in rows)
+
+    def __rollup_samples(self, table, fields, since, until, width, samples):
+        sql = (f'SELECT field, min, min_ts, max, max_ts FROM "{table}{ROLLUP_SUFFIX}" '
+               'WHERE device IS ? AND bucket >= ? AND bucket <= ?')
+        params = [self.alias, int(since // ROLLUP_SECONDS), int(until // ROLLUP_SECONDS)]
+        if fields:
+            sql += f" AND field IN ({','.join('?' * len(fields))})"
+            params += fields
+        reduced = {} # (field, bucket) => [min, min_ts, max, max_ts]
+        for field, low, low_ts, high, high_ts in self.db.execute(sql, params):
+            for value, timestamp in ((low, low_ts), (high, high_ts)):
+                if not since <= timestamp < until:
+                    continue
+                key = (field, int((timestamp - since) // width))
+                entry = reduced.get(key)
+                if entry is None:
+                    reduced[key] = [value, timestamp, value, timestamp]
+                elif value < entry[0]:
+                    entry[0], entry[1] = value, timestamp
+                elif value > entry[2]:
+                    entry[2], entry[3] = value, timestamp
+        for (field, _), (low, low_ts, high, high_ts) in reduced.items():
+            samples.setdefault(field, set()).update(((low_ts, low), (high_ts, high)))
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.db.close()
+
+    def stats(self):
+        return dict(self.counters, pending=len(self.rows))
@@ -0,0 +1,79 @@
+import logging
+import threading
+import paho.mqtt.client as mqtt
+
+# Long-lived MQTT connection shared by every DataLogger in the process.
+# main.py attaches its MQTTManager so telemetry reuses the connection it already
+# keeps open, otherwise a client is created lazily from the [mqtt] config section.
+# paho's network loop reconnects in the background, publish() never blocks on it.
+
+RECONNECT_MIN_DELAY = 1 # (seconds)
+RECONNECT_MAX_DELAY = 60 # (seconds)
+KEEPALIVE = 60 # (seconds)
+
+def _on_connect(client, userdata, flags, reason_code, properties):
+    logging.info(f"MQTTPublisher: connected ({reason_code})")
+
+def _on_disconnect(client, userdata, flags, reason_code, properties):
+    if reason_code.is_failure:
+        logging.warning(f"MQTTPublisher: disconnected ({reason_code}), reconnecting...")
+
+class MQTTPublisher:
+    _instance = None
+    _lock = threading.Lock()
+
+    def __init__(self, client, owned = False):
+        self.client = client
+        self.owned = owned # only close connections we opened ourselves
+
+    @classmethod
+    def attach(cls, client):
+        # share an existing, already connected paho client (e.g. MQTTManager)
+        with cls._lock:
+            cls._instance = cls(client)
+            logging.info("MQTTPublisher: sharing connection of {}".format(client.__class__.__name__))
+            return cls._instance
+
+    @classmethod
+    def get_instance(cls, config):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls.from_config(config)
+            return cls._instance
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            if cls._instance is not None:
+                cls._instance.close()
+            cls._instance = None
+
+    @classmethod
+    def from_config(cls, config):
+        client_id = config['mqtt'].get('client_id', '')
+        client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2, client_id=f"{client_id}-publisher" if client_id else '')
+        user = config['mqtt']['user']
+        password = config['mqtt']['password']
+        if user and password:
+            client.username_pw_set(user, password)
+        client.reconnect_delay_set(RECONNECT_MIN_DELAY, RECONNECT_MAX_DELAY)
+        client.on_connect = _on_connect
+        client.on_disconnect = _on_disconnect
+        client.connect_async(config['mqtt']['server'], config['mqtt'].getint('port'), KEEPALIVE)
+        client.loop_start()
+        return cls(client, owned=True)
+
+    def is_connected(self):
+        return self.client.is_connected()
+
+    def publish(self, topic, payload, retain = False, qos = 0):
+        info = self.client.publish(topic, payload, qos=qos, retain=retain)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            logging.warning(f"MQTTPublisher: publish to {topic} failed ({mqtt.error_string(info.rc)})")
+            return False
+        return True
+
+    def close(self):
+        if self.owned:
+            self.client.loop_stop()
+            self.client.disconnect()
@@ -0,0 +1,144 @@
+import math
+import time
+import heapq
+import logging
+import itertools
+import threading
+
+# Pacing and timing of Modbus reads (BaseClient / AsyncBaseClient). The next
+# read is sent as soon as the previous response is validated (length and CRC);
+# there is no fixed sleep between sections:
+#   ReadPacer      per device: read timeout from the measured turnaround
+#                  (srtt + 4 * rttvar like TCP, between MIN_TIMEOUT and the
+#                  client's read_timeout, INITIAL_TIMEOUT before the first
+#                  answer) and a gap before the next request that only grows
+#                  after timeouts (doubling) and halves again on every answered
+#                  read. [data] section_delay is the smallest gap.
+#   LatencyHistogram  turnaround per read (write => validated response) in
+#                  fixed millisecond buckets, see BaseClient.read_stats()
+#   Scheduler      one thread running every read timeout, paced request and
+#                  poll of all clients (call_later / cancel), instead of a
+#                  threading.Timer per request.
+
+MIN_TIMEOUT = 0.5 # (seconds)
+INITIAL_TIMEOUT = 3 # (seconds) until the device answered once
+TIMEOUT_MARGIN = 4 # rttvar multiples added to the smoothed turnaround
+BACKOFF_GAP = 0.25 # (seconds) gap after the first timeout, doubled on each further one
+MAX_GAP = 4 # (seconds)
+BUCKETS_MS = (10, 20, 50, 100, 200, 300, 500, 750, 1000, 2000, 5000, 10000)
+
+class ReadPacer:
+    def __init__(self):
+        self.srtt = None # smoothed turnaround (seconds)
+        self.rttvar = None
+        self.backoff = 0.0 # extra gap after timeouts (seconds)
+        self.timeouts = 0
+        self.retries = 0
+
+    def sample(self, seconds):
+        if self.srtt is None:
+            self.srtt, self.rttvar = seconds, seconds / 2
+        else:
+            self.rttvar += (abs(self.srtt - seconds) - self.rttvar) / 4
+            self.srtt += (seconds - self.srtt) / 8
+        self.backoff = self.backoff / 2 if self.backoff > BACKOFF_GAP / 8 else 0.0
+
+    def on_timeout(self):
+        self.timeouts += 1
+        self.backoff = min(max(self.backoff * 2, BACKOFF_GAP), MAX_GAP)
+
+    def timeout(self, max_timeout):
+        if self.srtt is None:
+            return min(INITIAL_TIMEOUT * (2 if self.backoff else 1), max_timeout)
+        return min(max(self.srtt + TIMEOUT_MARGIN * self.rttvar, MIN_TIMEOUT) * (2 if self.backoff else 1), max_timeout)
+
+    def gap(self, min_gap):
+        return min_gap + self.backoff
+
+    def stats(self, min_gap, max_timeout):
+        return {'turnaround_ms': round(self.srtt * 1000, 1) if self.srtt is not None else None,
+                'timeout': round(self.timeout(max_timeout), 3), 'gap': round(self.gap(min_gap), 3),
+                'timeouts': self.timeouts, 'retries': self.retries}
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1) # last bucket: above BUCKETS_MS[-1]
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def add(self, seconds):
+        ms = seconds * 1000
+        index = 0
+        while index < len(BUCKETS_MS) and ms > BUCKETS_MS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += ms
+        if ms < self.min: self.min = ms
+        if ms > self.max: self.max = ms
+
+    def percentile(self, fraction):
+        # upper bound of the bucket holding the fraction, the max for the last one
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(BUCKETS_MS[index], self.max) if index < len(BUCKETS_MS) else self.max
+        return None
+
+    def stats(self):
+        if not self.count:
+            return {'count': 0}
+        return {'count': self.count, 'mean_ms': round(self.total / self.count, 1), 'min_ms': round(self.min, 1),
+                'max_ms': round(self.max, 1), 'p50_ms': round(self.percentile(0.5), 1), 'p90_ms': round(self.percentile(0.9), 1),
+                'p99_ms': round(self.percentile(0.99), 1),
+                'buckets': {f"le_{bound}": count for bound, count in zip(BUCKETS_MS + ('inf',), self.counts)}}
+
+class Scheduler:
+    # single daemon thread running callbacks at their due time (monotonic)
+    def __init__(self):
+        self._events = [] # heap of [due, seq, callback, args]
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def call_later(self, delay, callback, *args):
+        # returns a handle for cancel(), safe to call from any thread
+        event = [time.monotonic() + delay, next(self._seq), callback, args]
+        with self._cond:
+            heapq.heappush(self._events, event)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.__run, name='read-scheduler', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return event
+
+    def cancel(self, event):
+        if event is not None:
+            event[2] = None # skipped when due
+
+    def __run(self):
+        while True:
+            with self._cond:
+                if not self._events:
+                    self._cond.wait()
+                    continue
+                delay = self._events[0][0] - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                _, _, callback, args = heapq.heappop(self._events)
+            if callback is None:
+                continue
+            try:
+                callback(*args)
+            except Exception as e:
+                logging.error(f"Scheduler: exception in {callback.__name__}: {e}")
+
+_scheduler = Scheduler()
+
+def get_scheduler():
+    return _scheduler
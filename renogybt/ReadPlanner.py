@@ -0,0 +1,55 @@
+from .Utils import int_to_bytes, crc16_modbus
+
+# Plans the Modbus reads of a client's sections: consecutive sections whose
+# registers follow each other (with at most `max_gap` unused words in between
+# and at most `max_words` words in total) are read with one request, e.g.
+# BatteryClient 5000 (17 words) + 5017 (17 words) => one 34 word read.
+# Sections are only merged in the order the client lists them and only when the
+# next one starts at or after the end of the current read, so overlapping
+# sections (RoverHistoryClient's day records) keep one read each and the
+# parsers still run in section order.
+#
+# Every read is a dict:
+#   {'register', 'words', 'request': CRC'd request bytes, 'sections': [(section, word offset)]}
+# section_frame() cuts a read's response back into the frame a section parser
+# expects (header, the section's words, crc), see BaseClient.on_data_received.
+# A read the device rejects (Modbus exception) can be split() back into its sections.
+
+READ_FUNCTION = 3
+DEFAULT_GAP = 0 # (words) only merge sections that are back to back
+DEFAULT_MAX_WORDS = 34 # largest section read in one request today (RoverClient CHARGING_INFO)
+
+def read_request(device_id, register, words):
+    request = bytes([device_id, READ_FUNCTION, int_to_bytes(register, 0), int_to_bytes(register, 1),
+                     int_to_bytes(words, 0), int_to_bytes(words, 1)])
+    return request + crc16_modbus(request)
+
+def create_read(device_id, register, words, sections):
+    return {'register': register, 'words': words, 'request': read_request(device_id, register, words), 'sections': sections}
+
+def plan_reads(device_id, sections, max_gap = DEFAULT_GAP, max_words = DEFAULT_MAX_WORDS):
+    reads = []
+    current = None
+    for section in sections:
+        register, words = section['register'], section['words']
+        if current is not None:
+            end = current['register'] + current['words']
+            if end <= register <= end + max_gap and register + words - current['register'] <= max_words:
+                current['sections'].append((section, register - current['register']))
+                current['words'] = register + words - current['register']
+                continue
+        current = {'register': register, 'words': words, 'sections': [(section, 0)]}
+        reads.append(current)
+    return [create_read(device_id, read['register'], read['words'], read['sections']) for read in reads]
+
+def split(device_id, read):
+    # one read per section, for a merged read the device does not accept
+    return [create_read(device_id, section['register'], section['words'], [(section, 0)]) for section, _ in read['sections']]
+
+def section_frame(response, read, section, offset):
+    # response of a read => the response a single read of the section would have returned
+    if offset == 0 and section['words'] == read['words']:
+        return response
+    start = 3 + offset * 2
+    frame = bytes((response[0], response[1], section['words'] * 2)) + response[start:start + section['words'] * 2]
+    return frame + crc16_modbus(frame)
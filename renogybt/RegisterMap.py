@@ -0,0 +1,163 @@
+import math
+import struct
+from collections import namedtuple
+from .Utils import parse_temperature, format_temperature
+
+# Declarative register maps. Each client section is described as a list of Fields
+# and compiled once (at import) into a Layout that decodes a whole frame with a
+# single precompiled struct.Struct.unpack_from followed by one scale step
+# (a decoder generated for the layout, so no per-field slicing or lookups).
+# Offsets are byte offsets into the raw frame, exactly like bytes_to_int().
+# decode() returns a new dict; decode_into() writes the same values into an
+# existing record (e.g. a client's reusable self.data), so a frame costs no dict.
+#
+# kind: 'int'         => round(raw * scale, 2), same as bytes_to_int()
+#       'str'         => utf-8 text of `width` bytes, stripped
+#       'temperature' => sign/magnitude byte, see Utils.parse_temperature
+#       'celsius'     => round(raw * scale, 2) °C, converted to temperature_unit
+# enum / shift / mask apply to unscaled ('int', scale 1) fields: enum.get((raw >> shift) & mask)
+
+Field = namedtuple('Field', ['name', 'offset', 'width', 'signed', 'scale', 'enum', 'unit', 'device_class', 'shift', 'mask', 'kind'],
+                   defaults=(False, 1, None, None, None, 0, None, 'int'))
+
+WIDTH_CODES = {1: 'B', 2: 'H', 4: 'I'}
+KINDS = ('int', 'str', 'temperature', 'celsius')
+
+def scale_round(raw, divisor, scale):
+    # round(raw * scale, 2) for scale = 0.01 / divisor, without the cost of round():
+    # only exact .xx5 ties can round differently, those still go through round()
+    if raw % divisor * 2 == divisor:
+        return round(raw * scale, 2)
+    return ((raw + divisor // 2) // divisor) / 100
+
+class Layout:
+    def __init__(self, fields):
+        self.fields = tuple(fields)
+        self.names = tuple(field.name for field in self.fields)
+        self.scales = tuple(None if field.kind == 'str' else field.scale for field in self.fields)
+
+        fmt = '>'
+        position = 0
+        raw_counts = {} # field index => unpacked values (24 bit fields take two)
+        for index, field in sorted(enumerate(self.fields), key=lambda item: item[1].offset):
+            if field.offset < position:
+                raise ValueError(f"register map: field '{field.name}' overlaps the previous field")
+            if field.kind not in KINDS:
+                raise ValueError(f"register map: unknown kind '{field.kind}' for field '{field.name}'")
+            if (field.enum is not None or field.shift or field.mask is not None) and field.scale != 1:
+                raise ValueError(f"register map: enum/bit field '{field.name}' cannot be scaled")
+            if field.offset > position:
+                fmt += f"{field.offset - position}x"
+            if field.kind == 'str':
+                fmt += f"{field.width}s"
+                raw_counts[index] = 1
+            elif field.width == 3: # no 24 bit struct code: high byte + low word
+                fmt += 'bH' if field.signed else 'BH'
+                raw_counts[index] = 2
+            elif field.width in WIDTH_CODES:
+                fmt += WIDTH_CODES[field.width].lower() if field.signed else WIDTH_CODES[field.width]
+                raw_counts[index] = 1
+            else:
+                raise ValueError(f"register map: unsupported width {field.width} for field '{field.name}'")
+            position = field.offset + field.width
+
+        self.struct = struct.Struct(fmt)
+        self.size = position
+        self.decode, self.decode_into = self.__compile(raw_counts)
+
+    def __compile(self, raw_counts):
+        # Generate straight-line decoders for the layout: unpack, then build the
+        # dict (or assign into the record) in declaration order with every
+        # scale/enum step inlined.
+        namespace = {'unpack_from': self.struct.unpack_from, 'scale_round': scale_round, 'decode_short': self.__decode_short,
+                     'parse_temperature': parse_temperature, 'format_temperature': format_temperature}
+        raw_index = 0
+        raws = {}
+        for index in sorted(raw_counts, key=lambda index: self.fields[index].offset):
+            raws[index] = f"(r[{raw_index}] << 16 | r[{raw_index + 1}])" if raw_counts[index] == 2 else f"r[{raw_index}]"
+            raw_index += raw_counts[index]
+
+        items = []
+        for index, field in enumerate(self.fields):
+            expr = raws[index]
+            if field.kind == 'str':
+                expr = f"{expr}.decode('utf-8').strip()"
+            elif field.scale != 1:
+                decimals = round(-math.log10(abs(field.scale)))
+                if field.scale == 10 ** -decimals and decimals in (1, 2):
+                    expr = f"{expr} / {10 ** decimals}"
+                elif field.scale == 10 ** -decimals and decimals > 2:
+                    expr = f"scale_round({expr}, {10 ** (decimals - 2)}, {field.scale!r})"
+                else:
+                    expr = f"round({expr} * {field.scale!r}, 2)"
+            if field.kind == 'temperature':
+                expr = f"parse_temperature({expr}, temperature_unit)"
+            elif field.kind == 'celsius':
+                expr = f"format_temperature({expr}, temperature_unit)"
+            if field.shift:
+                expr = f"({expr} >> {field.shift})"
+            if field.mask is not None:
+                expr = f"({expr} & {field.mask})"
+            if field.enum is not None:
+                namespace[f"enum_{index}"] = field.enum
+                expr = f"enum_{index}.get({expr})"
+            items.append((field.name, expr))
+
+        source = (f"def decode(buf, temperature_unit = 'F'):\n"
+                  f"    if len(buf) < {self.size}: return decode_short(buf, temperature_unit)\n"
+                  f"    r = unpack_from(buf)\n"
+                  f"    return {{{', '.join(f'{name!r}: {expr}' for name, expr in items)}}}\n"
+                  f"def decode_into(buf, record, temperature_unit = 'F'):\n"
+                  f"    if len(buf) < {self.size}:\n"
+                  f"        record.update(decode_short(buf, temperature_unit))\n"
+                  f"        return record\n"
+                  f"    r = unpack_from(buf)\n"
+                  + ''.join(f"    record[{name!r}] = {expr}\n" for name, expr in items) +
+                  "    return record\n")
+        exec(source, namespace)
+        return namespace['decode'], namespace['decode_into']
+
+    def __decode_short(self, buf, temperature_unit):
+        # short frame: fields that do not fit read as 0, like bytes_to_int()
+        length = len(buf)
+        padded = bytearray(buf) + bytes(self.size - length)
+        for field in self.fields:
+            if field.offset + field.width > length:
+                padded[field.offset:field.offset + field.width] = bytes(field.width)
+        data = self.decode(padded, temperature_unit)
+        for field in self.fields:
+            if field.kind == 'str':
+                data[field.name] = bytes(buf[field.offset:field.offset + field.width]).decode('utf-8').strip()
+        return data
+
+    def encode(self, values, size = None):
+        # inverse of decode, used to build frames for simulated devices. Fields
+        # missing from values read as 0; temperatures are given in °C.
+        frame = bytearray(size or self.size)
+        for field in self.fields:
+            if field.name not in values:
+                continue
+            value = values[field.name]
+            end = field.offset + field.width
+            if field.kind == 'str':
+                frame[field.offset:end] = value.encode('utf-8')[:field.width].ljust(field.width)
+                continue
+            if field.enum is not None:
+                value = next(raw for raw, name in field.enum.items() if name == value)
+            if field.kind == 'temperature':
+                raw = value if value >= 0 else 128 - value
+            elif field.scale != 1:
+                raw = round(value / field.scale)
+            else:
+                raw = int(value)
+            if field.shift or field.mask is not None: # bit field, keep what is already in the byte(s)
+                raw = int.from_bytes(frame[field.offset:end], 'big') | (raw << field.shift)
+            frame[field.offset:end] = raw.to_bytes(field.width, 'big', signed=field.signed)
+        return frame
+
+    def sensors(self):
+        # name => (unit, device_class) for fields that declare them, e.g. for HA discovery
+        return {field.name: (field.unit, field.device_class) for field in self.fields if field.unit or field.device_class}
+
+def compile_layout(fields):
+    return Layout(fields)
@@ -0,0 +1,146 @@
+import gzip
+import json
+import time
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from .SinkWorker import TIMESTAMP_KEY, SinkRejected
+
+# Batching remote_logging sink, used when [remote_logging] batch_size > 1.
+# Samples are collected until batch_size samples or batch_age seconds, then sent
+# in one POST over a pooled keep-alive session, each with the '__timestamp' it
+# was added at (samples drained from a spool keep their original one):
+#   batch_format = json   => one JSON array of samples (application/json)
+#   batch_format = ndjson => one JSON object per line (application/x-ndjson)
+#   compress = true       => gzip body with Content-Encoding: gzip
+# Connection errors and 429/5xx replies are retried with exponential backoff;
+# a batch that still fails goes to on_failed (e.g. SinkWorker.spool_samples) or
+# is dropped. A batch refused with any other status (4xx) is dropped and counted
+# as rejected, sending it again would not help. Any 2xx reply is a success, the
+# same rule as DataLogger.log_remote (see response_ok). While the endpoint is
+# down every add() tries to send its sample on its own and returns False if that
+# fails too, so the caller keeps it.
+# There is no timer thread: the SinkWorker running add() calls flush() on its own
+# thread once deadline() has passed.
+
+FORMAT_JSON = 'json'
+FORMAT_NDJSON = 'ndjson'
+RETRY_STATUS = (429, 500, 502, 503, 504)
+REQUEST_TIMEOUT = 15 # (seconds)
+
+def response_ok(response, name):
+    # True on success, False when worth retrying later (429/5xx), raises SinkRejected for any other reply
+    if 200 <= response.status_code < 300:
+        return True
+    if response.status_code in RETRY_STATUS:
+        logging.error(f"{name} error {response.status_code}")
+        return False
+    raise SinkRejected(f"{name} rejected with {response.status_code}")
+
+def create_session(retries = 3, backoff = 0.5):
+    # keep-alive session, one pooled connection per host, retrying POST too
+    retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=RETRY_STATUS, allowed_methods=None, raise_on_status=False)
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+class RemoteBatcher:
+    def __init__(self, config, session = None):
+        section = config['remote_logging']
+        self.url = section['url']
+        self.batch_size = max(1, section.getint('batch_size', fallback=1))
+        self.batch_age = section.getfloat('batch_age', fallback=10)
+        self.format = section.get('batch_format', FORMAT_JSON).strip() or FORMAT_JSON
+        if self.format not in (FORMAT_JSON, FORMAT_NDJSON):
+            raise ValueError(f"unknown batch_format '{self.format}', expected '{FORMAT_JSON}' or '{FORMAT_NDJSON}'")
+        self.compress = section.getboolean('compress', fallback=False)
+        self.session = session or create_session(section.getint('retries', fallback=3), section.getfloat('backoff', fallback=0.5))
+        self.headers = {
+            "Authorization": f"Bearer {section['auth_header']}",
+            "Content-Type": "application/x-ndjson" if self.format == FORMAT_NDJSON else "application/json",
+        }
+        if self.compress:
+            self.headers["Content-Encoding"] = "gzip"
+        self.encode = json.JSONEncoder(separators=(',', ':')).encode
+        self.batch = [] # [(timestamp, sample), ...]
+        self.healthy = True # last POST succeeded
+        self.on_failed = None # callable([(timestamp, sample), ...]) for a batch that could not be sent
+        self.lock = threading.Lock()
+        self.send_lock = threading.Lock() # one POST at a time on the session
+        self.started = None # time.monotonic() of the oldest pending sample
+        self.counters = {'samples': 0, 'batches': 0, 'failed_batches': 0, 'failed_samples': 0, 'rejected_samples': 0, 'body_bytes': 0}
+
+    def add(self, json_data):
+        # sink callable, flushes on the caller's thread when the batch is full
+        if not self.healthy:
+            with self.send_lock:
+                return self.send([(time.time(), json_data)])
+        with self.lock:
+            self.batch.append((time.time(), json_data))
+            full = len(self.batch) >= self.batch_size
+            if len(self.batch) == 1:
+                self.started = time.monotonic()
+        if full:
+            self.flush()
+
+    def deadline(self):
+        # time.monotonic() the pending batch is due by batch_age, None when there is nothing to wait for
+        started = self.started
+        if started is None or self.batch_age <= 0:
+            return None
+        return started + self.batch_age
+
+    def flush(self):
+        with self.lock:
+            batch, self.batch = self.batch, []
+            self.started = None
+        if batch:
+            with self.send_lock:
+                try:
+                    if not self.send(batch) and self.on_failed is not None:
+                        self.on_failed(batch)
+                except SinkRejected as e:
+                    logging.error(f"{e}, {len(batch)} samples dropped")
+
+    def encode_batch(self, batch):
+        samples = [sample if TIMESTAMP_KEY in sample else dict(sample, **{TIMESTAMP_KEY: timestamp}) for timestamp, sample in batch]
+        if self.format == FORMAT_NDJSON:
+            body = '\n'.join(map(self.encode, samples)) + '\n'
+        else:
+            body = self.encode(samples)
+        body = body.encode('utf-8')
+        return gzip.compress(body, compresslevel=6) if self.compress else body
+
+    def send(self, batch):
+        body = self.encode_batch(batch)
+        try:
+            response = self.session.post(self.url, data=body, headers=self.headers, timeout=REQUEST_TIMEOUT)
+            ok = response_ok(response, "Log remote")
+        except SinkRejected:
+            self.counters['rejected_samples'] += len(batch)
+            raise
+        except requests.RequestException as e:
+            ok = False
+            logging.error(f"Log remote failed: {e} ({len(batch)} samples)")
+        self.healthy = ok
+        if ok:
+            self.counters['batches'] += 1
+            self.counters['samples'] += len(batch)
+            self.counters['body_bytes'] += len(body)
+            logging.info(f"Log remote {response.status_code} ({len(batch)} samples, {len(body)} bytes)")
+        else:
+            self.counters['failed_batches'] += 1
+            self.counters['failed_samples'] += len(batch)
+        return ok
+
+    def close(self):
+        # send what is pending and release the pooled connection
+        self.flush()
+        self.session.close()
+
+    def stats(self):
+        return dict(self.counters, pending=len(self.batch))
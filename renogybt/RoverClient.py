@@ -1,6 +1,7 @@
 import logging
 from .BaseClient import BaseClient
-from .Utils import bytes_to_int, parse_temperature
+from .Utils import bytes_to_int
+from .RegisterMap import Field, compile_layout
 
 # Read and parse BT-1 RS232 type bluetooth module connected to Renogy Rover/Wanderer/Adventurer
 # series charge controllers. Also works with BT-2 RS485 module on Rover Elite, DC Charger etc.
@@ -34,6 +35,49 @@ BATTERY_TYPE = {
     5: 'custom'
 }
 
+DEVICE_INFO = compile_layout([
+    Field('function', 1, 1, enum=FUNCTION),
+    Field('model', 3, 14, kind='str'),
+])
+
+DEVICE_ADDRESS = compile_layout([
+    Field('device_id', 4, 1),
+])
+
+CHARGING_INFO = compile_layout([
+    Field('function', 1, 1, enum=FUNCTION),
+    Field('battery_percentage', 3, 2, unit='%', device_class='battery'),
+    Field('battery_voltage', 5, 2, scale=0.1, unit='V', device_class='voltage'),
+    Field('battery_current', 7, 2, scale=0.01, unit='A', device_class='current'),
+    Field('battery_temperature', 10, 1, kind='temperature', device_class='temperature'),
+    Field('controller_temperature', 9, 1, kind='temperature', device_class='temperature'),
+    Field('load_status', 67, 1, enum=LOAD_STATE, shift=7),
+    Field('load_voltage', 11, 2, scale=0.1, unit='V', device_class='voltage'),
+    Field('load_current', 13, 2, scale=0.01, unit='A', device_class='current'),
+    Field('load_power', 15, 2, unit='W', device_class='power'),
+    Field('pv_voltage', 17, 2, scale=0.1, unit='V', device_class='voltage'),
+    Field('pv_current', 19, 2, scale=0.01, unit='A', device_class='current'),
+    Field('pv_power', 21, 2, unit='W', device_class='power'),
+    Field('max_charging_power_today', 33, 2, unit='W', device_class='power'),
+    Field('max_discharging_power_today', 35, 2, unit='W', device_class='power'),
+    Field('charging_amp_hours_today', 37, 2, unit='Ah'),
+    Field('discharging_amp_hours_today', 39, 2, unit='Ah'),
+    Field('power_generation_today', 41, 2, unit='Wh', device_class='energy'),
+    Field('power_consumption_today', 43, 2, unit='Wh', device_class='energy'),
+    Field('power_generation_total', 59, 4, unit='Wh', device_class='energy'),
+    Field('charging_status', 68, 1, enum=CHARGING_STATE),
+])
+
+BATTERY_TYPE_INFO = compile_layout([
+    Field('function', 1, 1, enum=FUNCTION),
+    Field('battery_type', 3, 2, enum=BATTERY_TYPE),
+])
+
+SET_LOAD_RESPONSE = compile_layout([
+    Field('function', 1, 1, enum=FUNCTION),
+    Field('load_status', 5, 1),
+])
+
 class RoverClient(BaseClient):
     def __init__(self, config, on_data_callback=None, on_error_callback=None):
         super().__init__(config)
@@ -69,50 +113,16 @@ class RoverClient(BaseClient):
         self.device.characteristic_write_value(request)
 
     def parse_device_info(self, bs):
-        data = {}
-        data['function'] = FUNCTION.get(bytes_to_int(bs, 1, 1))
-        data['model'] = (bs[3:17]).decode('utf-8').strip()
-        self.data.update(data)
+        DEVICE_INFO.decode_into(bs, self.data)
 
     def parse_device_address(self, bs):
-        data = {}
-        data['device_id'] = bytes_to_int(bs, 4, 1)
-        self.data.update(data)
+        DEVICE_ADDRESS.decode_into(bs, self.data)
 
     def parse_chargin_info(self, bs):
-        data = {}
-        temp_unit = self.config['data']['temperature_unit']
-        data['function'] = FUNCTION.get(bytes_to_int(bs, 1, 1))
-        data['battery_percentage'] = bytes_to_int(bs, 3, 2)
-        data['battery_voltage'] = bytes_to_int(bs, 5, 2, scale = 0.1)
-        data['battery_current'] = bytes_to_int(bs, 7, 2, scale = 0.01)
-        data['battery_temperature'] = parse_temperature(bytes_to_int(bs, 10, 1), temp_unit)
-        data['controller_temperature'] = parse_temperature(bytes_to_int(bs, 9, 1), temp_unit)
-        data['load_status'] = LOAD_STATE.get(bytes_to_int(bs, 67, 1) >> 7)
-        data['load_voltage'] = bytes_to_int(bs, 11, 2, scale = 0.1)
-        data['load_current'] = bytes_to_int(bs, 13, 2, scale = 0.01)
-        data['load_power'] = bytes_to_int(bs, 15, 2)
-        data['pv_voltage'] = bytes_to_int(bs, 17, 2, scale = 0.1) 
-        data['pv_current'] = bytes_to_int(bs, 19, 2, scale = 0.01)
-        data['pv_power'] = bytes_to_int(bs, 21, 2)
-        data['max_charging_power_today'] = bytes_to_int(bs, 33, 2)
-        data['max_discharging_power_today'] = bytes_to_int(bs, 35, 2)
-        data['charging_amp_hours_today'] = bytes_to_int(bs, 37, 2)
-        data['discharging_amp_hours_today'] = bytes_to_int(bs, 39, 2)
-        data['power_generation_today'] = bytes_to_int(bs, 41, 2)
-        data['power_consumption_today'] = bytes_to_int(bs, 43, 2)
-        data['power_generation_total'] = bytes_to_int(bs, 59, 4)
-        data['charging_status'] = CHARGING_STATE.get(bytes_to_int(bs, 68, 1))
-        self.data.update(data)
+        CHARGING_INFO.decode_into(bs, self.data, self.config['data']['temperature_unit'])
 
     def parse_battery_type(self, bs):
-        data = {}
-        data['function'] = FUNCTION.get(bytes_to_int(bs, 1, 1))
-        data['battery_type'] = BATTERY_TYPE.get(bytes_to_int(bs, 3, 2))
-        self.data.update(data)
+        BATTERY_TYPE_INFO.decode_into(bs, self.data)
 
     def parse_set_load_response(self, bs):
-        data = {}
-        data['function'] = FUNCTION.get(bytes_to_int(bs, 1, 1))
-        data['load_status'] = bytes_to_int(bs, 5, 1)
-        self.data.update(data)
+        SET_LOAD_RESPONSE.decode_into(bs, self.data)
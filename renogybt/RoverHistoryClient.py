@@ -1,8 +1,14 @@
 from .BaseClient import BaseClient
-from .Utils import bytes_to_int
+from .RegisterMap import Field, compile_layout
 
 # Retrieve last 7 days of historical data from Rover/Wanderer/Adventurer
 
+DAILY_HISTORY = compile_layout([
+    Field('daily_max_power', 11, 2, unit='W', device_class='power'),
+    Field('daily_charge_ah', 15, 2, unit='Ah'),
+    Field('daily_power_generation', 19, 2, unit='Wh', device_class='energy'),
+])
+
 class RoverHistoryClient(BaseClient):
     def __init__(self, config, on_data_callback=None, on_error_callback=None):
         super().__init__(config)
@@ -25,6 +31,5 @@ class RoverHistoryClient(BaseClient):
         ]
 
     def parse_historical_data(self, bs):
-        self.data['daily_power_generation'].append(bytes_to_int(bs, 19, 2))
-        self.data['daily_charge_ah'].append(bytes_to_int(bs, 15, 2))
-        self.data['daily_max_power'].append(bytes_to_int(bs, 11, 2))
+        for key, value in DAILY_HISTORY.decode(bs).items():
+            self.data[key].append(value)
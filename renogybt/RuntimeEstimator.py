@@ -0,0 +1,81 @@
+import math
+import time
+
+# Time-to-empty / time-to-full for the shunt, fed with every frame before rate
+# limiting (DeviceInstance.on_data_received), constant memory and O(1) per frame.
+#
+# The current is first passed through a median of the last 3 frames, so a single
+# frame spike (motor start, inverter surge) never reaches the average, then into
+# an exponentially weighted average with time constant `time_constant` seconds
+# (weight 1 - exp(-dt / time_constant), so it does not depend on the frame rate).
+# With capacity_ah from [runtime]:
+#   time_remaining = state_of_charge * capacity / discharge current   (minutes)
+#   time_to_full   = (100 - state_of_charge) * capacity / charge current (minutes)
+# A field is left out while the average current is below min_current in its direction,
+# numeric consumers (Home Assistant sensors, LocalStore columns) never get a None.
+
+AMPS_KEY = 'discharge_amps'
+SOC_KEY = 'state_of_charge'
+MEDIAN_FRAMES = 3
+
+def median3(a, b, c):
+    return max(min(a, b), min(max(a, b), c))
+
+class RuntimeEstimator:
+    def __init__(self, capacity_ah, time_constant = 120, min_current = 0.1, max_gap = 30, clock = time.monotonic):
+        self.capacity_ah = capacity_ah
+        self.time_constant = time_constant
+        self.min_current = min_current
+        self.max_gap = max_gap
+        self.clock = clock
+        self.recent = [] # last MEDIAN_FRAMES currents
+        self.average = None # smoothed current, positive = charging
+        self.last = None # monotonic time of the last frame
+
+    @classmethod
+    def from_config(cls, config, clock = time.monotonic):
+        section = config['runtime']
+        return cls(capacity_ah=section.getfloat('capacity_ah'),
+                   time_constant=section.getfloat('time_constant', fallback=120),
+                   min_current=section.getfloat('min_current', fallback=0.1),
+                   max_gap=section.getfloat('max_gap', fallback=30),
+                   clock=clock)
+
+    def add(self, data):
+        # update with one frame and write the estimates into it (in place)
+        amps = data.get(AMPS_KEY)
+        soc = data.get(SOC_KEY)
+        if amps is None or soc is None:
+            return data
+        self.update(self.clock(), amps)
+        return self.write_fields(data, soc)
+
+    def update(self, now, amps):
+        if self.last is None or not 0 <= now - self.last <= self.max_gap:
+            self.recent = [] # start over after a disconnect
+            self.average = None
+        recent = self.recent
+        recent.append(amps)
+        if len(recent) > MEDIAN_FRAMES:
+            del recent[0]
+        current = median3(*recent) if len(recent) == MEDIAN_FRAMES else amps
+        if self.average is None:
+            self.average = current
+        else:
+            weight = 1 - math.exp(-(now - self.last) / self.time_constant) if self.time_constant > 0 else 1
+            self.average += weight * (current - self.average)
+        self.last = now
+
+    def fields(self, soc):
+        return self.write_fields({}, soc)
+
+    def write_fields(self, data, soc):
+        soc = min(max(soc, 0), 100)
+        average = self.average
+        data.pop('time_remaining', None) # the record can be the one of the previous frame (duplicate shunt frames)
+        data.pop('time_to_full', None)
+        if average <= -self.min_current:
+            data['time_remaining'] = round(soc / 100 * self.capacity_ah / -average * 60, 1)
+        elif average >= self.min_current:
+            data['time_to_full'] = round((100 - soc) / 100 * self.capacity_ah / average * 60, 1)
+        return data
@@ -2,6 +2,7 @@ import logging
 # from .BaseClient import BaseClient
 from .BaseShuntClient import BaseClient
 from .Utils import bytes_to_int, parse_temperature
+from .RegisterMap import Field, compile_layout
 
 # Read and parse BT-1 RS232 type bluetooth module connected to Renogy Rover/Wanderer/Adventurer
 # series charge controllers. Also works with BT-2 RS485 module on Rover Elite, DC Charger etc.
@@ -35,6 +36,24 @@ BATTERY_TYPE = {
     5: 'custom'
 }
 
+DEVICE_INFO = compile_layout([
+    Field('function', 1, 1, enum=FUNCTION),
+    Field('model', 3, 14, kind='str'),
+])
+
+DEVICE_ADDRESS = compile_layout([
+    Field('device_id', 4, 1),
+])
+
+SHUNT_INFO = compile_layout([
+    Field('charge_battery_voltage', 25, 3, scale=0.001, unit='V', device_class='voltage'), # 0xA6 (#1)
+    Field('starter_battery_voltage', 30, 2, scale=0.001, unit='V', device_class='voltage'), # 0xA6 (#2)
+    Field('discharge_amps', 21, 3, signed=True, scale=0.001, unit='A', device_class='current'), # 0xA4 (#1)
+    # Field('temperature_sensor_1', 66, 3, scale=0.001) # 0xAD (#3), 0.00 if byte 67 == 0
+    # Field('temperature_sensor_2', 70, 3, scale=0.001) # 0xAD (#4), 0.00 if byte 71 == 0
+    Field('state_of_charge', 34, 2, scale=0.1, unit='%', device_class='battery'),
+])
+
 class ShuntClient(BaseClient):
     def __init__(self, config, on_data_callback=None, on_error_callback=None):
         super().__init__(config)
@@ -52,6 +71,7 @@ class ShuntClient(BaseClient):
             {'register': 256, 'words': 110, 'parser': self.parse_shunt_info}
         ]
         self.set_load_params = {'function': 6, 'register': 266}
+        self.duplicate_region = (0, SHUNT_INFO.size) # frames differing only past the decoded fields are duplicates
 
     def on_data_received(self, response):
         operation = bytes_to_int(response, 1, 1)
@@ -59,6 +79,7 @@ class ShuntClient(BaseClient):
             self.parse_set_load_response(response)
             self.on_write_operation_complete()
             self.data = {}
+            self.last_passed = False # the next notify frame is decoded again
         else:
             # read is handled in base class
             super().on_data_received(response)
@@ -74,31 +95,18 @@ class ShuntClient(BaseClient):
         self.device.characteristic_write_value(request)
 
     def parse_device_info(self, bs):
-        data = {}
-        data['function'] = FUNCTION.get(bytes_to_int(bs, 1, 1))
-        data['model'] = (bs[3:17]).decode('utf-8').strip()
-        self.data.update(data)
+        DEVICE_INFO.decode_into(bs, self.data)
 
     def parse_device_address(self, bs):
-        data = {}
-        data['device_id'] = bytes_to_int(bs, 4, 1)
-        self.data.update(data)
+        DEVICE_ADDRESS.decode_into(bs, self.data)
 
     def parse_shunt_info(self, bs):
-        data = {}
-        # temp_unit = self.config['data']['temperature_unit']
-        data['charge_battery_voltage'] = bytes_to_int(bs, 25, 3, scale = 0.001) # 0xA6 (#1
-        data['starter_battery_voltage'] = bytes_to_int(bs, 30, 2, scale = 0.001) # 0xA6 (#2)
-        data['discharge_amps'] = bytes_to_int(bs, 21, 3, scale = 0.001, signed=True) # 0xA4 (#1)
+        # decoded into the reusable self.data record: callbacks must copy what they keep
+        data = SHUNT_INFO.decode_into(bs, self.data)
         data['discharge_watts'] = round((data['charge_battery_voltage'] * data['discharge_amps']), 2)
-        #data['temperature_sensor_1'] = 0.00 if bytes_to_int(bs, 67, 1) == 0 else bytes_to_int(bs, 66, 3, scale = 0.001) # 0xAD (#3)
-        #data['temperature_sensor_2'] = 0.00 if bytes_to_int(bs, 71, 1) == 0 else bytes_to_int(bs, 70, 3, scale = 0.001) # 0xAD (#4)
-        data['state_of_charge'] = bytes_to_int(bs, 34, 2, scale=0.1)
         # unknown values:
         # - time_remaining
         # - discharge_duration
         # - consumed_amp_hours
-        self.data.update(data)
         # logging.debug(msg=f"DATA: {self.data}")
         return data
-        
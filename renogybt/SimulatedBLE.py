@@ -0,0 +1,404 @@
+import time
+import heapq
+import random
+import logging
+import itertools
+import threading
+from .Utils import crc16_modbus
+from .ShuntClient import SHUNT_INFO
+from .RoverClient import DEVICE_INFO as ROVER_DEVICE_INFO, DEVICE_ADDRESS as ROVER_DEVICE_ADDRESS, CHARGING_INFO, BATTERY_TYPE_INFO
+from .RoverHistoryClient import DAILY_HISTORY
+from .BatteryClient import CELL_VOLT_INFO, CELL_TEMP_INFO, BATTERY_INFO, DEVICE_INFO as BATTERY_DEVICE_INFO, DEVICE_ADDRESS as BATTERY_DEVICE_ADDRESS
+from .InverterClient import INVERTER_STATS, INVERTER_MODEL, SOLAR_CHARGING, INVERTER_LOAD
+
+# In-process simulated BLE backend, selected with [device] backend = simulator.
+# Same DeviceManager / Device interface as BLE.py, driven by a small event loop
+# instead of the GLib/D-Bus main loop: discovery, connect/disconnect, services
+# resolution, shunt notifications at a configurable rate and Modbus
+# request/response (CRC checked both ways) built from the clients' own register
+# maps. Latency, frame loss and link drops can be injected from the [simulator]
+# section, e.g. to load test main.py / example.py on any Linux box:
+#   notify_rate = 1          # shunt notifications per second
+#   latency = 0.02           # seconds added to every response/notification
+#   jitter = 0.01            # extra random delay, 0..jitter seconds
+#   loss = 0                 # probability a response/notification is lost
+#   disconnect_after = 0     # drop the link after X seconds connected (0 = never)
+#   discovery_time = 0.5     # seconds spent "scanning"
+#   seed =                   # random seed for repeatable runs
+
+DISCOVERY_TIME = 0.5 # (seconds)
+NOTIFY_OPERATION = 87
+SHUNT_FRAME_SIZE = 110
+BROADCAST_ID = 255
+CAPACITY_AH = 100
+
+def clamp(value, low, high):
+    return max(low, min(high, value))
+
+class EventLoop:
+    # single threaded scheduler, plays the part of the GLib main loop:
+    # every device callback runs on the thread that called run()
+    def __init__(self):
+        self._events = [] # heap of (due, seq, callback, args)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._running = False
+
+    def call_later(self, delay, callback, *args):
+        # safe to call from any thread (e.g. the clients' poll timers)
+        with self._cond:
+            heapq.heappush(self._events, (time.monotonic() + delay, next(self._seq), callback, args))
+            self._cond.notify()
+
+    def run(self):
+        self._running = True
+        while self._running:
+            with self._cond:
+                if not self._events:
+                    self._cond.wait()
+                    continue
+                delay = self._events[0][0] - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                _, _, callback, args = heapq.heappop(self._events)
+            try:
+                callback(*args)
+            except Exception as e:
+                logging.error(f"SimulatedBLE: exception in callback {callback.__name__}: {e}")
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+
+class BatteryState:
+    # slowly drifting readings behind every simulated register map
+    def __init__(self, rng):
+        self.rng = rng
+        self.current = -2.0
+        self.soc = 80.0
+        self.voltage = 13.2
+        self.temperature = 22.0
+        self.pv_voltage = 18.5
+        self.pv_current = 3.2
+        self.updated = time.monotonic()
+
+    def step(self):
+        now = time.monotonic()
+        elapsed, self.updated = now - self.updated, now
+        self.current = clamp(self.current + self.rng.gauss(0, 0.2), -30, 30)
+        self.soc = clamp(self.soc + self.current * elapsed / 36 / CAPACITY_AH, 0, 100)
+        self.voltage = clamp(12.0 + 1.4 * self.soc / 100 + self.current * 0.005, 10, 14.6)
+        self.temperature = clamp(self.temperature + self.rng.gauss(0, 0.05), -20, 60)
+        self.pv_voltage = clamp(self.pv_voltage + self.rng.gauss(0, 0.1), 0, 50)
+        self.pv_current = clamp(self.pv_current + self.rng.gauss(0, 0.05), 0, 40)
+        return self
+
+def register_map(device_type, device_id, state):
+    # register => (words, layout, values()) for the Modbus devices, matching the client sections
+    if device_type == 'RNG_CTRL':
+        return {
+            12: (8, ROVER_DEVICE_INFO, lambda: {'model': 'RNG-CTRL-RVR40'}),
+            26: (1, ROVER_DEVICE_ADDRESS, lambda: {'device_id': device_id}),
+            256: (34, CHARGING_INFO, lambda: {
+                'battery_percentage': round(state.soc), 'battery_voltage': state.voltage, 'battery_current': abs(state.current),
+                'battery_temperature': round(state.temperature), 'controller_temperature': round(state.temperature) + 5,
+                'load_status': 'on', 'load_voltage': state.voltage, 'load_current': 0.5, 'load_power': round(state.voltage * 0.5),
+                'pv_voltage': state.pv_voltage, 'pv_current': state.pv_current, 'pv_power': round(state.pv_voltage * state.pv_current),
+                'power_generation_today': 420, 'power_generation_total': 123456, 'charging_status': 'mppt'}),
+            57348: (1, BATTERY_TYPE_INFO, lambda: {'battery_type': 'lithium'}),
+        }
+    if device_type == 'RNG_CTRL_HIST':
+        return {register: (10, DAILY_HISTORY, lambda day=register - 61440: {
+            'daily_max_power': 300 + day * 10, 'daily_charge_ah': 40 + day, 'daily_power_generation': 500 + day * 20})
+            for register in range(61440, 61447)}
+    if device_type == 'RNG_BATT':
+        return {
+            5000: (17, CELL_VOLT_INFO, lambda: {'cell_count': 4, **{f'cell_voltage_{i}': round(state.voltage / 4, 1) for i in range(4)}}),
+            5017: (17, CELL_TEMP_INFO, lambda: {'sensor_count': 2, 'temperature_0': round(state.temperature, 1), 'temperature_1': round(state.temperature + 0.5, 1)}),
+            5042: (6, BATTERY_INFO, lambda: {'current': state.current, 'voltage': state.voltage,
+                                             'remaining_charge': state.soc * CAPACITY_AH / 100, 'capacity': CAPACITY_AH}),
+            5122: (8, BATTERY_DEVICE_INFO, lambda: {'model': 'RBT100LFP12S'}),
+            5223: (1, BATTERY_DEVICE_ADDRESS, lambda: {'device_id': device_id}),
+        }
+    if device_type == 'RNG_INVT':
+        return {
+            4000: (8, INVERTER_STATS, lambda: {'uei_voltage': 120.0, 'uei_current': 1.2, 'voltage': 120.0, 'load_current': 1,
+                                               'frequency': 60.0, 'temperature': state.temperature}),
+            4311: (8, INVERTER_MODEL, lambda: {'model': 'RIV4835CSH1S'}),
+            4329: (5, SOLAR_CHARGING, lambda: {'solar_voltage': state.pv_voltage, 'solar_current': state.pv_current,
+                                               'solar_power': round(state.pv_voltage * state.pv_current), 'solar_charging_state': 'mppt',
+                                               'solar_charging_power': round(state.pv_voltage * state.pv_current)}),
+            4410: (2, INVERTER_LOAD, lambda: {'load_power': 150, 'charging_current': 2.5}),
+            57348: (1, BATTERY_TYPE_INFO, lambda: {'battery_type': 'lithium'}),
+        }
+    raise ValueError(f"simulator: no register map for device type {device_type}")
+
+class ShuntPeripheral:
+    # RMTShunt300: pushes 110 byte notify frames, ignores writes
+    notifies = True
+
+    def __init__(self, state):
+        self.state = state
+
+    def next_frame(self):
+        state = self.state.step()
+        frame = SHUNT_INFO.encode({'charge_battery_voltage': state.voltage, 'starter_battery_voltage': 12.7,
+                                   'discharge_amps': state.current, 'state_of_charge': state.soc}, SHUNT_FRAME_SIZE)
+        frame[1] = NOTIFY_OPERATION
+        return bytes(frame)
+
+    def handle(self, request):
+        return None
+
+class ModbusPeripheral:
+    # BT-1/BT-2 module: answers read (3) and write single register (6) requests
+    notifies = False
+
+    def __init__(self, device_id, registers, state):
+        self.device_id = device_id
+        self.registers = registers
+        self.state = state
+        self.written = {}
+
+    def handle(self, request):
+        request = bytes(request)
+        if len(request) != 8 or crc16_modbus(request[:6]) != request[6:]:
+            logging.warning(f"SimulatedBLE: ignoring malformed request {request.hex()}")
+            return None
+        device_id, function = request[0], request[1]
+        if device_id not in (self.device_id, BROADCAST_ID):
+            return None
+        register = int.from_bytes(request[2:4], 'big')
+        value = int.from_bytes(request[4:6], 'big') # word count for reads
+        if function == 6:
+            self.written[register] = value
+            return request # write single register echoes the request
+        entry = self.registers.get(register) if function == 3 else None
+        if entry is None:
+            return self.__with_crc(bytes([device_id, function | 0x80, 0x02])) # illegal data address
+        words, layout, values = entry
+        self.state.step()
+        if value <= words:
+            frame = layout.encode(values(), max(layout.size, value * 2 + 5))[:value * 2 + 3]
+        else: # a read spanning several sections (ReadPlanner), unmapped registers read as 0
+            frame = bytearray(value * 2 + 3)
+            for start, (words, layout, values) in self.registers.items():
+                if register <= start < register + value:
+                    length = min(words, register + value - start) * 2
+                    offset = 3 + (start - register) * 2
+                    frame[offset:offset + length] = layout.encode(values(), max(layout.size, words * 2 + 5))[3:3 + length]
+        frame[0:3] = bytes([device_id, function, value * 2])
+        return self.__with_crc(bytes(frame))
+
+    def __with_crc(self, frame):
+        return frame + crc16_modbus(frame)
+
+class Simulation:
+    def __init__(self, device_type, mac_address, alias, device_id = BROADCAST_ID, notify_rate = 1, latency = 0.02,
+                 jitter = 0.01, loss = 0, disconnect_after = 0, discovery_time = DISCOVERY_TIME, seed = None):
+        self.device_type = device_type
+        self.mac_address = mac_address.upper()
+        self.alias = alias
+        self.notify_rate = notify_rate
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.disconnect_after = disconnect_after
+        self.discovery_time = discovery_time
+        self.rng = random.Random(seed)
+        self.state = BatteryState(self.rng)
+        if device_type == 'RNG_SHNT':
+            self.peripheral = ShuntPeripheral(self.state)
+        else:
+            self.peripheral = ModbusPeripheral(device_id, register_map(device_type, device_id, self.state), self.state)
+        self.frames_sent = 0
+        self.frames_lost = 0
+        self.disconnects = 0
+
+    @classmethod
+    def from_config(cls, config):
+        seed = config.get('simulator', 'seed', fallback='').strip()
+        return cls(device_type=config['device']['type'],
+                   mac_address=config['device']['mac_addr'],
+                   alias=config['device']['alias'],
+                   device_id=config['device'].getint('device_id', BROADCAST_ID),
+                   notify_rate=config.getfloat('simulator', 'notify_rate', fallback=1),
+                   latency=config.getfloat('simulator', 'latency', fallback=0.02),
+                   jitter=config.getfloat('simulator', 'jitter', fallback=0.01),
+                   loss=config.getfloat('simulator', 'loss', fallback=0),
+                   disconnect_after=config.getfloat('simulator', 'disconnect_after', fallback=0),
+                   discovery_time=config.getfloat('simulator', 'discovery_time', fallback=0.5),
+                   seed=int(seed) if seed else None)
+
+    def delay(self):
+        return self.latency + self.rng.uniform(0, self.jitter)
+
+    def deliver(self):
+        # False when this frame is "lost over the air"
+        if self.loss and self.rng.random() < self.loss:
+            self.frames_lost += 1
+            return False
+        self.frames_sent += 1
+        return True
+
+_simulations = {}
+_known = set() # MACs connected before in this process, see DeviceManager.known_devices
+_lock = threading.Lock()
+
+def get_simulation(config):
+    # one simulated device per MAC in the process, so its state survives reconnects
+    mac_address = config['device']['mac_addr'].upper()
+    with _lock:
+        if mac_address not in _simulations:
+            _simulations[mac_address] = Simulation.from_config(config)
+            logging.info(f"Simulating {config['device']['type']} => {mac_address}")
+        return _simulations[mac_address]
+
+class Advertisement:
+    def __init__(self, mac_address, alias):
+        self.mac_address = mac_address
+        self._alias = alias
+
+    def alias(self):
+        return self._alias
+
+class DeviceManager:
+    def __init__(self, adapter_name, mac_address = None, alias = None, simulation = None):
+        self.adapter_name = adapter_name
+        self.device_found = False
+        self.mac_address = mac_address
+        self.device_alias = alias
+        self.simulation = simulation
+        self.discovery_time = simulation.discovery_time if simulation else DISCOVERY_TIME
+        self.loop = EventLoop()
+        self.is_adapter_powered = True
+        logging.info("Adapter status - Powered: True (simulated)")
+
+    def discover(self, fast = False):
+        self.device_found = bool(self.discover_all({self.mac_address: self.device_alias}, fast))
+
+    def known_devices(self, devices):
+        # devices connected before in this process play the part of BlueZ's bonded devices
+        with _lock:
+            return {mac_address.upper() for mac_address in devices if mac_address.upper() in _known}
+
+    def discover_all(self, devices, fast = False):
+        # one scan for several devices, devices: {mac_address: alias}; returns the MACs found.
+        # fast: no scan when every device was connected before (see BLE.DeviceManager.discover_all)
+        started = time.monotonic()
+        known = self.known_devices(devices)
+        if fast and len(known) == len(devices):
+            logging.info("Known device(s) %s, connecting without discovery", ", ".join(sorted(known)))
+            return known
+        logging.info("Starting discovery...")
+        time.sleep(self.discovery_time)
+        found = known if fast else set()
+        for dev in self.devices():
+            for mac_address, alias in devices.items():
+                if dev.mac_address == mac_address.upper() or dev.alias() == alias:
+                    logging.info("Found matching device %s => [%s]", dev.alias(), dev.mac_address)
+                    found.add(mac_address.upper())
+        logging.info("Discovery: %s/%s device(s) found in %.2fs", len(found), len(devices), time.monotonic() - started)
+        return found
+
+    def devices(self):
+        # every simulated device in the process is "in range"
+        with _lock:
+            return [Advertisement(simulation.mac_address, simulation.alias) for simulation in _simulations.values()]
+
+    def run(self):
+        self.loop.run()
+
+    def stop(self):
+        self.loop.stop()
+
+class Device:
+    def __init__(self, mac_address, manager, on_resolved, on_data, on_connect_fail, notify_uuid, write_uuid, recorder=None):
+        self.mac_address = mac_address
+        self.manager = manager
+        self.simulation = _simulations.get(mac_address.upper()) # None => not in range
+        self.recorder = recorder
+        self.data_callback = on_data
+        self.resolved_callback = on_resolved
+        self.connect_fail_callback = on_connect_fail
+        self.notify_char_uuid = notify_uuid
+        self.write_char_uuid = write_uuid
+        self.connected = False
+        self._session = 0 # bumped on every (dis)connect, events of an older session are dropped
+
+    def alias(self):
+        return self.simulation.alias if self.simulation else None
+
+    def is_connected(self):
+        return self.connected
+
+    def connect(self):
+        if self.simulation is None:
+            self.manager.loop.call_later(0, self.connect_fail_callback, "Device not found")
+            return
+        self._session += 1
+        self.manager.loop.call_later(self.simulation.delay(), self.__connect_succeeded, self._session)
+
+    def disconnect(self):
+        if self.connected:
+            logging.info("Exit: Disconnecting device: %s [%s]", self.alias(), self.mac_address)
+            self.connected = False
+            self._session += 1
+            self.manager.loop.call_later(self.simulation.delay(), self.__disconnect_succeeded)
+
+    def characteristic_write_value(self, value):
+        if self.simulation is None: return
+        self.manager.loop.call_later(self.simulation.delay(), self.__write, bytes(value), self._session)
+
+    def __connect_succeeded(self, session):
+        if session != self._session: return
+        self.connected = True
+        with _lock:
+            _known.add(self.mac_address.upper())
+        logging.info("[%s] Connected" % (self.mac_address))
+        self.manager.loop.call_later(self.simulation.delay(), self.__services_resolved, session)
+        if self.simulation.disconnect_after:
+            self.manager.loop.call_later(self.simulation.disconnect_after, self.__link_lost, session)
+
+    def __services_resolved(self, session):
+        if session != self._session: return
+        logging.info("[%s] Resolved services" % (self.mac_address))
+        if self.simulation.peripheral.notifies:
+            logging.info("subscribed to notification {}".format(self.notify_char_uuid))
+            self.manager.loop.call_later(1 / self.simulation.notify_rate, self.__notify_tick, session)
+        self.resolved_callback()
+
+    def __notify_tick(self, session):
+        if session != self._session: return
+        self.manager.loop.call_later(1 / self.simulation.notify_rate, self.__notify_tick, session)
+        if self.simulation.deliver():
+            self.__value_updated(self.simulation.peripheral.next_frame())
+
+    def __write(self, request, session):
+        if session != self._session or not self.connected: return
+        response = self.simulation.peripheral.handle(request)
+        if response is not None and self.simulation.deliver():
+            self.manager.loop.call_later(self.simulation.delay(), self.__response, response, session)
+
+    def __response(self, response, session):
+        if session != self._session: return
+        self.__value_updated(response)
+
+    def __value_updated(self, value):
+        if self.recorder is not None:
+            self.recorder.record(self.mac_address, self.notify_char_uuid, value)
+        self.data_callback(value)
+
+    def __link_lost(self, session):
+        if session != self._session: return
+        self.connected = False
+        self._session += 1
+        self.simulation.disconnects += 1
+        logging.info("[%s] Disconnected" % (self.mac_address))
+        self.connect_fail_callback('Disconnected')
+
+    def __disconnect_succeeded(self):
+        logging.info("[%s] Disconnected" % (self.mac_address))
+        self.connect_fail_callback('Disconnected')
@@ -0,0 +1,283 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+
+# Runs one data sink (remote logging, MQTT, PVOutput) on its own thread behind
+# a bounded queue, so the BLE callback thread only enqueues and a slow or dead
+# endpoint can never stall notification handling.
+#
+# Overflow policies, used when the queue is full:
+#   drop_oldest     => discard the oldest queued frame (default)
+#   coalesce_latest => merge the new frame into the newest queued one, latest values win
+#   block           => wait for the worker to make room (back-pressure to the BLE thread)
+#
+# A sink returns False (or raises OSError: connection errors, timeouts) when its
+# endpoint is unreachable; any other exception, e.g. SinkRejected for an HTTP
+# 4xx reply or a KeyError in the sink, means the frame itself will never be
+# accepted: it is dropped and counted as rejected, never retried.
+# With a Spool, frames the sink fails to deliver (unreachable) go to disk
+# instead, and so does every frame after them until the spool is empty.
+# The worker retries every retry_interval seconds and then drains the spool at
+# drain_rate frames/s on top of the frames spooled behind it meanwhile (so it
+# empties even when the device sends faster than drain_rate), oldest first,
+# each with its original '__timestamp'.
+# A batching sink (RemoteBatcher) passed as batch is flushed on the worker thread
+# once its deadline() has passed, between frames or while the queue is empty.
+
+POLICY_DROP_OLDEST = 'drop_oldest'
+POLICY_COALESCE_LATEST = 'coalesce_latest'
+POLICY_BLOCK = 'block'
+POLICIES = (POLICY_DROP_OLDEST, POLICY_COALESCE_LATEST, POLICY_BLOCK)
+
+DEFAULT_QUEUE_SIZE = 100
+DEFAULT_DRAIN_RATE = 10 # (frames/s)
+DEFAULT_RETRY_INTERVAL = 30 # (seconds)
+TIMESTAMP_KEY = '__timestamp'
+
+class SinkRejected(Exception):
+    # raised by a sink for a frame the endpoint refused for good (e.g. HTTP 4xx)
+    pass
+
+def spool_settings(config, name):
+    # Spool and SinkWorker keyword arguments from [spool], {} when it is disabled
+    if not config.has_section('spool') or not config['spool'].getboolean('enabled', fallback=False):
+        return {}
+    section = config['spool']
+    from .Spool import Spool
+    device = config['device'].get('name', '') or config['device']['mac_addr'].replace(':', '')
+    spool = Spool(os.path.join(section.get('path', 'spool'), device, name),
+                  max_bytes=section.getint('max_bytes', fallback=64 * 1024 * 1024),
+                  fsync=section.getboolean('fsync', fallback=False))
+    return {'spool': spool,
+            'drain_rate': section.getfloat('drain_rate', fallback=DEFAULT_DRAIN_RATE),
+            'retry_interval': section.getfloat('retry_interval', fallback=DEFAULT_RETRY_INTERVAL)}
+
+def sink_settings(config, name):
+    # (queue_size, policy) from [sinks], `<name>_queue_size` / `<name>_overflow` override the defaults
+    if not config.has_section('sinks'):
+        return DEFAULT_QUEUE_SIZE, POLICY_DROP_OLDEST
+    section = config['sinks']
+    queue_size = section.getint(f"{name}_queue_size", fallback=section.getint('queue_size', fallback=DEFAULT_QUEUE_SIZE))
+    policy = (section.get(f"{name}_overflow", '').strip() or section.get('overflow', POLICY_DROP_OLDEST).strip() or POLICY_DROP_OLDEST)
+    if policy not in POLICIES:
+        raise ValueError(f"unknown overflow policy '{policy}' for sink {name}, expected one of {', '.join(POLICIES)}")
+    return queue_size, policy
+
+class SinkWorker:
+    def __init__(self, name, sink, queue_size = DEFAULT_QUEUE_SIZE, policy = POLICY_DROP_OLDEST, close = None,
+                 spool = None, drain_rate = DEFAULT_DRAIN_RATE, retry_interval = DEFAULT_RETRY_INTERVAL, batch = None):
+        # sink: callable(data), queue_size 0 calls it inline on the submitting thread
+        # close: optional callable run once the queue is drained by stop(), e.g. to flush a batch
+        # spool: optional Spool the sink falls back to while it fails
+        # batch: optional object with deadline() (time.monotonic() it is due, None when empty) and flush()
+        if policy not in POLICIES:
+            raise ValueError(f"unknown overflow policy '{policy}', expected one of {', '.join(POLICIES)}")
+        self.name = name
+        self.sink = sink
+        self.close = close
+        self.queue_size = queue_size
+        self.policy = policy
+        self.spool = spool
+        self.batch = batch
+        self.drain_rate = max(drain_rate, 0.1)
+        self.retry_interval = retry_interval
+        self.next_drain = 0 # time.monotonic() of the next spool drain
+        self.spooled_live = 0 # frames appended behind a pending spool since the last drain step
+        self.queue = deque()
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.busy = False
+        self.counters = {'submitted': 0, 'delivered': 0, 'failed': 0, 'rejected': 0, 'dropped': 0, 'coalesced': 0, 'blocked': 0, 'max_depth': 0}
+        self.thread = None
+        if spool is not None and queue_size <= 0:
+            raise ValueError(f"sink {name}: a spool needs queue_size > 0")
+        if queue_size > 0:
+            self.thread = threading.Thread(name=f"sink-{name}", target=self.__run, daemon=True)
+            self.thread.start()
+
+    def submit(self, data):
+        # called from the BLE thread, never waits on the sink unless policy is block
+        counters = self.counters
+        timestamp = time.time()
+        if self.thread is None:
+            counters['submitted'] += 1
+            self.__deliver(timestamp, data)
+            return self.__flush_due() # inline: a partial batch goes out with the next frame after its deadline
+        with self.condition:
+            if self.stopped:
+                counters['dropped'] += 1
+                return
+            counters['submitted'] += 1
+            queue = self.queue
+            if len(queue) >= self.queue_size:
+                if self.policy == POLICY_COALESCE_LATEST:
+                    merged = dict(queue[-1][1])
+                    merged.update(data)
+                    queue[-1] = (timestamp, merged)
+                    counters['coalesced'] += 1
+                    return
+                if self.policy == POLICY_BLOCK:
+                    counters['blocked'] += 1
+                    while len(queue) >= self.queue_size and not self.stopped:
+                        self.condition.wait()
+                    if self.stopped:
+                        counters['dropped'] += 1
+                        return
+                else:
+                    queue.popleft()
+                    counters['dropped'] += 1
+            queue.append((timestamp, data))
+            if len(queue) > counters['max_depth']:
+                counters['max_depth'] = len(queue)
+            self.condition.notify_all()
+
+    def __run(self):
+        while True:
+            with self.condition:
+                while not self.queue and not self.stopped:
+                    wait = self.__wait()
+                    if wait == 0:
+                        break
+                    self.condition.wait(wait)
+                if not self.queue:
+                    if self.stopped:
+                        return # stopped and drained, the spool keeps the rest for the next run
+                    item = None
+                else:
+                    item = self.queue.popleft()
+                    self.busy = True
+                    self.condition.notify_all() # room for a blocked submit()
+            if item is None:
+                self.__flush_due()
+                if self.__drain_wait() == 0:
+                    self.__drain()
+                continue
+            self.__deliver(*item)
+            self.__flush_due() # a busy queue never waits, the batch deadline is checked between frames too
+            with self.condition:
+                self.busy = False
+                self.condition.notify_all()
+
+    def __send(self, data):
+        # True when delivered, False when the sink is unreachable (spooled / retried), None when rejected (dropped)
+        try:
+            if self.sink(data) is not False:
+                self.counters['delivered'] += 1
+                return True
+        except OSError as e: # requests' connection errors and timeouts included
+            logging.error(f"sink {self.name} => {e}")
+        except Exception as e:
+            logging.error(f"sink {self.name} => rejected: {e!r}")
+            self.counters['rejected'] += 1
+            return None
+        self.counters['failed'] += 1
+        return False
+
+    def __deliver(self, timestamp, data):
+        spool = self.spool
+        if spool is not None and spool.pending():
+            self.spooled_live += 1
+            return spool.append(data, timestamp) # keep the order until the spool is drained
+        if self.__send(data) is False and spool is not None:
+            spool.append(data, timestamp)
+            self.next_drain = time.monotonic() + self.retry_interval
+            logging.warning(f"sink {self.name}: unreachable, spooling to {spool.path}")
+
+    def spool_samples(self, samples):
+        # [(timestamp, data), ...] a sink could not deliver after accepting them, e.g. a failed batch
+        if self.spool is None:
+            self.counters['dropped'] += len(samples)
+            return
+        for timestamp, data in samples:
+            self.spool.append(data, timestamp)
+        self.next_drain = time.monotonic() + self.retry_interval
+
+    def __flush_due(self):
+        batch = self.batch
+        if batch is None:
+            return
+        deadline = batch.deadline()
+        if deadline is not None and deadline <= time.monotonic():
+            try:
+                batch.flush()
+            except Exception as e:
+                logging.error(f"sink {self.name} flush => {e}")
+
+    def __wait(self):
+        # seconds until the batch deadline or the next drain step, whichever is first, None for neither
+        waits = [wait for wait in (self.__drain_wait(), self.__batch_wait()) if wait is not None]
+        return min(waits) if waits else None
+
+    def __batch_wait(self):
+        deadline = self.batch.deadline() if self.batch is not None else None
+        if deadline is None:
+            return None
+        return max(0, deadline - time.monotonic())
+
+    def __drain_wait(self):
+        # seconds until the next drain step, None without anything to drain
+        if self.spool is None or not self.spool.pending():
+            return None
+        return max(0, self.next_drain - time.monotonic())
+
+    def __drain(self):
+        # the frames that arrived since the last step go out with it, the backlog shrinks by drain_rate/s
+        live, self.spooled_live = self.spooled_live, 0
+        records = self.spool.read(max(1, int(self.drain_rate)) + live)
+        handled = 0
+        for record in records:
+            if record is not None:
+                timestamp, data = record
+                data.setdefault(TIMESTAMP_KEY, timestamp)
+                if self.__send(data) is False: # a rejected one is dropped, the drain goes on
+                    break
+            handled += 1
+        self.spool.commit(handled)
+        if handled < len(records):
+            self.next_drain = time.monotonic() + self.retry_interval
+        else:
+            self.next_drain = time.monotonic() + max(handled - live, 1) / self.drain_rate
+            if not self.spool.pending():
+                logging.info(f"sink {self.name}: spool drained")
+
+    def flush(self, timeout = None):
+        # wait until every queued frame has been handed to the sink, False on timeout
+        if self.thread is None:
+            return True
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.queue and not self.busy, timeout)
+
+    def stop(self, timeout = 5):
+        # deliver what is queued (up to timeout), then end the worker
+        if self.thread is None:
+            return self.__close()
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        self.thread.join(timeout)
+        with self.condition:
+            if self.queue:
+                self.counters['dropped'] += len(self.queue)
+                self.queue.clear()
+        self.__close()
+
+    def __close(self):
+        if self.close is not None:
+            try:
+                self.close()
+            except Exception as e:
+                logging.error(f"sink {self.name} close => {e}")
+            self.close = None
+        if self.spool is not None:
+            self.spool.close()
+
+    def depth(self):
+        return len(self.queue)
+
+    def stats(self):
+        stats = dict(self.counters, depth=len(self.queue), queue_size=self.queue_size, policy=self.policy)
+        if self.spool is not None:
+            stats['spool'] = self.spool.stats()
+        return stats
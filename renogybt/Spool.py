@@ -0,0 +1,181 @@
+import os
+import json
+import logging
+import threading
+
+# On-disk store-and-forward queue for a sink that is unreachable (see SinkWorker).
+# Samples are appended to segment files, one JSON line per sample:
+#   {"t": <unix time the sample was taken>, "d": {...sample...}}
+# A checkpoint file holds the read position (segment number and byte offset)
+# and is replaced atomically after every committed read, so a restart resumes
+# where draining stopped. Fully read segments are deleted; when the spool grows
+# past max_bytes the oldest segments are evicted, unread samples included.
+#
+#   spool/<name>/00000000000000000001.seg
+#   spool/<name>/checkpoint
+
+SEGMENT_SUFFIX = '.seg'
+CHECKPOINT = 'checkpoint'
+MIN_SEGMENT_BYTES = 64 * 1024
+
+class Spool:
+    def __init__(self, path, max_bytes = 64 * 1024 * 1024, segment_bytes = None, fsync = False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes or max(MIN_SEGMENT_BYTES, max_bytes // 8)
+        self.fsync = fsync
+        self.lock = threading.Lock()
+        self.encode = json.JSONEncoder(separators=(',', ':')).encode
+        self.counters = {'spooled': 0, 'drained': 0, 'evicted': 0}
+        os.makedirs(path, exist_ok=True)
+        self.segments = sorted(int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(path) if name.endswith(SEGMENT_SUFFIX))
+        self.read_segment, self.read_offset = self.__load_checkpoint()
+        self.segments = [seq for seq in self.segments if seq >= self.read_segment] # consumed before a crash
+        self.size = sum(os.path.getsize(self.__segment_path(seq)) for seq in self.segments)
+        self.file = None
+        if self.segments:
+            self.__repair_tail(self.segments[-1])
+        if self.pending():
+            logging.info(f"Spool {path}: {self.size} bytes pending from a previous run")
+
+    def __segment_path(self, seq):
+        return os.path.join(self.path, f"{seq:020d}{SEGMENT_SUFFIX}")
+
+    def __load_checkpoint(self):
+        try:
+            with open(os.path.join(self.path, CHECKPOINT)) as f:
+                seq, offset = f.read().split()
+                return int(seq), int(offset)
+        except (OSError, ValueError):
+            return (self.segments[0] if self.segments else 1), 0
+
+    def __save_checkpoint(self):
+        path = os.path.join(self.path, CHECKPOINT)
+        with open(path + '.tmp', 'w') as f:
+            f.write(f"{self.read_segment} {self.read_offset}\n")
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+
+    def __repair_tail(self, seq):
+        # drop a line torn by a crash mid-write
+        path = self.__segment_path(seq)
+        with open(path, 'rb+') as f:
+            data = f.read()
+            end = data.rfind(b'\n') + 1
+            if end != len(data):
+                f.truncate(end)
+                self.size -= len(data) - end
+                logging.warning(f"Spool {self.path}: dropped {len(data) - end} bytes of a partial record")
+
+    def pending(self):
+        if not self.segments:
+            return False
+        return len(self.segments) > 1 or self.segments[0] != self.read_segment or self.read_offset < self.size
+
+    def append(self, data, timestamp):
+        line = (self.encode({'t': timestamp, 'd': data}) + '\n').encode('utf-8')
+        with self.lock:
+            if self.file is None or self.file.tell() + len(line) > self.segment_bytes:
+                self.__rotate()
+            self.file.write(line)
+            self.file.flush()
+            if self.fsync:
+                os.fsync(self.file.fileno())
+            self.size += len(line)
+            self.counters['spooled'] += 1
+            while self.size > self.max_bytes and len(self.segments) > 1:
+                self.__evict_oldest()
+
+    def __rotate(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            seq = self.segments[-1] + 1
+        elif self.segments and os.path.getsize(self.__segment_path(self.segments[-1])) < self.segment_bytes:
+            seq = self.segments[-1] # reopen the last segment after a restart
+        else:
+            seq = (self.segments[-1] + 1) if self.segments else self.read_segment
+        if seq not in self.segments:
+            self.segments.append(seq)
+        self.file = open(self.__segment_path(seq), 'ab')
+
+    def __evict_oldest(self):
+        seq = self.segments.pop(0)
+        path = self.__segment_path(seq)
+        with open(path, 'rb') as f:
+            f.seek(self.read_offset if seq == self.read_segment else 0)
+            unread = f.read().count(b'\n')
+        self.size -= os.path.getsize(path)
+        os.remove(path)
+        self.counters['evicted'] += unread
+        logging.warning(f"Spool {self.path}: full, evicted {unread} oldest samples")
+        if seq == self.read_segment:
+            self.read_segment, self.read_offset = self.segments[0], 0
+            self.__save_checkpoint()
+
+    def read(self, max_records):
+        # [(timestamp, data), ...] from the read position, oldest first, None for a
+        # corrupt line; pass how many were handled to commit() to consume them
+        records = []
+        with self.lock:
+            for segment in self.segments:
+                if segment < self.read_segment:
+                    continue
+                with open(self.__segment_path(segment), 'rb') as f:
+                    f.seek(self.read_offset if segment == self.read_segment else 0)
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                            records.append((record['t'], record['d']))
+                        except (ValueError, KeyError, TypeError):
+                            logging.warning(f"Spool {self.path}: skipping a corrupt record")
+                            records.append(None)
+                        if len(records) >= max_records:
+                            return records
+        return records
+
+    def commit(self, count):
+        # consume `count` lines (as returned by read()) and persist the new position
+        with self.lock:
+            while count > 0 and self.segments:
+                path = self.__segment_path(self.read_segment)
+                with open(path, 'rb') as f:
+                    f.seek(self.read_offset)
+                    for line in f:
+                        self.read_offset += len(line)
+                        count -= 1
+                        self.counters['drained'] += 1
+                        if count == 0:
+                            break
+                if count > 0 or self.read_offset >= os.path.getsize(path):
+                    if self.read_segment == self.segments[-1]:
+                        break # the segment still being written
+                    self.segments.remove(self.read_segment)
+                    self.size -= os.path.getsize(path)
+                    os.remove(path)
+                    self.read_segment, self.read_offset = self.segments[0], 0
+            if not self.pending() and self.segments:
+                self.__reset()
+            self.__save_checkpoint()
+
+    def __reset(self):
+        # everything drained: start over with an empty segment
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        for seq in self.segments:
+            os.remove(self.__segment_path(seq))
+        self.read_segment, self.read_offset = self.segments[-1] + 1, 0
+        self.segments = []
+        self.size = 0
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def stats(self):
+        return dict(self.counters, bytes=self.size, segments=len(self.segments))
@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import configparser
+from .Backends import get_backend, backend_name, BACKEND_BLEAK
+from .DeviceEntry import DeviceInstance
+from .MQTTPublisher import MQTTPublisher
+
+# Runs several devices in one process: one adapter, one DeviceManager (one
+# GLib/D-Bus main loop, or the simulator loop), one MQTT connection. Devices
+# are listed as [device:<name>] sections, each overriding keys of [device]:
+#
+#   [device:shunt]
+#   mac_addr = 4C:E1:74:58:CE:5D
+#   alias = RTMShunt30032000454
+#   type = RNG_SHNT
+#   device_id = 255
+#   topic = solar/shunt # optional, defaults to <[mqtt] topic>/<name>
+#
+# Every device keeps its own client, limiter/deadband state and DataLogger; a
+# failing or disconnected device is retried on its own while the others run.
+# With [device] backend = bleak all devices run as tasks on one asyncio loop.
+
+DEVICE_SECTION_PREFIX = 'device:'
+
+def device_configs(config):
+    # name => full ConfigParser per [device:<name>] section
+    shared = {section: {key: config.get(section, key, raw=True) for key in config[section]}
+              for section in config.sections() if not section.startswith(DEVICE_SECTION_PREFIX)}
+    configs = {}
+    for section in config.sections():
+        if not section.startswith(DEVICE_SECTION_PREFIX):
+            continue
+        name = section[len(DEVICE_SECTION_PREFIX):].strip()
+        device_config = configparser.ConfigParser(inline_comment_prefixes=('#'), interpolation=None)
+        device_config.read_dict(shared)
+        for key in config[section]:
+            if key == 'topic':
+                device_config['mqtt']['topic'] = config.get(section, key, raw=True)
+            else:
+                device_config['device'][key] = config.get(section, key, raw=True)
+        if 'topic' not in config[section]:
+            device_config['mqtt']['topic'] = f"{shared['mqtt']['topic']}/{name}"
+        device_config['device']['name'] = name
+        configs[name] = device_config
+    return configs
+
+class Supervisor:
+    def __init__(self, config):
+        self.config = config
+        self.device_configs = device_configs(config)
+        self.instances = {} # name => DeviceInstance
+        self.manager = None
+
+    def run(self):
+        # blocks in the shared main loop until stop()
+        if not self.device_configs:
+            logging.error("Supervisor: no [device:<name>] sections in the config")
+            return
+        if backend_name(self.config) == BACKEND_BLEAK:
+            return self.__run_asyncio()
+        configs = {}
+        for name, device_config in self.device_configs.items():
+            try:
+                DeviceManager, _ = get_backend(device_config) # the backend is shared, [device] backend
+                configs[name] = device_config
+            except Exception as e:
+                logging.error(f"Supervisor: skipping {name}: {e}")
+        if not configs:
+            return
+        self.manager = DeviceManager(adapter_name=self.config['device']['adapter'])
+
+        found = self.manager.discover_all({c['device']['mac_addr']: c['device']['alias'] for c in configs.values()},
+                                          fast=self.config['device'].getboolean('fast_connect', fallback=True))
+        for name, device_config in configs.items():
+            if device_config['device']['mac_addr'].upper() not in found:
+                logging.warning(f"Supervisor: {name} => {device_config['device']['mac_addr']} not found during discovery, connecting anyway")
+            try:
+                instance = DeviceInstance(device_config)
+                if instance.start(self.manager):
+                    self.instances[name] = instance
+                    logging.info(f"Supervisor: started {name} ({device_config['device']['type']})")
+            except Exception as e:
+                logging.error(f"Supervisor: could not start {name}: {e}")
+
+        logging.info(f"Supervisor: {len(self.instances)}/{len(self.device_configs)} devices running")
+        try:
+            self.manager.run()
+        except KeyboardInterrupt:
+            logging.info("Supervisor: KeyboardInterrupt")
+            self.stop()
+
+    def __run_asyncio(self):
+        for name, device_config in self.device_configs.items():
+            self.instances[name] = DeviceInstance(device_config)
+        logging.info(f"Supervisor: {len(self.instances)} devices on one asyncio loop")
+        try:
+            asyncio.run(self.__gather())
+        except KeyboardInterrupt:
+            logging.info("Supervisor: KeyboardInterrupt")
+            self.stop()
+
+    async def __gather(self):
+        names = list(self.instances)
+        results = await asyncio.gather(*(self.instances[name].run_async() for name in names), return_exceptions=True)
+        for name, result in zip(names, results):
+            if isinstance(result, Exception):
+                logging.error(f"Supervisor: {name} stopped: {result}")
+
+    def stop(self):
+        for name, instance in self.instances.items():
+            try:
+                instance.stop()
+            except Exception as e:
+                logging.error(f"Supervisor: error stopping {name}: {e}")
+        self.instances = {}
+        if self.manager:
+            self.manager.stop()
+        MQTTPublisher.reset()
@@ -33,12 +33,22 @@ def parse_temperature(raw_value, unit):
 def format_temperature(celcius, unit = 'F'):
     return (celcius * 9/5) + 32 if unit.strip() == 'F' else celcius
 
+def parse_fields(fields_str):
+    return [x.strip() for x in fields_str.split(',')] if len(fields_str) > 0 else [] # trim spaces
+
 def filter_fields(data, fields_str):
     fields = [x.strip() for x in fields_str.split(',')] if len(fields_str) > 0 else [] # trim spaces
     if len(fields) > 0 and set(fields).issubset(data):
         return {key: data[key] for key in fields}
     return data
 
+def project_fields(data, fields):
+    # filter_fields with the fields parsed once (parse_fields), always a new dict:
+    # the shunt client decodes every frame into the same record
+    if len(fields) > 0 and all(key in data for key in fields):
+        return {key: data[key] for key in fields}
+    return dict(data)
+
 CRC16_LOW_BYTES = (
     0x00, 0xC0, 0xC1, 0x01, 0xC3, 0x03, 0x02, 0xC2, 0xC6, 0x06, 0x07, 0xC7, 0x05, 0xC5, 0xC4, 0x04,
     0xCC, 0x0C, 0x0D, 0xCD, 0x0F, 0xCF, 0xCE, 0x0E, 0x0A, 0xCA, 0xCB, 0x0B, 0xC9, 0x09, 0x08, 0xC8,
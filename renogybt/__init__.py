@@ -4,5 +4,7 @@ from .DataLogger import DataLogger
 from .BatteryClient import BatteryClient
 from .RoverHistoryClient import RoverHistoryClient
 from .InverterClient import InverterClient
-from .NotifyMessageLimiter import RateLimiter
+from .NotifyMessageLimiter import RateLimiter, AggregatingRateLimiter
+from .Deadband import DeadbandFilter
+from .SinkWorker import SinkWorker
 from .Utils import *
@@ -0,0 +1,41 @@
+import os
+import sys
+import logging
+import argparse
+import configparser
+from renogybt.Replay import replay
+
+# Feeds frames recorded with [recorder] enabled = true back through the client
+# and the DeviceInstance pipeline, no Bluetooth adapter needed.
+#   python3 replay.py config.ini frames.bin              # as fast as possible
+#   python3 replay.py config.ini frames.bin --speed 1    # real time
+#   python3 replay.py config.ini frames.bin --speed 10   # 10x
+# Sinks enabled in the config (mqtt, remote_logging, pvoutput) receive the data.
+
+logging.basicConfig(level=logging.INFO)
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded Renogy BLE frames")
+    parser.add_argument('config', help="config file, e.g. config.ini")
+    parser.add_argument('frames', help="recording path ([recorder] path), rotated files are included")
+    parser.add_argument('--speed', type=float, default=0, help="1 = real time, N = N times faster, 0 = as fast as possible (default)")
+    parser.add_argument('--mac', default=None, help="only replay frames from this device (default: all frames in the recording)")
+    args = parser.parse_args()
+
+    config = configparser.ConfigParser(inline_comment_prefixes=('#'))
+    config_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), args.config)
+    if not config.read(config_path):
+        logging.error(f"Config file not found: {config_path}")
+        sys.exit(1)
+
+    try:
+        stats = replay(config, args.frames, speed=args.speed, mac_address=args.mac)
+    except KeyboardInterrupt:
+        logging.info("Exiting...")
+        return
+    print(f"{stats['frames']} frames in {stats['seconds']:.3f}s => {stats['frames_per_second']:.0f} frames/s")
+    if stats['client']:
+        print(f"{stats['client']['duplicates']} duplicate frames not parsed (skip ratio {stats['client']['skip_ratio']:.1%})")
+
+if __name__ == "__main__":
+    main()
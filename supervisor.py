@@ -0,0 +1,28 @@
+import os
+import sys
+import logging
+import configparser
+from renogybt.Supervisor import Supervisor
+
+# Runs every [device:<name>] section of the config in this one process, sharing
+# the Bluetooth adapter, its main loop and the MQTT connection.
+#   python3 supervisor.py config.ini
+
+logging.basicConfig(level=logging.INFO)
+
+def main():
+    config_file = sys.argv[1] if len(sys.argv) > 1 else 'config.ini'
+    config_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), config_file)
+    config = configparser.ConfigParser(inline_comment_prefixes=('#'))
+    if not config.read(config_path):
+        logging.error(f"Config file not found: {config_path}")
+        sys.exit(1)
+    supervisor = Supervisor(config)
+    try:
+        supervisor.run()
+    except KeyboardInterrupt:
+        logging.info("Exiting...")
+    supervisor.stop()
+
+if __name__ == "__main__":
+    main()